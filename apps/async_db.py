@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.database_configuration import db_settings
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pool de threads borné réservé aux appels bloquants vers la base de données.
+# Sa taille limite le nombre de requêtes SQL simultanées par worker, sans
+# jamais bloquer la boucle asyncio d'uvicorn.
+db_executor = ThreadPoolExecutor(
+    max_workers=db_settings.db_executor_workers,
+    thread_name_prefix="db"
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """Exécute une fonction d'accès aux données dans le pool de threads dédié"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_periodically(interval: float, func, *args, **kwargs):
+    """Exécute une fonction d'accès aux données à intervalle régulier (tâche de fond)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_db(func, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Erreur dans la tâche périodique {getattr(func, '__name__', func)}: {e}")
+
+
+def shutdown_db_executor():
+    """Arrête le pool de threads (appelé à l'arrêt de l'application)"""
+    db_executor.shutdown(wait=True)
+    logger.info("Pool de threads base de données arrêté")
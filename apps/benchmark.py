@@ -0,0 +1,878 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks de l'API (à lancer contre une base de test).
+
+Usage :
+    python -m apps.benchmark ingest --frames 200
+    python -m apps.benchmark health-latency --requests 300 --max-ratio 5 --max-p99-ms 50
+    python -m apps.benchmark copy --rows 100000
+    python -m apps.benchmark explain --rows 10000000
+    python -m apps.benchmark live-state --requests 500
+    python -m apps.benchmark ws-ingest --frames 500
+    python -m apps.benchmark frame-parse --iterations 20000
+    python -m apps.benchmark columnar --days 30
+    python -m apps.benchmark conditional --requests 50
+    python -m apps.benchmark query-cache --days 30
+    python -m apps.benchmark workers-ingest --workers 1 2 4 --frames 2000
+    python -m apps.benchmark command-wait --changes 50
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Configuration du logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+BENCH_SENSOR_PREFIX = "bench_sensor"
+# Les capteurs d'une trame /values sont les champs commençant par "sensor"
+FRAME_SENSOR_PREFIX = "sensor_bench"
+
+
+def _make_frame(sensor_count, date_serveur):
+    """Construit les lignes d'une trame ESP32 synthétique"""
+    return [
+        {
+            'sensor': f"{BENCH_SENSOR_PREFIX}{index}",
+            'temperature': 37.5 + index * 0.01,
+            'humidity': 45.0 + index * 0.01,
+            'average_temperature': 37.5,
+            'average_humidity': 45.0,
+            'fan_status': "ON",
+            'humidifier_status': "OFF",
+            'numfailedsensors': 0,
+            'date_serveur': date_serveur
+        }
+        for index in range(1, sensor_count + 1)
+    ]
+
+
+def _cleanup_bench_rows(prefix=BENCH_SENSOR_PREFIX):
+    """Supprime les lignes insérées par les benchmarks"""
+    from apps.database_configuration import db_manager, DataTempModel
+
+    with db_manager.get_session_context() as session:
+        session.query(DataTempModel).filter(
+            DataTempModel.sensor.like(f"{prefix}%")
+        ).delete(synchronize_session=False)
+
+
+def bench_ingest(frames, sensor_counts):
+    """Compare l'insertion ligne par ligne (add_data) et par trame (add_data_batch)"""
+    from apps import post_temp_humidity
+
+    def per_row(rows):
+        return all(post_temp_humidity.add_data(row) for row in rows)
+
+    strategies = [
+        ("add_data (1 transaction / capteur)", per_row),
+        ("add_data_batch (1 transaction / trame)", post_temp_humidity.add_data_batch),
+    ]
+
+    logging.getLogger("apps.post_temp_humidity").setLevel(logging.WARNING)
+    print(f"{'capteurs':>8}  {'stratégie':<42} {'trames/s':>10}")
+    try:
+        for sensor_count in sensor_counts:
+            for label, insert_frame in strategies:
+                start = time.perf_counter()
+                for _ in range(frames):
+                    rows = _make_frame(sensor_count, datetime.datetime.now())
+                    if not insert_frame(rows):
+                        raise RuntimeError(f"Échec de l'insertion ({label})")
+                elapsed = time.perf_counter() - start
+                print(f"{sensor_count:>8}  {label:<42} {frames / elapsed:>10.1f}")
+    finally:
+        _cleanup_bench_rows()
+
+
+def _percentile(values, percent):
+    """Percentile simple (méthode du rang le plus proche)"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _start_server(port):
+    """Démarre l'application run:app dans un thread et attend qu'elle soit prête"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config("run:app", host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def bench_health_latency(requests_count, loaders, port, api_key, date_int, date_end, max_ratio, max_p99_ms):
+    """Latence de /health au repos puis pendant des requêtes /alldata longues.
+
+    Échoue (code de sortie 1) si le p99 sous charge dépasse à la fois
+    max_ratio fois le p99 au repos et le seuil absolu max_p99_ms.
+    """
+    base_url = f"http://127.0.0.1:{port}"
+
+    def get(path, headers=None):
+        request = urllib.request.Request(f"{base_url}{path}", headers=headers or {})
+        with urllib.request.urlopen(request, timeout=120) as response:
+            return response.read()
+
+    def measure_health():
+        latencies = []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            get("/health")
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    server, thread = _start_server(port)
+    stop = threading.Event()
+    alldata_calls = []
+
+    def load_alldata():
+        while not stop.is_set():
+            start = time.perf_counter()
+            get(f"/alldata?date_int={date_int}&date_end={date_end}", {"X-API-KEY": api_key})
+            alldata_calls.append(time.perf_counter() - start)
+
+    try:
+        idle = measure_health()
+
+        workers = [threading.Thread(target=load_alldata, daemon=True) for _ in range(loaders)]
+        for worker in workers:
+            worker.start()
+        loaded = measure_health()
+        stop.set()
+        for worker in workers:
+            worker.join()
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    print(f"{'scénario':<28} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print(f"{'/health au repos':<28} {_percentile(idle, 50):>10.2f} {_percentile(idle, 99):>10.2f}")
+    print(f"{'/health pendant /alldata':<28} {_percentile(loaded, 50):>10.2f} {_percentile(loaded, 99):>10.2f}")
+    if alldata_calls:
+        print(f"/alldata: {len(alldata_calls)} appels, durée moyenne {sum(alldata_calls) / len(alldata_calls):.2f}s")
+
+    # Le seuil absolu évite un échec quand le p99 au repos ne fait que quelques millisecondes
+    limit = max(max_ratio * _percentile(idle, 99), max_p99_ms)
+    ok = _percentile(loaded, 99) <= limit
+    print(f"{'OK ' if ok else 'ÉCHEC'} p99 sous charge {_percentile(loaded, 99):.2f} ms, limite {limit:.2f} ms "
+          f"(max({max_ratio:g} x p99 au repos, {max_p99_ms:g} ms))")
+    if not ok:
+        sys.exit(1)
+
+
+def bench_copy(rows_count, chunk_size):
+    """Compare le chargement COPY et l'insertion ORM (add_data_batch par blocs)"""
+    from apps import bulk_loader, post_temp_humidity
+
+    start_date = datetime.datetime(2020, 1, 1)
+
+    def records():
+        for index in range(rows_count):
+            yield {
+                'sensor': f"{BENCH_SENSOR_PREFIX}{index % 8 + 1}",
+                'temperature': 37.5,
+                'humidity': 45.0,
+                'date_serveur': start_date + datetime.timedelta(seconds=10 * index),
+                'average_temperature': 37.5,
+                'average_humidity': 45.0,
+                'fan_status': "ON",
+                'humidifier_status': "OFF",
+                'numfailedsensors': 0
+            }
+
+    def orm_load():
+        batch = []
+        for record in records():
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                post_temp_humidity.add_data_batch(batch)
+                batch = []
+        if batch:
+            post_temp_humidity.add_data_batch(batch)
+
+    def copy_load():
+        bulk_loader.copy_records(
+            ({**record, 'date_serveur': record['date_serveur'].isoformat()} for record in records()),
+            chunk_size=chunk_size
+        )
+
+    logging.getLogger("apps.post_temp_humidity").setLevel(logging.WARNING)
+    logging.getLogger("apps.bulk_loader").setLevel(logging.WARNING)
+    print(f"{'chemin':<36} {'lignes/s':>12}")
+    try:
+        for label, load in (("ORM (add_data_batch)", orm_load), ("COPY FROM STDIN", copy_load)):
+            start = time.perf_counter()
+            load()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<36} {rows_count / elapsed:>12.0f}")
+            _cleanup_bench_rows()
+    finally:
+        _cleanup_bench_rows()
+
+
+def _plan_nodes(plan):
+    """Liste à plat des nœuds d'un plan EXPLAIN (FORMAT JSON)"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def bench_explain(rows_count, keep):
+    """Vérifie avec EXPLAIN que les requêtes par plage utilisent les index attendus.
+
+    Une copie de data_temp (mêmes index), data_temp_minute et data_temp_hour est
+    créée dans le schéma explain_bench puis remplie avec des relevés
+    synthétiques. Les requêtes vérifiées sont celles construites par les
+    fonctions de post_temp_humidity, exécutées avec search_path sur ce schéma.
+    """
+    from sqlalchemy import MetaData, text
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Session
+    from apps import post_temp_humidity
+    from apps.database_configuration import (
+        db_manager, DataTempModel, DataTempMinuteModel, DataTempHourModel, ROLLUP_UPSERT_SQL, ROLLUP_TABLES
+    )
+
+    schema = "explain_bench"
+    metadata = MetaData()
+    raw = DataTempModel.__table__.to_metadata(metadata, schema=schema)
+    for model in (DataTempMinuteModel, DataTempHourModel):
+        model.__table__.to_metadata(metadata, schema=schema)
+    end = datetime.datetime(2025, 1, 1)
+    # 4 capteurs, un relevé toutes les 10 secondes chacun
+    start = end - datetime.timedelta(seconds=10 * rows_count // 4)
+    day = datetime.timedelta(days=1)
+
+    # Construction des requêtes seulement : la session n'est liée à aucune base
+    session = Session()
+    checks = [
+        (
+            "Plage de 7 jours sur data_temp",
+            "ix_data_temp_date_serveur_brin",
+            raw.select().with_only_columns(raw.c.temperature).where(
+                raw.c.date_serveur >= end - datetime.timedelta(days=7)
+            )
+        ),
+        (
+            "/alldata minute sur une journée (_all_data_query)",
+            "data_temp_minute_pkey",
+            post_temp_humidity._all_data_query(session, end - day, end, 'minute').statement
+        ),
+        (
+            "/alldata heure sur 30 jours (_all_data_query)",
+            "data_temp_hour_pkey",
+            post_temp_humidity._all_data_query(session, end - 30 * day, end, 'hour').statement
+        ),
+        (
+            "/datatable?since= (data_table_changes_query)",
+            "ix_data_temp_minute_updated_at",
+            post_temp_humidity.data_table_changes_query(session, end - datetime.timedelta(hours=1)).statement
+        ),
+        (
+            "/datatable fenêtre d'une heure (data_table_query)",
+            "data_temp_minute_pkey",
+            post_temp_humidity.data_table_query(session).filter(
+                DataTempMinuteModel.bucket >= end - datetime.timedelta(hours=1),
+                DataTempMinuteModel.bucket < end
+            ).statement
+        ),
+        (
+            "Moyennes horaires du jour (data_average_query)",
+            "data_temp_hour_pkey",
+            post_temp_humidity.data_average_query(session, end - day).statement
+        ),
+        (
+            "/readings page suivante (readings_query)",
+            "data_temp_pkey",
+            post_temp_humidity.readings_query(session, after_id=rows_count - 5000, limit=1001).statement
+        ),
+    ]
+
+    with db_manager.engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        metadata.create_all(conn)
+        print(f"Génération de {rows_count} lignes synthétiques...", flush=True)
+        conn.execute(text(f"""
+            INSERT INTO {schema}.data_temp (sensor, temperature, humidity, date_serveur,
+                average_temperature, average_humidity, fan_status, humidifier_status, numfailedsensors)
+            SELECT 'sensor' || (g % 4 + 1), 37 + random(), 45 + random() * 10,
+                   :start + (g / 4) * interval '10 seconds', 37.5, 50, true, false, 0
+            FROM generate_series(0, :rows - 1) AS g
+        """), {"start": start, "rows": rows_count})
+        for table, unit in ROLLUP_TABLES.items():
+            conn.execute(text(ROLLUP_UPSERT_SQL.format(
+                table=f"{schema}.{table}", unit=unit, source=f"{schema}.data_temp"
+            )))
+        # updated_at comme en production : écrit au fil de l'eau, peu après chaque minute
+        conn.execute(text(f"UPDATE {schema}.data_temp_minute SET updated_at = bucket + interval '1 minute'"))
+        for table in ("data_temp", *ROLLUP_TABLES):
+            conn.execute(text(f"ANALYZE {schema}.{table}"))
+
+    failures = 0
+    try:
+        with db_manager.engine.connect() as conn:
+            # Tables non qualifiées des requêtes de l'application : résolues dans le schéma de test
+            conn.execute(text(f"SET search_path TO {schema}"))
+            for label, index_name, query in checks:
+                sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                used = {node.get("Index Name") for node in _plan_nodes(plan[0]["Plan"])}
+                ok = index_name in used
+                failures += not ok
+                print(f"{'OK ' if ok else 'ÉCHEC'} {label:<52} attendu={index_name} utilisés={sorted(filter(None, used))}")
+            conn.rollback()
+    finally:
+        session.close()
+        if not keep:
+            with db_manager.engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+    if failures:
+        sys.exit(1)
+
+
+def bench_live_state(requests_count, port, api_key):
+    """Latence de /getdata et /WeatherData servis depuis l'état en mémoire,
+    comparée aux requêtes SQL qu'ils remplaçaient"""
+    from apps import post_temp_humidity
+    from apps.live_state import live_state
+
+    def timed(func):
+        latencies = []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            func()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def get(path):
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers={"X-API-KEY": api_key})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+
+    server, thread = _start_server(port)
+    try:
+        while not live_state.loaded:
+            time.sleep(0.05)
+        results = [
+            ("get_last_data (SQL)", timed(post_temp_humidity.get_last_data)),
+            ("live_state.last_data", timed(live_state.last_data)),
+            ("get_weather_data (SQL)", timed(post_temp_humidity.get_weather_data)),
+            ("live_state.weather_data", timed(live_state.weather_data)),
+            ("HTTP /getdata", timed(lambda: get("/getdata"))),
+            ("HTTP /WeatherData", timed(lambda: get("/WeatherData"))),
+        ]
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    print(f"{'appel':<28} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for label, latencies in results:
+        print(f"{label:<28} {_percentile(latencies, 50):>10.3f} {_percentile(latencies, 99):>10.3f}")
+
+
+def _make_payload(sensor_count, seq=None):
+    """Construit le corps JSON d'une trame ESP32 (format de /values)"""
+    payload = {
+        'average_temperature': 37.5,
+        'average_humidity': 45.0,
+        'fan_status': "ON",
+        'humidifier_status': "OFF",
+        'numFailedSensors': 0
+    }
+    for index in range(1, sensor_count + 1):
+        payload[f"{FRAME_SENSOR_PREFIX}{index}"] = {'temperature': 37.5, 'humidity': 45.0}
+    if seq is not None:
+        payload['seq'] = seq
+    return payload
+
+
+def bench_ws_ingest(frames, sensor_count, port, api_key):
+    """Compare l'envoi des trames par POST /values (une connexion par trame,
+    comme l'ESP32 aujourd'hui) et par la connexion persistante /ws/values"""
+    from websockets.sync.client import connect
+
+    def post_frames():
+        latencies = []
+        body = json.dumps(_make_payload(sensor_count)).encode()
+        for _ in range(frames):
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/values", data=body, method="POST",
+                headers={"X-API-KEY": api_key, "Content-Type": "application/json"}
+            )
+            start = time.perf_counter()
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def ws_frames():
+        latencies = []
+        with connect(f"ws://127.0.0.1:{port}/ws/values", additional_headers={"X-API-KEY": api_key}) as websocket:
+            for seq in range(frames):
+                start = time.perf_counter()
+                websocket.send(json.dumps(_make_payload(sensor_count, seq)))
+                ack = json.loads(websocket.recv())
+                if ack["seq"] != seq or ack["status"] != "accepted":
+                    raise RuntimeError(f"Acquittement inattendu: {ack}")
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    server, thread = _start_server(port)
+    try:
+        results = []
+        for label, send in (("POST /values", post_frames), ("WebSocket /ws/values", ws_frames)):
+            start = time.perf_counter()
+            latencies = send()
+            results.append((label, frames / (time.perf_counter() - start), latencies))
+    finally:
+        server.should_exit = True
+        thread.join()
+        _cleanup_bench_rows(FRAME_SENSOR_PREFIX)
+
+    print(f"{'canal':<24} {'trames/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for label, rate, latencies in results:
+        print(f"{label:<24} {rate:>10.1f} {_percentile(latencies, 50):>10.2f} {_percentile(latencies, 99):>10.2f}")
+
+
+def bench_frame_parse(iterations, sensor_counts):
+    """Coût du décodage et de la validation d'une trame : JSON ou binaire compact"""
+    from apps.binary_frame import decode_frame, encode_frame
+    from apps.sensor_frame import parse_frame
+
+    def payload(sensor_count):
+        data = {
+            'average_temperature': 37.5,
+            'average_humidity': 45.0,
+            'fan_status': "ON",
+            'humidifier_status': "OFF",
+            'numFailedSensors': 0
+        }
+        for index in range(1, sensor_count + 1):
+            data[f"sensor{index}"] = {'temperature': 37.5 + index * 0.01, 'humidity': 45.0 + index * 0.01}
+        return data
+
+    print(f"{'capteurs':>8}  {'format':<8} {'octets':>8} {'µs/trame':>10}")
+    for sensor_count in sensor_counts:
+        data = payload(sensor_count)
+        formats = [
+            ("json", json.dumps(data).encode(), lambda body: parse_frame(json.loads(body))),
+            ("binaire", encode_frame(data), lambda body: parse_frame(decode_frame(body))),
+        ]
+        reference = formats[0][2](formats[0][1])
+        for label, body, parse in formats:
+            rows = parse(body)
+            # Les deux formats doivent produire les mêmes lignes (hors horodatage)
+            if [dict(row, date_serveur=None) for row in rows] != [dict(row, date_serveur=None) for row in reference]:
+                raise RuntimeError(f"Lignes différentes pour le format {label}")
+            start = time.perf_counter()
+            for _ in range(iterations):
+                parse(body)
+            elapsed = time.perf_counter() - start
+            print(f"{sensor_count:>8}  {label:<8} {len(body):>8} {elapsed / iterations * 1e6:>10.2f}")
+
+
+def bench_columnar(days, repeat):
+    """Taille et coût de sérialisation de /alldata : lignes JSON ou colonnes"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from apps import post_temp_humidity
+
+    date_end = datetime.datetime.now()
+    date_ini = date_end - datetime.timedelta(days=days)
+
+    def rows_body():
+        # Chemin de FastAPI pour une liste de dicts renvoyée par l'endpoint
+        return JSONResponse(content=jsonable_encoder(rows)).body
+
+    def columns_body():
+        return JSONResponse(content=columns).body
+
+    start = time.perf_counter()
+    rows = post_temp_humidity.get_all_data(date_ini, date_end)
+    rows_query = time.perf_counter() - start
+    start = time.perf_counter()
+    columns = post_temp_humidity.get_all_data(date_ini, date_end, True)
+    columns_query = time.perf_counter() - start
+    if len(rows) != len(columns['date']):
+        raise RuntimeError("Nombre de lignes différent entre les deux formats")
+
+    print(f"/alldata sur {days} jours : {len(rows)} lignes")
+    print(f"{'format':<10} {'octets':>12} {'requête (ms)':>14} {'sérialisation (ms)':>20}")
+    for label, query_time, serialize in (("json", rows_query, rows_body), ("columnar", columns_query, columns_body)):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = serialize()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{label:<10} {len(body):>12} {query_time * 1000:>14.0f} {_percentile(timings, 50):>20.0f}")
+
+
+def bench_conditional(requests_count, days, port, api_key):
+    """Latence des endpoints de lecture sans et avec If-None-Match (304), puis
+    vérifie qu'une nouvelle trame invalide l'ETag"""
+    from apps import post_temp_humidity
+
+    date_end = datetime.date.today()
+    date_int = date_end - datetime.timedelta(days=days)
+    paths = [
+        f"/alldata?date_int={date_int}&date_end={date_end}&format=columnar",
+        "/WeatherDF",
+        "/WeatherData",
+        "/api/parameter",
+    ]
+
+    def get(path, etag=None):
+        headers = {"X-API-KEY": api_key}
+        if etag:
+            headers["If-None-Match"] = etag
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.headers.get("ETag"), len(response.read())
+        except urllib.error.HTTPError as e:
+            # urllib signale le 304 comme une erreur
+            return e.code, e.headers.get("ETag"), 0
+
+    def timed(path, etag=None):
+        latencies = []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            code, _, _ = get(path, etag)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return code, latencies
+
+    from apps.live_state import live_state
+
+    server, thread = _start_server(port)
+    try:
+        # La connexion de l'écouteur NOTIFY change la version : mesurer après
+        while not live_state.loaded:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        print(f"{'endpoint':<22} {'octets':>10} {'200 p50 (ms)':>13} {'304 p50 (ms)':>13}")
+        for path in paths:
+            _, etag, size = get(path)
+            _, full = timed(path)
+            code, conditional = timed(path, etag)
+            assert code == 304, f"{path} : {code} au lieu de 304"
+            print(f"{path.split('?')[0]:<22} {size:>10} {_percentile(full, 50):>13.2f} "
+                  f"{_percentile(conditional, 50):>13.2f}")
+
+        # Une trame insérée doit changer l'ETag des données (mais pas celui des paramètres)
+        etags = {path: get(path)[1] for path in paths}
+        post_temp_humidity.add_data_batch(_make_frame(1, datetime.datetime.now()))
+        for path in paths:
+            code, _, _ = get(path, etags[path])
+            expected = 304 if path == "/api/parameter" else 200
+            assert code == expected, f"{path} après insertion : {code} au lieu de {expected}"
+        print("invalidation après insertion : OK")
+    finally:
+        server.should_exit = True
+        thread.join()
+        _cleanup_bench_rows()
+
+
+def bench_query_cache(days, repeat):
+    """Durée de get_all_data sans cache, au premier appel (cache vide) puis
+    cache chaud, pour chaque résolution sur une plage finissant maintenant"""
+    from apps import post_temp_humidity
+    from apps.query_cache import query_cache
+
+    date_end = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    date_int = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M")
+
+    def timed(func):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            durations.append((time.perf_counter() - start) * 1000)
+        return _percentile(durations, 50)
+
+    print(f"{'résolution':<10} {'lignes':>8} {'sans cache (ms)':>16} {'cache vide (ms)':>16} {'cache chaud (ms)':>17}")
+    for resolution in post_temp_humidity.RESOLUTIONS:
+        def load():
+            return post_temp_humidity.get_all_data(date_int, date_end, True, None, resolution)
+
+        max_bytes = query_cache.max_bytes
+        query_cache.max_bytes = 0
+        rows = len(load()['date'])
+        uncached = timed(load)
+        query_cache.max_bytes = max_bytes
+
+        cold = []
+        for _ in range(repeat):
+            query_cache.clear()
+            start = time.perf_counter()
+            load()
+            cold.append((time.perf_counter() - start) * 1000)
+        warm = timed(load)
+        print(f"{resolution:<10} {rows:>8} {uncached:>16.1f} {_percentile(cold, 50):>16.1f} {warm:>17.1f}")
+    print(json.dumps(query_cache.stats()))
+
+
+def bench_workers_ingest(worker_counts, frames, sensor_count, clients, port, api_key, backend):
+    """Débit d'ingestion POST /values selon le nombre de workers uvicorn.
+
+    Chaque mesure lance `uvicorn run:app --workers N` dans un processus séparé
+    (journal dans un répertoire temporaire), envoie les trames depuis `clients`
+    threads, attend leur insertion en base puis vérifie que tous les workers
+    servent le même ETag sur /WeatherData (état partagé `backend`).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from apps.database_configuration import db_manager, DataTempModel
+
+    body = json.dumps(_make_payload(sensor_count)).encode()
+
+    def request(path, data=None):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}{path}", data=data, method="POST" if data else "GET",
+            headers={"X-API-KEY": api_key, "Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.headers.get("ETag")
+
+    def post_frame(_):
+        start = time.perf_counter()
+        request("/values", body)
+        return (time.perf_counter() - start) * 1000
+
+    def stored_rows():
+        with db_manager.get_session_context() as session:
+            return session.query(DataTempModel).filter(
+                DataTempModel.sensor.like(f"{FRAME_SENSOR_PREFIX}%")
+            ).count()
+
+    print(f"{'workers':>7} {'trames/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'insérées (s)':>13} {'ETag distincts':>15}")
+    for worker_count in worker_counts:
+        journal_dir = tempfile.mkdtemp(prefix="bench-journal-")
+        env = {**os.environ, "JOURNAL_DIR": journal_dir, "DB_SHARED_STATE_BACKEND": backend}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "run:app", "--port", str(port),
+             "--workers", str(worker_count), "--log-level", "warning", "--no-access-log"],
+            env=env
+        )
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    request("/health")
+                    break
+                except (urllib.error.URLError, ConnectionError):
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise RuntimeError("Le serveur n'a pas démarré")
+                    time.sleep(0.2)
+            # Laisse tous les workers terminer leur démarrage (écouteur NOTIFY)
+            time.sleep(2)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                latencies = list(executor.map(post_frame, range(frames)))
+            elapsed = time.perf_counter() - start
+            # Les trames acceptées (202) sont insérées par lots : attendre la base
+            expected = frames * sensor_count
+            while stored_rows() < expected and time.perf_counter() - start < elapsed + 60:
+                time.sleep(0.1)
+            stored_after = time.perf_counter() - start
+            time.sleep(0.5)
+            etags = {request("/WeatherData") for _ in range(worker_count * 10)}
+        finally:
+            server.terminate()
+            server.wait()
+            _cleanup_bench_rows(FRAME_SENSOR_PREFIX)
+        print(f"{worker_count:>7} {frames / elapsed:>10.1f} {_percentile(latencies, 50):>10.2f} "
+              f"{_percentile(latencies, 99):>10.2f} {stored_after:>13.2f} {len(etags):>15}")
+
+
+def bench_command_wait(changes, timeout, port, api_key):
+    """Délai entre une trame qui change la commande du ventilateur et la réponse
+    d'une requête /commands/wait en attente, comparé au polling de /getdata"""
+    from apps import post_temp_humidity
+    from apps.live_state import live_state
+
+    def wait_command(since=None):
+        query = f"?since={since}&timeout={timeout}" if since else ""
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/commands/wait{query}", headers={"X-API-KEY": api_key}
+        )
+        with urllib.request.urlopen(request, timeout=timeout + 10) as response:
+            return json.loads(response.read()), time.perf_counter()
+
+    server, thread = _start_server(port)
+    latencies = []
+    try:
+        while not live_state.loaded:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        reply, _ = wait_command()
+        for index in range(changes):
+            result = {}
+            waiter = threading.Thread(target=lambda: result.update(zip(("reply", "at"), wait_command(reply["token"]))))
+            waiter.start()
+            time.sleep(0.1)
+            # Moyenne alternativement sous et au-dessus de la consigne : le ventilateur bascule
+            rows = _make_frame(1, datetime.datetime.now())
+            rows[0]['average_temperature'] = 20.0 if reply["command"]["fan"] == "OFF" else 50.0
+            start = time.perf_counter()
+            if not post_temp_humidity.add_data_batch(rows):
+                raise RuntimeError("Échec de l'insertion")
+            waiter.join()
+            if not result["reply"]["changed"] or result["reply"]["command"]["fan"] == reply["command"]["fan"]:
+                raise RuntimeError(f"Commande inchangée: {result['reply']}")
+            latencies.append((result["at"] - start) * 1000)
+            reply = result["reply"]
+    finally:
+        server.should_exit = True
+        thread.join()
+        _cleanup_bench_rows()
+
+    print(f"{'mode':<28} {'délai p50 (ms)':>15} {'délai p99 (ms)':>15} {'requêtes/h':>11}")
+    print(f"{'/commands/wait':<28} {_percentile(latencies, 50):>15.2f} {_percentile(latencies, 99):>15.2f} "
+          f"{3600 / timeout:>11.0f}")
+    # Polling : la commande est vue en moyenne une demi-période après son changement
+    for interval in (1, 5, 10):
+        print(f"{f'polling /getdata ({interval} s)':<28} {interval * 500:>15.0f} {interval * 1000:>15.0f} "
+              f"{3600 / interval:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks Weather Monitoring API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Débit d'insertion des trames /values")
+    ingest_parser.add_argument("--frames", type=int, default=200, help="Nombre de trames par mesure")
+    ingest_parser.add_argument(
+        "--sensors", type=int, nargs="+", default=[1, 8, 32], help="Nombre de capteurs par trame"
+    )
+
+    health_parser = subparsers.add_parser(
+        "health-latency", help="Latence de /health pendant des requêtes /alldata longues"
+    )
+    health_parser.add_argument("--requests", type=int, default=300, help="Nombre d'appels /health par mesure")
+    health_parser.add_argument("--loaders", type=int, default=2, help="Clients /alldata simultanés")
+    health_parser.add_argument("--port", type=int, default=5099)
+    health_parser.add_argument("--api-key", default="votre_cle_api_1")
+    health_parser.add_argument("--date-int", default="2024-07-28")
+    health_parser.add_argument("--date-end", default=datetime.date.today().isoformat())
+    health_parser.add_argument(
+        "--max-ratio", type=float, default=5.0, help="p99 sous charge maximal, en multiple du p99 au repos"
+    )
+    health_parser.add_argument(
+        "--max-p99-ms", type=float, default=50.0, help="p99 sous charge toujours accepté (ms)"
+    )
+
+    copy_parser = subparsers.add_parser("copy", help="Débit d'import COPY comparé à l'ORM")
+    copy_parser.add_argument("--rows", type=int, default=100000, help="Nombre de lignes à charger")
+    copy_parser.add_argument("--chunk-size", type=int, default=1000, help="Lignes par bloc")
+
+    explain_parser = subparsers.add_parser("explain", help="Vérifie l'utilisation des index (EXPLAIN)")
+    explain_parser.add_argument("--rows", type=int, default=10_000_000, help="Taille de la table synthétique")
+    explain_parser.add_argument("--keep", action="store_true", help="Conserver le schéma explain_bench")
+
+    live_parser = subparsers.add_parser("live-state", help="Latence de /getdata et /WeatherData (mémoire vs SQL)")
+    live_parser.add_argument("--requests", type=int, default=500, help="Appels par mesure")
+    live_parser.add_argument("--port", type=int, default=5099)
+    live_parser.add_argument("--api-key", default="votre_cle_api_1")
+
+    ws_parser = subparsers.add_parser("ws-ingest", help="Ingestion par /values comparée à /ws/values")
+    ws_parser.add_argument("--frames", type=int, default=500, help="Trames envoyées par canal")
+    ws_parser.add_argument("--sensors", type=int, default=8, help="Capteurs par trame")
+    ws_parser.add_argument("--port", type=int, default=5099)
+    ws_parser.add_argument("--api-key", default="votre_cle_api_1")
+
+    parse_parser = subparsers.add_parser("frame-parse", help="Décodage et validation d'une trame (JSON vs binaire)")
+    parse_parser.add_argument("--iterations", type=int, default=20000, help="Trames décodées par mesure")
+    parse_parser.add_argument(
+        "--sensors", type=int, nargs="+", default=[1, 8, 32], help="Nombre de capteurs par trame"
+    )
+
+    columnar_parser = subparsers.add_parser("columnar", help="Taille et sérialisation de /alldata (lignes vs colonnes)")
+    columnar_parser.add_argument("--days", type=int, default=30, help="Plage demandée à /alldata")
+    columnar_parser.add_argument("--repeat", type=int, default=5, help="Sérialisations par mesure")
+
+    conditional_parser = subparsers.add_parser(
+        "conditional", help="Requêtes conditionnelles (ETag / 304) sur les endpoints de lecture"
+    )
+    conditional_parser.add_argument("--requests", type=int, default=50, help="Appels par mesure")
+    conditional_parser.add_argument("--days", type=int, default=30, help="Plage demandée à /alldata")
+    conditional_parser.add_argument("--port", type=int, default=5099)
+    conditional_parser.add_argument("--api-key", default="votre_cle_api_1")
+
+    query_cache_parser = subparsers.add_parser(
+        "query-cache", help="get_all_data avec et sans cache des tranches closes"
+    )
+    query_cache_parser.add_argument("--days", type=int, default=30, help="Plage demandée (jusqu'à maintenant)")
+    query_cache_parser.add_argument("--repeat", type=int, default=5, help="Appels par mesure")
+
+    workers_parser = subparsers.add_parser(
+        "workers-ingest", help="Débit d'ingestion /values selon le nombre de workers"
+    )
+    workers_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Nombres de workers mesurés")
+    workers_parser.add_argument("--frames", type=int, default=2000, help="Trames envoyées par mesure")
+    workers_parser.add_argument("--sensors", type=int, default=8, help="Capteurs par trame")
+    workers_parser.add_argument("--clients", type=int, default=16, help="Clients HTTP simultanés")
+    workers_parser.add_argument("--backend", default="shm", choices=["local", "shm", "postgres"],
+                                help="Backend de l'état partagé")
+    workers_parser.add_argument("--port", type=int, default=5099)
+    workers_parser.add_argument("--api-key", default="votre_cle_api_1")
+
+    command_parser = subparsers.add_parser(
+        "command-wait", help="Délai de propagation d'une commande par /commands/wait"
+    )
+    command_parser.add_argument("--changes", type=int, default=50, help="Changements de commande mesurés")
+    command_parser.add_argument("--timeout", type=float, default=30, help="Délai d'attente des requêtes (s)")
+    command_parser.add_argument("--port", type=int, default=5099)
+    command_parser.add_argument("--api-key", default="votre_cle_api_1")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        bench_ingest(args.frames, args.sensors)
+    elif args.command == "health-latency":
+        bench_health_latency(
+            args.requests, args.loaders, args.port, args.api_key, args.date_int, args.date_end,
+            args.max_ratio, args.max_p99_ms
+        )
+    elif args.command == "copy":
+        bench_copy(args.rows, args.chunk_size)
+    elif args.command == "explain":
+        bench_explain(args.rows, args.keep)
+    elif args.command == "live-state":
+        bench_live_state(args.requests, args.port, args.api_key)
+    elif args.command == "ws-ingest":
+        bench_ws_ingest(args.frames, args.sensors, args.port, args.api_key)
+    elif args.command == "frame-parse":
+        bench_frame_parse(args.iterations, args.sensors)
+    elif args.command == "columnar":
+        bench_columnar(args.days, args.repeat)
+    elif args.command == "conditional":
+        bench_conditional(args.requests, args.days, args.port, args.api_key)
+    elif args.command == "query-cache":
+        bench_query_cache(args.days, args.repeat)
+    elif args.command == "workers-ingest":
+        bench_workers_ingest(
+            args.workers, args.frames, args.sensors, args.clients, args.port, args.api_key, args.backend
+        )
+    elif args.command == "command-wait":
+        bench_command_wait(args.changes, args.timeout, args.port, args.api_key)
+
+
+if __name__ == "__main__":
+    main()
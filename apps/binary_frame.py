@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Format binaire compact des trames ESP32 (alternative au JSON de /values).
+
+Disposition fixe, little-endian, valeurs en centièmes :
+
+    en-tête (12 octets)
+        2s  magic "WF"
+        B   version (1)
+        B   drapeaux : bit 0 ventilateur ON, bit 1 humidificateur ON
+        H   numéro de séquence (acquittements /ws/values)
+        h   average_temperature x 100
+        H   average_humidity x 100
+        B   numFailedSensors
+        B   nombre de capteurs N
+    N x capteur (5 octets)
+        B   numéro du capteur (sensor<numéro>)
+        h   temperature x 100
+        H   humidity x 100
+
+Une trame de 8 capteurs tient en 52 octets, contre environ 550 en JSON.
+"""
+import struct
+
+from apps.sensor_frame import FrameError
+
+BINARY_FRAME_CONTENT_TYPE = "application/x-sensor-frame"
+
+MAGIC = b"WF"
+VERSION = 1
+FLAG_FAN = 0x01
+FLAG_HUMIDIFIER = 0x02
+
+HEADER = struct.Struct("<2sBBHhHBB")
+SENSOR = struct.Struct("<BhH")
+
+
+def _status(flags, flag) -> str:
+    return "ON" if flags & flag else "OFF"
+
+
+def decode_frame(body: bytes) -> dict:
+    """Décode une trame binaire en dictionnaire au format JSON de /values.
+
+    Le résultat est ensuite validé par sensor_frame.parse_frame, comme une
+    trame JSON.
+    """
+    if len(body) < HEADER.size:
+        raise FrameError(f"Trame binaire trop courte ({len(body)} octets)")
+    magic, version, flags, seq, avg_temp, avg_hum, num_failed, count = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise FrameError("Trame binaire invalide (en-tête inconnu)")
+    if version != VERSION:
+        raise FrameError(f"Version de trame binaire non supportée: {version}")
+    expected = HEADER.size + count * SENSOR.size
+    if len(body) != expected:
+        raise FrameError(f"Taille de trame binaire incorrecte: {len(body)} octets, {expected} attendus")
+
+    data = {
+        'seq': seq,
+        'average_temperature': avg_temp / 100,
+        'average_humidity': avg_hum / 100,
+        'fan_status': _status(flags, FLAG_FAN),
+        'humidifier_status': _status(flags, FLAG_HUMIDIFIER),
+        'numFailedSensors': num_failed
+    }
+    for number, temperature, humidity in SENSOR.iter_unpack(body[HEADER.size:]):
+        name = f"sensor{number}"
+        if name in data:
+            raise FrameError(f"Capteur {number} présent plusieurs fois dans la trame binaire")
+        data[name] = {'temperature': temperature / 100, 'humidity': humidity / 100}
+    return data
+
+
+def encode_frame(data: dict, seq: int = 0) -> bytes:
+    """Encode une trame au format JSON de /values (référence pour le firmware et les tests).
+
+    Les capteurs doivent s'appeler sensor<numéro>, numéro compris entre 0 et 255.
+    """
+    sensors = []
+    for name, values in data.items():
+        if name.startswith('sensor'):
+            sensors.append(SENSOR.pack(
+                int(name[len('sensor'):]),
+                round(values['temperature'] * 100),
+                round(values['humidity'] * 100)
+            ))
+    flags = 0
+    if str(data.get('fan_status')).upper() == "ON":
+        flags |= FLAG_FAN
+    if str(data.get('humidifier_status')).upper() == "ON":
+        flags |= FLAG_HUMIDIFIER
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, seq,
+        round(data['average_temperature'] * 100),
+        round(data['average_humidity'] * 100),
+        data.get('numFailedSensors', 0),
+        len(sensors)
+    )
+    return header + b"".join(sensors)
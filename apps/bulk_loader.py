@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Chargement en masse de relevés historiques dans data_temp via COPY FROM STDIN.
+
+Usage :
+    python -m apps.bulk_loader releves.csv
+    python -m apps.bulk_loader releves.ndjson --chunk-size 20000
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import logging
+import time
+
+from apps.database_configuration import db_manager, partition_name, SENSOR_NAME_MAX_LENGTH, INT4_MAX
+from apps.data_version import data_version, DATA
+from apps.post_temp_humidity import parse_status
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COPY_COLUMNS = (
+    'sensor', 'temperature', 'humidity', 'date_serveur', 'average_temperature',
+    'average_humidity', 'fan_status', 'humidifier_status', 'numfailedsensors'
+)
+COPY_SQL = f"COPY data_temp ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+MAX_REPORTED_ERRORS = 20
+
+
+def iter_csv_records(text_stream):
+    """Lit un CSV dont l'en-tête reprend les noms de colonnes de data_temp"""
+    for record in csv.DictReader(text_stream):
+        yield record
+
+
+def iter_ndjson_records(text_stream):
+    """Lit un fichier NDJSON (un objet JSON par ligne).
+
+    Les lignes sont retournées telles quelles : elles sont décodées par
+    validate_record, une ligne illisible n'est ainsi qu'un relevé rejeté.
+    """
+    for line in text_stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def detect_format(name: str) -> str:
+    """Déduit le format (csv / ndjson) d'un nom de fichier ou d'un content-type"""
+    name = (name or "").lower()
+    if "ndjson" in name or "jsonl" in name or name.endswith(".json"):
+        return "ndjson"
+    return "csv"
+
+
+def _optional_float(value):
+    return None if value in (None, "") else float(value)
+
+
+def validate_record(record):
+    """Valide un relevé (dict ou ligne JSON) et le convertit en tuple ordonné selon COPY_COLUMNS"""
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("Le relevé doit être un objet JSON")
+
+    sensor = str(record.get('sensor') or "").strip()
+    if not sensor:
+        raise ValueError("Nom de capteur manquant")
+    if len(sensor) > SENSOR_NAME_MAX_LENGTH:
+        raise ValueError(f"Nom de capteur trop long (plus de {SENSOR_NAME_MAX_LENGTH} caractères)")
+
+    temperature = float(record['temperature'])
+    humidity = float(record['humidity'])
+    if not (-50 <= temperature <= 100):
+        raise ValueError(f"La température doit être entre -50 et 100, reçu: {temperature}")
+    if not (0 <= humidity <= 100):
+        raise ValueError(f"L'humidité doit être entre 0 et 100, reçu: {humidity}")
+
+    date_serveur = record.get('date_serveur')
+    if not date_serveur:
+        raise ValueError("date_serveur manquante")
+    date_serveur = datetime.datetime.fromisoformat(str(date_serveur).strip())
+
+    # Colonne numfailedsensors : int4
+    num_failed_sensors = int(record.get('numfailedsensors') or 0)
+    if not (0 <= num_failed_sensors <= INT4_MAX):
+        raise ValueError(f"numfailedsensors doit être entre 0 et {INT4_MAX}, reçu: {num_failed_sensors}")
+
+    return (
+        sensor,
+        temperature,
+        humidity,
+        date_serveur.isoformat(),
+        _optional_float(record.get('average_temperature')),
+        _optional_float(record.get('average_humidity')),
+        parse_status(record.get('fan_status', False)),
+        parse_status(record.get('humidifier_status', False)),
+        num_failed_sensors
+    )
+
+
+class BulkLoadError(Exception):
+    """Import interrompu : `report` décrit ce qui est déjà validé en base.
+
+    resume_from_record est le numéro du premier relevé non chargé : un nouvel
+    import reprenant à ce relevé ne crée pas de doublons.
+    """
+
+    def __init__(self, message: str, report: dict):
+        super().__init__(message)
+        self.report = report
+
+
+def copy_records(records, chunk_size: int = 10000, progress=None) -> dict:
+    """Valide les relevés par blocs et charge chaque bloc avec COPY, validé aussitôt.
+
+    Les lignes invalides sont ignorées et comptées. `progress` est appelé après
+    chaque bloc avec (lignes chargées, lignes rejetées). En cas d'erreur, les
+    blocs déjà validés restent en base : BulkLoadError porte alors le rapport
+    partiel et le relevé à partir duquel reprendre. Si data_temp est partitionnée, les partitions mensuelles manquantes sont
+    créées avant le COPY, chacune dans sa propre transaction courte : le
+    verrou ACCESS EXCLUSIVE pris sur data_temp est relâché aussitôt.
+    """
+    report = {"rows_loaded": 0, "rows_rejected": 0, "errors": []}
+    # Premier relevé du bloc en cours (non encore validé)
+    chunk_start = 1
+    start = time.perf_counter()
+    partitions = set(db_manager.list_partitions()) if db_manager.data_temp_is_partitioned() else None
+    conn = db_manager.get_raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            pending = 0
+            months = set()
+
+            def flush(next_record):
+                nonlocal buffer, writer, pending, chunk_start
+                if partitions is not None:
+                    for month in months:
+                        if partition_name(month) not in partitions:
+                            db_manager.ensure_partitions(month, month)
+                            partitions.add(partition_name(month))
+                    months.clear()
+                buffer.seek(0)
+                cursor.copy_expert(COPY_SQL, buffer)
+                conn.commit()
+                data_version.bump(DATA)
+                report["rows_loaded"] += pending
+                chunk_start = next_record
+                buffer, pending = io.StringIO(), 0
+                writer = csv.writer(buffer)
+                if progress:
+                    progress(report["rows_loaded"], report["rows_rejected"])
+
+            for line_number, record in enumerate(records, start=1):
+                try:
+                    row = validate_record(record)
+                    writer.writerow(row)
+                    pending += 1
+                    if partitions is not None:
+                        months.add(datetime.datetime.strptime(row[3][:7], "%Y-%m"))
+                except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                    report["rows_rejected"] += 1
+                    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                        report["errors"].append({"record": line_number, "error": str(e)})
+                if pending >= chunk_size:
+                    flush(line_number + 1)
+            if pending:
+                flush(None)
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Erreur lors du chargement COPY ({report['rows_loaded']} lignes déjà validées): {e}")
+        raise BulkLoadError(str(e), {**report, "resume_from_record": chunk_start}) from e
+    finally:
+        db_manager.close_connection(conn)
+
+    elapsed = time.perf_counter() - start
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["rows_loaded"] / elapsed, 1) if elapsed else None
+    logger.info(
+        f"Chargement COPY terminé: {report['rows_loaded']} lignes chargées, "
+        f"{report['rows_rejected']} rejetées en {elapsed:.1f}s"
+    )
+    return report
+
+
+def load_file(text_stream, file_format: str, chunk_size: int = 10000, progress=None) -> dict:
+    """Charge un flux texte CSV ou NDJSON dans data_temp"""
+    records = iter_ndjson_records(text_stream) if file_format == "ndjson" else iter_csv_records(text_stream)
+    return copy_records(records, chunk_size=chunk_size, progress=progress)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import en masse de relevés (CSV / NDJSON) dans data_temp")
+    parser.add_argument("path", help="Fichier CSV ou NDJSON à importer")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Format du fichier (déduit de l'extension par défaut)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Nombre de lignes par bloc COPY")
+    args = parser.parse_args()
+
+    def print_progress(loaded, rejected):
+        print(f"\r{loaded} lignes chargées, {rejected} rejetées", end="", flush=True)
+
+    try:
+        with open(args.path, newline="", encoding="utf-8") as f:
+            result = load_file(f, args.format or detect_format(args.path), args.chunk_size, print_progress)
+        print()
+        print(f"✅ {result['rows_loaded']} lignes importées ({result['rows_per_second']} lignes/s)")
+        for error in result["errors"]:
+            print(f"❌ enregistrement {error['record']}: {error['error']}")
+    except BulkLoadError as e:
+        print(f"\n❌ Erreur: {e}")
+        print(f"   {e.report['rows_loaded']} lignes déjà importées, reprendre à l'enregistrement {e.report['resume_from_record']}")
+    except Exception as e:
+        print(f"\n❌ Erreur: {e}")
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import json
+import logging
+
+from apps import post_temp_humidity
+from apps.async_db import run_db
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def command_token(command: dict) -> str:
+    """Empreinte d'une commande : identique dans tous les workers pour une même commande"""
+    return hashlib.sha1(json.dumps(command, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class CommandWatch:
+    """Commande courante des ESP32 (ventilateur, humidificateur, moteur) et attente de son changement.
+
+    La commande est recalculée dans le thread de l'écouteur à chaque
+    notification de data_temp (nouvelles moyennes) ou des paramètres, à partir
+    de l'état en mémoire (live_state, parameter_state) ; les requêtes
+    /commands/wait en attente sont réveillées dans la boucle asyncio dès
+    qu'elle change. La consigne d'humidité dépend aussi de la date (20e jour) :
+    ce changement-là n'est vu qu'à l'expiration de l'attente.
+    """
+
+    def __init__(self, live_state):
+        self.live_state = live_state
+        self._loop = None
+        self._command = None
+        self._token = None
+        self._changed = None
+        self._closing = False
+        self._waiters = 0
+        self._changes = 0
+        self._wakeups = 0
+
+    def attach(self, loop):
+        """Associe la boucle asyncio qui réveille les requêtes en attente"""
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def close(self):
+        """Réveille les requêtes en attente (arrêt de l'application)"""
+        self._closing = True
+        if self._changed is not None:
+            self._changed.set()
+
+    def compute(self) -> dict:
+        """Commande calculée à partir de la dernière trame et des paramètres (appel bloquant)"""
+        last_data = self.live_state.last_data() if self.live_state.loaded else None
+        if last_data is None:
+            return post_temp_humidity.get_device_command()
+        return post_temp_humidity.get_device_command(
+            last_data['average_temperature'],
+            last_data['average_humidity']
+        )
+
+    # --- Côté écouteur (thread) ---
+
+    def handle_notification(self, payload: str = None):
+        """Notification data_temp ou parameter_changes (ou reconnexion de l'écouteur).
+
+        À abonner après live_state et parameter_state, pour calculer la
+        commande sur l'état déjà mis à jour.
+        """
+        command = self.compute()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._publish, command)
+
+    # --- Côté boucle asyncio ---
+
+    def _publish(self, command: dict):
+        token = command_token(command)
+        if token == self._token:
+            return
+        if self._token is not None:
+            self._changes += 1
+            logger.info(f"Commande modifiée: {command}")
+        self._command, self._token = command, token
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, since: str, timeout: float):
+        """Attend que le jeton de la commande diffère de `since` ; retourne (commande, jeton).
+
+        À l'expiration du délai, la commande est recalculée : un changement
+        lié à la seule date est alors retourné.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self._token is None:
+            # Écouteur pas encore connecté : premier calcul à la demande
+            self._publish(await run_db(self.compute))
+        self._waiters += 1
+        try:
+            while self._token == since:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if self._closing:
+                    break
+                self._wakeups += 1
+        finally:
+            self._waiters -= 1
+        if self._token == since and not self._closing:
+            self._publish(await run_db(self.compute))
+        return self._command, self._token
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "token": self._token,
+            "waiters": self._waiters,
+            "changes": self._changes,
+            "wakeups": self._wakeups
+        }
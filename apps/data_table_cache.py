@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from apps.database_configuration import db_manager, DataTempMinuteModel, read_watermark
+from apps.post_temp_humidity import data_table_query
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def _hour(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class DataTableCache:
+    """Cache des périodes closes de /datatable, par heure.
+
+    Une heure est close lorsqu'elle s'est terminée depuis plus de `grace_seconds` :
+    ses lignes sont alors conservées en mémoire et l'heure en cours est seule
+    relue en base. Une écriture tardive (rejeu du journal, import) modifie
+    updated_at dans data_temp_minute : à chaque lecture, les heures modifiées
+    depuis la marque de la lecture précédente (read_watermark, qui couvre les
+    transactions encore ouvertes) sont retirées du cache.
+    """
+
+    def __init__(self, max_hours: int = 168, grace_seconds: float = 60, overlap_seconds: float = 30):
+        self.max_hours = max_hours
+        self.grace = datetime.timedelta(seconds=grace_seconds)
+        self.overlap = datetime.timedelta(seconds=overlap_seconds)
+        self._lock = threading.Lock()
+        self._hours = OrderedDict()
+        self._checked_at = None
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def rows(self, start: datetime.datetime):
+        """Lignes de data_temp_minute depuis `start` : (libellés, lignes, marque).
+
+        La marque (read_watermark) sert de paramètre since à la lecture
+        incrémentale suivante. Retourne None en cas d'erreur.
+        """
+        try:
+            with db_manager.get_session_context() as session:
+                now, watermark = read_watermark(session)
+                self._invalidate(session, watermark)
+
+                hours = []
+                hour = _hour(start)
+                while hour <= now:
+                    hours.append(hour)
+                    hour += HOUR
+                closed_before = _hour(now - self.grace)
+
+                with self._lock:
+                    cached = {hour: self._hours[hour] for hour in hours if hour in self._hours}
+                    for hour in cached:
+                        self._hours.move_to_end(hour)
+                missing = [hour for hour in hours if hour not in cached]
+                self._hits += len(cached)
+                self._misses += len(missing)
+
+                fetched = {hour: [] for hour in missing}
+                if missing:
+                    query = data_table_query(session).filter(
+                        DataTempMinuteModel.bucket >= missing[0],
+                        DataTempMinuteModel.bucket < missing[-1] + HOUR
+                    )
+                    for row in session.execute(query.statement):
+                        rows = fetched.get(_hour(row.heure))
+                        if rows is not None:
+                            rows.append(row)
+
+                with self._lock:
+                    for hour, rows in fetched.items():
+                        if hour < closed_before:
+                            self._hours[hour] = rows
+                    while len(self._hours) > self.max_hours:
+                        self._hours.popitem(last=False)
+
+                rows = []
+                for hour in hours:
+                    hour_rows = cached.get(hour, fetched.get(hour, []))
+                    rows.extend(row for row in hour_rows if row.heure >= start)
+                keys = list(data_table_query(session).statement.selected_columns.keys())
+                return keys, rows, watermark
+
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture de la table de données: {e}")
+            return None
+
+    def _invalidate(self, session, watermark):
+        """Retire du cache les heures modifiées depuis la lecture précédente"""
+        if self._checked_at is not None and self._hours:
+            hour = func.date_trunc('hour', DataTempMinuteModel.bucket)
+            changed = session.query(hour).filter(
+                DataTempMinuteModel.updated_at >= self._checked_at - self.overlap
+            ).distinct().all()
+            with self._lock:
+                for (changed_hour,) in changed:
+                    if self._hours.pop(changed_hour, None) is not None:
+                        self._invalidations += 1
+        self._checked_at = watermark
+
+    def clear(self):
+        with self._lock:
+            self._hours.clear()
+        self._checked_at = None
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "cached_hours": len(self._hours),
+            "hits": self._hits,
+            "misses": self._misses,
+            "invalidations": self._invalidations
+        }
+
+
+# Instance globale du cache de /datatable
+data_table_cache = DataTableCache()
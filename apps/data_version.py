@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Version des données servies par l'API, pour les requêtes conditionnelles HTTP.
+
+Chaque écriture (trame insérée, paramètres modifiés) incrémente un compteur.
+L'ETag d'une réponse est dérivé de ce compteur et de l'URL demandée : tant
+qu'aucune écriture n'a eu lieu, un client qui renvoie If-None-Match reçoit un
+304 sans qu'aucune requête ne soit exécutée en base.
+
+Les compteurs sont tenus par apps.shared_state : avec un backend partagé, tous
+les workers calculent le même ETag et un client peut recevoir un 304 de
+n'importe lequel. L'epoch de l'état partagé, inclus dans l'ETag, évite un 304 à
+tort après la remise à zéro des compteurs (backend local relancé...).
+Les écritures faites hors de ce processus sont vues via LISTEN/NOTIFY.
+"""
+import email.utils
+import hashlib
+import math
+import time
+
+from apps.shared_state import shared_state
+
+# Portées de version : une modification des paramètres n'invalide pas les relevés
+DATA = "data"
+PARAMETER = "parameter"
+
+
+class DataVersion:
+    """Compteurs de version par portée et date de dernière modification"""
+
+    def __init__(self, scopes=(DATA, PARAMETER), state=shared_state):
+        self._state = state
+        self._started = time.time()
+        self._scopes = scopes
+        self._not_modified = 0
+
+    def bump(self, scope: str = DATA):
+        """Signale une écriture dans la portée `scope`"""
+        self._state.incr(f"version:{scope}")
+        self._state.advance(f"modified:{scope}", int(time.time() * 1000))
+
+    def handle_notification(self, payload: str = None, scope: str = DATA):
+        """Notification NOTIFY (écriture d'un autre processus ou resynchronisation).
+
+        Avec un état partagé, chaque worker reçoit la même notification et
+        incrémente la version : les incréments en trop ne coûtent qu'un 200 à
+        la place d'un 304. Les notifications ne sont pas dédoublonnées sur
+        l'identifiant de la trame : les identifiants ne suivent pas l'ordre de
+        validation et une transaction validée tard serait ignorée.
+        """
+        self.bump(scope)
+
+    def version(self, scope: str = DATA) -> int:
+        return self._state.get(f"version:{scope}")
+
+    def modified(self, scope: str = DATA) -> float:
+        """Date (epoch) de la dernière écriture, ou du démarrage à défaut"""
+        return self._state.get(f"modified:{scope}") / 1000 or self._started
+
+    def etag(self, scope: str, request, *extra) -> str:
+        """ETag fort de la réponse à `request` pour la version courante.
+
+        La clé API est exclue de l'URL ; `extra` ajoute ce dont dépend la
+        réponse en dehors de l'URL (date du jour pour une plage par défaut...).
+        """
+        query = sorted((key, value) for key, value in request.query_params.multi_items() if key != 'api_key')
+        variant = repr((request.url.path, query, extra)).encode()
+        digest = hashlib.sha1(variant).hexdigest()[:16]
+        return f'"{self._state.epoch}-{scope}-{self.version(scope)}-{digest}"'
+
+    def last_modified(self, scope: str):
+        """Date HTTP de la dernière écriture, ou None si elle date de la seconde en cours.
+
+        Last-Modified n'a qu'une précision d'une seconde : tant que la seconde
+        de la dernière écriture n'est pas écoulée, une autre écriture pourrait
+        porter la même date et un If-Modified-Since donnerait un 304 à tort.
+        """
+        modified = math.ceil(self.modified(scope))
+        if time.time() < modified:
+            return None
+        return email.utils.formatdate(modified, usegmt=True)
+
+    def headers(self, scope: str, etag: str) -> dict:
+        """En-têtes de validation à joindre à une réponse 200 ou 304"""
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        last_modified = self.last_modified(scope)
+        if last_modified:
+            headers["Last-Modified"] = last_modified
+        return headers
+
+    def is_not_modified(self, scope: str, request, etag: str) -> bool:
+        """Vrai si le client possède déjà la représentation courante.
+
+        If-None-Match est prioritaire ; If-Modified-Since n'est utilisé que
+        s'il est absent (RFC 9110, 13.2.2).
+        """
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            matched = '*' in tags or etag in tags
+        else:
+            matched = False
+            if_modified_since = request.headers.get('if-modified-since')
+            if if_modified_since and self.last_modified(scope):
+                try:
+                    since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    since = None
+                matched = since is not None and self.modified(scope) <= since
+        if matched:
+            self._not_modified += 1
+        return matched
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "versions": {scope: self.version(scope) for scope in self._scopes},
+            "not_modified": self._not_modified
+        }
+
+
+# Instance globale partagée par les fonctions d'écriture et les endpoints
+data_version = DataVersion()
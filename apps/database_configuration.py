@@ -1,19 +1,22 @@
 #!/usr/bin/python3
 
 import os
+import re
 import logging
-from typing import Optional, Generator
+import argparse
+import datetime
+from typing import Literal, Optional, Generator
 from contextlib import contextmanager
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Float, Text, TIMESTAMP, func, text
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Boolean, Float, Text, TIMESTAMP, Index, MetaData, Table, func, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 # from pydantic import BaseSettings
 from pydantic_settings import BaseSettings
-from pydantic import Field, conint, constr
+from pydantic import Field, conint, confloat, constr, field_validator
 from sqlalchemy import Time  # Ajoute cette importation
 
 from dotenv import load_dotenv
@@ -42,6 +45,26 @@ class DatabaseSettings(BaseSettings):
     db_name: constr(strip_whitespace=True, min_length=1) = Field(default="sensor", description="Nom de la base")
     db_pool_size: conint(ge=1, le=100) = Field(default=10, description="Taille du pool")
     db_max_overflow: conint(ge=0, le=100) = Field(default=20, description="Overflow du pool")
+    db_executor_workers: conint(ge=1, le=100) = Field(default=10, description="Threads dédiés aux requêtes bloquantes")
+    db_partition_data_temp: bool = Field(default=True, description="Partitionnement mensuel de data_temp à sa création")
+    db_partition_months_ahead: conint(ge=0, le=24) = Field(default=3, description="Partitions futures créées à l'avance")
+    db_partition_retention_months: conint(ge=0) = Field(default=0, description="Mois de données brutes conservés (0 = tout)")
+    db_partition_maintenance_interval: conint(ge=60) = Field(default=3600, description="Intervalle de maintenance des partitions (s)")
+    db_retention_raw_days: conint(ge=0) = Field(default=14, description="Jours de relevés bruts conservés (0 = tout)")
+    db_retention_batch_rows: conint(ge=100, le=100000) = Field(default=5000, description="Lignes supprimées par transaction")
+    db_retention_batch_pause: confloat(ge=0) = Field(default=0.5, description="Pause entre deux lots de suppression (s)")
+    db_retention_interval: conint(ge=60) = Field(default=3600, description="Intervalle d'exécution de la rétention (s)")
+    db_query_cache_max_mb: conint(ge=0) = Field(default=64, description="Mémoire du cache des requêtes d'agrégats (Mo, 0 = désactivé)")
+    db_shared_state_backend: Literal['local', 'shm', 'postgres'] = Field(default="local", description="État partagé entre workers")
+    db_shared_state_path: str = Field(default="", description="Fichier du backend shm (défaut : /dev/shm)")
+
+    @field_validator('db_retention_raw_days')
+    @classmethod
+    def validate_retention_raw_days(cls, v: int) -> int:
+        # get_weather_data lit les 7 derniers jours de relevés bruts
+        if 0 < v < 7:
+            raise ValueError("La rétention des relevés bruts doit être d'au moins 7 jours (ou 0 pour désactiver)")
+        return v
 
     model_config = {
         "env_file": ".env",
@@ -94,21 +117,260 @@ class ParameterDataModel(Base):
     timetoclose = Column(Integer, default=28)
     created_at = Column(TIMESTAMP, server_default='NOW()')
 
+# Limites des colonnes de data_temp, vérifiées avant insertion (trames, import)
+SENSOR_NAME_MAX_LENGTH = 100
+INT4_MAX = 2**31 - 1
+
 class DataTempModel(Base):
     """Modèle pour la table data_temp"""
     __tablename__ = 'data_temp'
+    __table_args__ = (
+        # BRIN : index très compact pour les lectures par plage de dates (insertion chronologique)
+        Index('ix_data_temp_date_serveur_brin', 'date_serveur', postgresql_using='brin'),
+        # B-tree composite pour les lectures d'un capteur sur une période
+        Index('ix_data_temp_sensor_date_serveur', 'sensor', 'date_serveur'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    sensor = Column(String(100), nullable=False)
+    sensor = Column(String(SENSOR_NAME_MAX_LENGTH), nullable=False)
     temperature = Column(Float, nullable=False)
     humidity = Column(Float, nullable=False)
-    date_serveur = Column(TIMESTAMP, server_default='NOW()')
+    date_serveur = Column(TIMESTAMP, server_default=func.now())
     average_temperature = Column(Float, nullable=True)
     average_humidity = Column(Float, nullable=True)
     fan_status = Column(Boolean, default=False)
     humidifier_status = Column(Boolean, default=False)
     numfailedsensors = Column(Integer, default=0)
 
+class RollupColumnsMixin:
+    """Colonnes communes aux tables d'agrégats de data_temp (somme, nombre, min, max)"""
+    bucket = Column(TIMESTAMP, primary_key=True)
+    sensor = Column(String(SENSOR_NAME_MAX_LENGTH), primary_key=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    sum_temperature = Column(Float, nullable=False, default=0)
+    min_temperature = Column(Float, nullable=True)
+    max_temperature = Column(Float, nullable=True)
+    sum_humidity = Column(Float, nullable=False, default=0)
+    min_humidity = Column(Float, nullable=True)
+    max_humidity = Column(Float, nullable=True)
+    sum_average_temperature = Column(Float, nullable=False, default=0)
+    count_average_temperature = Column(Integer, nullable=False, default=0)
+    sum_average_humidity = Column(Float, nullable=False, default=0)
+    count_average_humidity = Column(Integer, nullable=False, default=0)
+    sum_failed = Column(Float, nullable=False, default=0)
+    count_failed = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now())
+
+class DataTempMinuteModel(RollupColumnsMixin, Base):
+    """Agrégats par minute et par capteur (table data_temp_minute)"""
+    __tablename__ = 'data_temp_minute'
+    __table_args__ = (
+        # Périodes modifiées depuis un instant donné (/datatable?since=)
+        Index('ix_data_temp_minute_updated_at', 'updated_at'),
+    )
+
+class DataTempHourModel(RollupColumnsMixin, Base):
+    """Agrégats par heure et par capteur (table data_temp_hour)"""
+    __tablename__ = 'data_temp_hour'
+
+class SharedStateModel(Base):
+    """Compteurs partagés entre workers (backend postgres de apps.shared_state)"""
+    __tablename__ = 'shared_state'
+
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+# Tables d'agrégats et granularité date_trunc correspondante
+ROLLUP_TABLES = {
+    'data_temp_minute': 'minute',
+    'data_temp_hour': 'hour'
+}
+
+# Agrégation d'un ensemble de lignes data_temp ({source}) dans une table d'agrégats.
+# Les lignes sont triées par clé pour limiter les interblocages entre transactions.
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO {table} AS r (
+        bucket, sensor, row_count,
+        sum_temperature, min_temperature, max_temperature,
+        sum_humidity, min_humidity, max_humidity,
+        sum_average_temperature, count_average_temperature,
+        sum_average_humidity, count_average_humidity,
+        sum_failed, count_failed, updated_at
+    )
+    SELECT date_trunc('{unit}', date_serveur), sensor, count(*),
+           sum(temperature), min(temperature), max(temperature),
+           sum(humidity), min(humidity), max(humidity),
+           coalesce(sum(average_temperature), 0), count(average_temperature),
+           coalesce(sum(average_humidity), 0), count(average_humidity),
+           coalesce(sum(numfailedsensors), 0), count(numfailedsensors), now()
+    FROM {source}
+    WHERE date_serveur IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (bucket, sensor) DO UPDATE SET
+        row_count = r.row_count + EXCLUDED.row_count,
+        sum_temperature = r.sum_temperature + EXCLUDED.sum_temperature,
+        min_temperature = LEAST(r.min_temperature, EXCLUDED.min_temperature),
+        max_temperature = GREATEST(r.max_temperature, EXCLUDED.max_temperature),
+        sum_humidity = r.sum_humidity + EXCLUDED.sum_humidity,
+        min_humidity = LEAST(r.min_humidity, EXCLUDED.min_humidity),
+        max_humidity = GREATEST(r.max_humidity, EXCLUDED.max_humidity),
+        sum_average_temperature = r.sum_average_temperature + EXCLUDED.sum_average_temperature,
+        count_average_temperature = r.count_average_temperature + EXCLUDED.count_average_temperature,
+        sum_average_humidity = r.sum_average_humidity + EXCLUDED.sum_average_humidity,
+        count_average_humidity = r.count_average_humidity + EXCLUDED.count_average_humidity,
+        sum_failed = r.sum_failed + EXCLUDED.sum_failed,
+        count_failed = r.count_failed + EXCLUDED.count_failed,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Heure de la base et marque de lecture des agrégats modifiés. updated_at vaut
+# now(), le début de la transaction qui écrit, et non l'heure de sa validation :
+# une transaction longue (COPY d'un import, rejeu) valide des updated_at anciens.
+# La marque est donc le début de la plus ancienne transaction encore ouverte :
+# toute ligne validée après la lecture porte un updated_at postérieur ou égal.
+# pg_stat_activity ne montre xact_start que pour les sessions du même rôle (ou
+# avec pg_read_all_stats) : l'application et les imports doivent le partager.
+WATERMARK_SQL = text("""
+    SELECT localtimestamp AS now,
+           least(localtimestamp, min(xact_start)::timestamp) AS watermark
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+""")
+
+
+def read_watermark(session):
+    """(heure de la base, marque) : updated_at >= marque couvre les écritures non encore validées"""
+    row = session.execute(WATERMARK_SQL).one()
+    return row.now, row.watermark
+
+# Partitions mensuelles de data_temp : data_temp_pAAAAMM
+PARTITION_NAME_PATTERN = re.compile(r"^data_temp_p(\d{4})(\d{2})$")
+
+
+def month_start(value: datetime.datetime) -> datetime.datetime:
+    """Premier jour du mois de `value` à minuit"""
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime.datetime, months: int) -> datetime.datetime:
+    """Premier jour du mois situé `months` mois après celui de `value`"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def months_between(start: datetime.datetime, end: datetime.datetime):
+    """Premiers jours des mois couvrant l'intervalle [start, end]"""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month: datetime.datetime) -> str:
+    return f"data_temp_p{month:%Y%m}"
+
+
+def partition_ddl(month: datetime.datetime) -> str:
+    """DDL (idempotente) de la partition mensuelle contenant `month`"""
+    lower = month_start(month)
+    upper = add_months(lower, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(lower)} PARTITION OF data_temp "
+        f"FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+    )
+
+
+def _partitioned_data_temp_table() -> Table:
+    """Table data_temp partitionnée par mois sur date_serveur.
+
+    PostgreSQL impose que la clé de partitionnement fasse partie de la clé
+    primaire : elle devient (id, date_serveur). Le modèle ORM garde id seul
+    comme identifiant, id restant unique grâce à sa séquence.
+    """
+    columns = []
+    for column in DataTempModel.__table__.columns:
+        column = column._copy()
+        if column.name == 'date_serveur':
+            column.primary_key = True
+            column.nullable = False
+        columns.append(column)
+    return Table(
+        'data_temp', MetaData(), *columns,
+        postgresql_partition_by='RANGE (date_serveur)'
+    )
+
+
+# Canal NOTIFY signalant chaque insertion dans data_temp
+DATA_TEMP_CHANNEL = 'data_temp_changes'
+
+# Colonnes des lignes transmises dans les notifications (tableaux JSON compacts)
+NOTIFY_COLUMNS = (
+    'id', 'sensor', 'temperature', 'humidity', 'date_serveur', 'average_temperature',
+    'average_humidity', 'fan_status', 'humidifier_status', 'numfailedsensors'
+)
+
+# Charge utile : dernière ligne de chaque capteur et maxima horaires récents de
+# l'instruction. Au-delà de la limite de NOTIFY (8000 octets), seul l'id est
+# envoyé avec "resync" et les écouteurs relisent l'état en base.
+DATA_TEMP_NOTIFY_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION data_temp_notify() RETURNS trigger AS $$
+    DECLARE
+        payload text;
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+            RETURN NULL;
+        END IF;
+        SELECT json_build_object(
+            'id', (SELECT max(id) FROM new_rows),
+            'sensors', (
+                SELECT coalesce(json_agg(json_build_array({', '.join(NOTIFY_COLUMNS)})), '[]')
+                FROM (SELECT DISTINCT ON (sensor) * FROM new_rows ORDER BY sensor, id DESC) latest
+            ),
+            'maxima', (
+                SELECT coalesce(json_agg(json_build_array(bucket, max_temperature, max_humidity) ORDER BY bucket), '[]')
+                FROM (
+                    SELECT date_trunc('hour', date_serveur) AS bucket,
+                           max(temperature) AS max_temperature, max(humidity) AS max_humidity
+                    FROM new_rows
+                    WHERE date_serveur >= date_trunc('day', localtimestamp) - interval '8 days'
+                    GROUP BY 1
+                ) hours
+            )
+        )::text INTO payload;
+        IF octet_length(payload) > 7900 THEN
+            payload := json_build_object('id', (SELECT max(id) FROM new_rows), 'resync', true)::text;
+        END IF;
+        PERFORM pg_notify('{DATA_TEMP_CHANNEL}', payload);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Canal NOTIFY signalant une modification des paramètres (parameter_data, stepper)
+PARAMETER_CHANNEL = 'parameter_changes'
+
+# Tables dont les modifications sont notifiées sur PARAMETER_CHANNEL
+PARAMETER_TABLES = ('parameter_data', 'stepper')
+
+# Charge utile constante : PostgreSQL fusionne les notifications identiques d'une
+# même transaction, qui modifie en général parameter_data et stepper
+PARAMETER_NOTIFY_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION parameter_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{PARAMETER_CHANNEL}', 'parameters');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Canal NOTIFY des compteurs partagés (backend postgres de apps.shared_state)
+SHARED_STATE_CHANNEL = 'shared_state_changes'
+
+# Verrou consultatif sérialisant la création du schéma entre workers qui démarrent ensemble
+SCHEMA_LOCK = 'schema'
+
 class DatabaseManager:
     """Gestionnaire de base de données avec pool de connexions"""
     
@@ -200,17 +462,301 @@ class DatabaseManager:
     def _create_tables(self):
         """Créer les tables et insérer les données par défaut"""
         try:
-            # Créer toutes les tables
-            Base.metadata.create_all(bind=self.engine)
-            logger.info("Tables créées avec succès")
-            
-            # Insérer les données par défaut
-            self._insert_default_data()
-            
+            with self.advisory_lock(SCHEMA_LOCK):
+                self._create_schema()
+                # Insérer les données par défaut
+                self._insert_default_data()
+
         except Exception as e:
             logger.error(f"Erreur lors de la création des tables: {e}")
             raise
-    
+
+    def _create_schema(self):
+        """Créer tables, index, triggers et partitions manquants"""
+        # data_temp est créée partitionnée avant create_all, qui l'ignore alors
+        if db_settings.db_partition_data_temp:
+            self._create_partitioned_data_temp()
+        # Créer toutes les tables
+        Base.metadata.create_all(bind=self.engine)
+        self._create_indexes()
+        self._create_rollup_trigger()
+        self._create_notify_trigger()
+        self._create_parameter_notify_trigger()
+        self.maintain_partitions()
+        logger.info("Tables créées avec succès")
+
+    @contextmanager
+    def advisory_lock(self, name: str):
+        """Verrou consultatif PostgreSQL (bloquant) partagé par tous les processus.
+
+        Tenu par une connexion dédiée le temps du bloc : les workers qui
+        démarrent ensemble créent ainsi le schéma l'un après l'autre.
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": name})
+            # Le verrou est de niveau session : il survit à la fin de la transaction
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": name})
+                conn.commit()
+
+    def run_exclusive(self, name: str, func, *args, **kwargs):
+        """Exécute `func` si aucun autre processus n'exécute la tâche `name`.
+
+        Les tâches de maintenance (partitions, rétention) ne tournent ainsi que
+        dans un seul worker à la fois ; les autres passent leur tour. Retourne
+        le résultat de `func`, ou None si la tâche était déjà en cours ailleurs.
+        """
+        with self.engine.connect() as conn:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": name}
+            ).scalar()
+            if not acquired:
+                logger.debug(f"Tâche {name} déjà en cours dans un autre processus")
+                return None
+            conn.commit()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": name})
+                conn.commit()
+
+    def _create_partitioned_data_temp(self):
+        """Créer data_temp partitionnée si elle n'existe pas encore"""
+        with self.engine.begin() as conn:
+            relkind = self._data_temp_relkind(conn)
+            if relkind is not None:
+                if relkind != 'p':
+                    logger.info(
+                        "data_temp n'est pas partitionnée ; migration : "
+                        "python -m apps.database_configuration --partition-data-temp"
+                    )
+                return
+            _partitioned_data_temp_table().create(bind=conn)
+            logger.info("Table data_temp créée avec partitionnement mensuel")
+
+    @staticmethod
+    def _data_temp_relkind(conn) -> Optional[str]:
+        """Type de la relation data_temp ('p' partitionnée, 'r' classique, None absente)"""
+        return conn.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass('data_temp')"
+        )).scalar()
+
+    def data_temp_is_partitioned(self) -> bool:
+        with self.engine.connect() as conn:
+            return self._data_temp_relkind(conn) == 'p'
+
+    def list_partitions(self) -> list:
+        """Noms des partitions mensuelles attachées à data_temp"""
+        with self.engine.connect() as conn:
+            return self._list_partitions(conn)
+
+    @staticmethod
+    def _list_partitions(conn) -> list:
+        rows = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('data_temp') ORDER BY c.relname"
+        ))
+        return [row[0] for row in rows if PARTITION_NAME_PATTERN.match(row[0])]
+
+    def _ensure_partitions(self, conn, start: datetime.datetime, end: datetime.datetime) -> list:
+        existing = set(self._list_partitions(conn))
+        created = []
+        for month in months_between(start, end):
+            if partition_name(month) not in existing:
+                conn.execute(text(partition_ddl(month)))
+                created.append(partition_name(month))
+        return created
+
+    def ensure_partitions(self, start: datetime.datetime, end: datetime.datetime) -> list:
+        """Créer les partitions mensuelles manquantes entre deux dates"""
+        with self.engine.begin() as conn:
+            created = self._ensure_partitions(conn, start, end)
+        for name in created:
+            logger.info(f"Partition {name} créée")
+        return created
+
+    def drop_partitions_before(self, cutoff: datetime.datetime) -> list:
+        """Détacher puis supprimer les partitions entièrement antérieures à `cutoff`.
+
+        Les agrégats data_temp_minute / data_temp_hour ne sont pas touchés.
+        Retourne pour chaque partition son nom, son nombre de lignes et sa taille.
+        """
+        dropped = []
+        for name in self.list_partitions():
+            year, month = PARTITION_NAME_PATTERN.match(name).groups()
+            if add_months(datetime.datetime(int(year), int(month), 1), 1) > cutoff:
+                continue
+            with self.engine.begin() as conn:
+                rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+                size = conn.execute(text(f"SELECT pg_total_relation_size('{name}')")).scalar()
+                conn.execute(text(f"ALTER TABLE data_temp DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append({"name": name, "rows": rows, "bytes": size})
+            logger.info(f"Partition {name} détachée et supprimée ({rows} lignes)")
+        return dropped
+
+    def drop_expired_partitions(self) -> list:
+        """Supprimer les partitions plus anciennes que la rétention en mois"""
+        if not db_settings.db_partition_retention_months:
+            return []
+        cutoff = add_months(datetime.datetime.now(), -db_settings.db_partition_retention_months)
+        return [partition["name"] for partition in self.drop_partitions_before(cutoff)]
+
+    def maintain_partitions(self) -> dict:
+        """Créer les partitions à venir et supprimer celles qui ont expiré"""
+        try:
+            if not self.data_temp_is_partitioned():
+                return {"created": [], "dropped": []}
+            now = datetime.datetime.now()
+            return {
+                "created": self.ensure_partitions(now, add_months(now, db_settings.db_partition_months_ahead)),
+                "dropped": self.drop_expired_partitions()
+            }
+        except Exception as e:
+            logger.error(f"Erreur lors de la maintenance des partitions: {e}")
+            return {"created": [], "dropped": []}
+
+    def migrate_data_temp_to_partitioned(self):
+        """Convertir une table data_temp classique en table partitionnée.
+
+        L'ancienne table est renommée data_temp_legacy et conservée ; ses lignes
+        sont recopiées dans les partitions mensuelles (écritures bloquées pendant
+        la copie). Les index et le trigger d'agrégation sont ensuite recréés.
+        """
+        column_names = ", ".join(column.name for column in DataTempModel.__table__.columns)
+        with self.engine.begin() as conn:
+            if self._data_temp_relkind(conn) == 'p':
+                logger.info("data_temp est déjà partitionnée")
+                return
+            conn.execute(text("LOCK TABLE data_temp IN ACCESS EXCLUSIVE MODE"))
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence('data_temp', 'id')")).scalar()
+            conn.execute(text("ALTER TABLE data_temp RENAME TO data_temp_legacy"))
+            conn.execute(text("ALTER TABLE data_temp_legacy RENAME CONSTRAINT data_temp_pkey TO data_temp_legacy_pkey"))
+            conn.execute(text("DROP TRIGGER IF EXISTS data_temp_rollup ON data_temp_legacy"))
+            conn.execute(text("DROP TRIGGER IF EXISTS data_temp_notify ON data_temp_legacy"))
+            for index in DataTempModel.__table__.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO data_temp_legacy_id_seq"))
+
+            _partitioned_data_temp_table().create(bind=conn)
+            first, last = conn.execute(text(
+                "SELECT min(date_serveur), max(date_serveur) FROM data_temp_legacy"
+            )).one()
+            now = datetime.datetime.now()
+            self._ensure_partitions(
+                conn, min(first or now, now), add_months(max(last or now, now), db_settings.db_partition_months_ahead)
+            )
+            copied = conn.execute(text(
+                f"INSERT INTO data_temp ({column_names}) "
+                f"SELECT {column_names} FROM data_temp_legacy WHERE date_serveur IS NOT NULL"
+            )).rowcount
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('data_temp', 'id'), "
+                "(SELECT coalesce(max(id), 0) + 1 FROM data_temp_legacy), false)"
+            ))
+            skipped = conn.execute(text(
+                "SELECT count(*) FROM data_temp_legacy WHERE date_serveur IS NULL"
+            )).scalar()
+
+        self._create_indexes()
+        self._create_rollup_trigger()
+        self._create_notify_trigger()
+        logger.info(f"data_temp partitionnée : {copied} lignes recopiées")
+        if skipped:
+            logger.warning(f"{skipped} lignes sans date_serveur laissées dans data_temp_legacy")
+        logger.info("L'ancienne table est conservée : DROP TABLE data_temp_legacy après vérification")
+
+    def _create_indexes(self):
+        """Créer les index manquants sur les tables existantes (create_all ne le fait pas)"""
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=self.engine, checkfirst=True)
+
+    def _create_rollup_trigger(self):
+        """Installer le trigger qui alimente les tables d'agrégats à chaque insertion.
+
+        Le trigger est de niveau instruction (table de transition new_rows) et couvre
+        donc aussi bien les INSERT multi-lignes que les COPY. À sa première
+        installation, les agrégats sont recalculés à partir de l'historique brut
+        encore présent ; ceux des périodes déjà purgées par la rétention sont conservés.
+        """
+        upserts = "\n".join(
+            ROLLUP_UPSERT_SQL.format(table=table, unit=unit, source="new_rows") + ";"
+            for table, unit in ROLLUP_TABLES.items()
+        )
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION data_temp_rollup() RETURNS trigger AS $$
+                BEGIN
+                    {upserts}
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+
+            trigger_exists = conn.execute(text(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgname = 'data_temp_rollup' AND tgrelid = 'data_temp'::regclass"
+            )).first()
+            if trigger_exists:
+                return
+
+            # Bloquer les écritures le temps du recalcul initial
+            conn.execute(text("LOCK TABLE data_temp IN SHARE MODE"))
+            oldest = conn.execute(text("SELECT min(date_serveur) FROM data_temp")).scalar()
+            if oldest is not None:
+                for table, unit in ROLLUP_TABLES.items():
+                    conn.execute(
+                        text(f"DELETE FROM {table} WHERE bucket >= date_trunc('{unit}', CAST(:oldest AS TIMESTAMP))"),
+                        {"oldest": oldest}
+                    )
+                    conn.execute(text(ROLLUP_UPSERT_SQL.format(table=table, unit=unit, source="data_temp")))
+            conn.execute(text("""
+                CREATE TRIGGER data_temp_rollup
+                AFTER INSERT ON data_temp
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION data_temp_rollup()
+            """))
+            logger.info("Trigger d'agrégation data_temp installé et agrégats recalculés")
+
+    def _create_notify_trigger(self):
+        """Installer le trigger qui notifie (NOTIFY) chaque insertion dans data_temp"""
+        with self.engine.begin() as conn:
+            conn.execute(text(DATA_TEMP_NOTIFY_FUNCTION))
+            trigger_exists = conn.execute(text(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgname = 'data_temp_notify' AND tgrelid = 'data_temp'::regclass"
+            )).first()
+            if not trigger_exists:
+                conn.execute(text("""
+                    CREATE TRIGGER data_temp_notify
+                    AFTER INSERT ON data_temp
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION data_temp_notify()
+                """))
+                logger.info("Trigger de notification data_temp installé")
+
+    def _create_parameter_notify_trigger(self):
+        """Installer les triggers qui notifient (NOTIFY) toute modification des paramètres"""
+        with self.engine.begin() as conn:
+            conn.execute(text(PARAMETER_NOTIFY_FUNCTION))
+            for table in PARAMETER_TABLES:
+                trigger_exists = conn.execute(text(
+                    f"SELECT 1 FROM pg_trigger "
+                    f"WHERE tgname = '{table}_notify' AND tgrelid = '{table}'::regclass"
+                )).first()
+                if not trigger_exists:
+                    conn.execute(text(f"""
+                        CREATE TRIGGER {table}_notify
+                        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                        FOR EACH STATEMENT EXECUTE FUNCTION parameter_notify()
+                    """))
+                    logger.info(f"Trigger de notification {table} installé")
+
     def _insert_default_data(self):
         """Insérer les données par défaut"""
         try:
@@ -253,8 +799,11 @@ class DatabaseManager:
         finally:
             session.close()
     
-    def get_raw_connection(self):
-        """Obtenir une connexion psycopg2 brute pour compatibilité"""
+    def get_raw_connection(self, **options):
+        """Obtenir une connexion psycopg2 brute pour compatibilité.
+
+        `options` : paramètres libpq supplémentaires (keepalives...).
+        """
         try:
             conn = psycopg2.connect(
                 host=db_settings.db_host,
@@ -262,7 +811,8 @@ class DatabaseManager:
                 database=db_settings.db_name,
                 user=db_settings.db_user,
                 password=db_settings.db_password,
-                cursor_factory=RealDictCursor  # Retourne des dictionnaires
+                cursor_factory=RealDictCursor,  # Retourne des dictionnaires
+                **options
             )
             return conn
         except Exception as e:
@@ -278,7 +828,7 @@ class DatabaseManager:
         """Vérifier la santé de la base de données"""
         try:
             with self.get_session_context() as session:
-                session.execute("SELECT 1")
+                session.execute(text("SELECT 1"))
                 return True
         except Exception as e:
             logger.error(f"Health check failed: {e}")
@@ -316,8 +866,7 @@ def reset_database():
     """Réinitialiser complètement la base de données (ATTENTION: supprime tout!)"""
     try:
         Base.metadata.drop_all(bind=db_manager.engine)
-        Base.metadata.create_all(bind=db_manager.engine)
-        db_manager._insert_default_data()
+        db_manager._create_tables()
         logger.info("Base de données réinitialisée")
     except Exception as e:
         logger.error(f"Erreur lors de la réinitialisation: {e}")
@@ -330,10 +879,17 @@ def setup_database_logging():
     logging.getLogger('sqlalchemy.pool').setLevel(logging.WARNING)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Configuration de la base de données")
+    parser.add_argument("--partition-data-temp", action="store_true",
+                        help="Convertir data_temp en table partitionnée par mois")
+    args = parser.parse_args()
+
     # Test de la configuration
     setup_database_logging()
     
     try:
+        if args.partition_data_temp:
+            db_manager.migrate_data_temp_to_partitioned()
         init_database()
         print("✅ Configuration de base de données réussie")
         
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Réduction du nombre de points des séries historiques (graphiques).
+
+Largest-Triangle-Three-Buckets (LTTB, S. Steinarsson) : la série est découpée
+en paquets et, dans chaque paquet, on garde le point qui forme le plus grand
+triangle avec le point retenu précédemment et la moyenne du paquet suivant.
+Les pics et les creux sont conservés, ce que ne fait pas une simple moyenne.
+"""
+import numpy as np
+
+# En dessous de 3 points, LTTB n'a pas de sens (premier et dernier points fixes)
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Indices des `n_out` points retenus par LTTB (x croissant, sans NaN)"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+
+    # Bornes des paquets (le premier et le dernier point forment leur propre paquet)
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # Moyenne de chaque paquet, calculée en une fois par sommes cumulées
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    mean_x = (cum_x[ends] - cum_x[starts]) / counts
+    mean_y = (cum_y[ends] - cum_y[starts]) / counts
+    # Pour le paquet i, le point de référence suivant est la moyenne du paquet i + 1
+    # (le dernier point pour le dernier paquet)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        # Double de l'aire des triangles (précédent, candidat, moyenne suivante)
+        areas = np.abs(
+            (x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def even_indices(n: int, n_out: int) -> np.ndarray:
+    """Indices de `n_out` points régulièrement espacés parmi `n` (le dernier toujours inclus)"""
+    if n_out >= n:
+        return np.arange(n)
+    if n_out <= 1:
+        return np.arange(n - 1, n) if n_out == 1 else np.arange(0)
+    return np.unique(np.linspace(0, n - 1, n_out).round().astype(np.int64))
+
+
+def downsample_indices(x, series, groups, max_points: int) -> np.ndarray:
+    """Indices (triés) des lignes à conserver, `max_points` au plus.
+
+    `x` : abscisses (numériques, croissantes au sein d'un groupe) ;
+    `series` : colonnes de valeurs à préserver (None ou NaN : ignorées) ;
+    `groups` : identifiant de série (capteur) de chaque ligne.
+
+    Le budget est partagé entre les groupes puis entre les colonnes : LTTB est
+    appliqué à chaque colonne et les points retenus sont réunis, pour que les
+    extrêmes de chaque courbe restent visibles. Si la part d'une colonne est
+    trop petite pour LTTB, le groupe est réduit à des points régulièrement
+    espacés. Avec plus de groupes que `max_points`, seuls les `max_points`
+    premiers (ordre de tri) sont conservés, réduits à leur dernier point.
+    """
+    groups = np.asarray(groups)
+    if len(groups) <= max_points:
+        return np.arange(len(groups))
+    x = np.asarray(x, dtype=float)
+    series = [np.asarray(values, dtype=float) for values in series]
+
+    names = np.unique(groups)[:max_points]
+    per_group = max_points // len(names)
+    per_series = per_group // max(len(series), 1)
+
+    kept = []
+    for name in names:
+        rows = np.flatnonzero(groups == name)
+        if len(rows) <= per_group:
+            kept.append(rows)
+            continue
+        if not series or per_series < MIN_POINTS:
+            kept.append(rows[even_indices(len(rows), per_group)])
+            continue
+        for values in series:
+            valid = rows[~np.isnan(values[rows])]
+            if len(valid):
+                kept.append(valid[lttb_indices(x[valid], values[valid], per_series)])
+    if not kept:
+        return np.arange(0)
+    return np.unique(np.concatenate(kept))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+
+from apps import post_temp_humidity
+from apps.async_db import run_db
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class IngestionBufferFull(Exception):
+    """Levée lorsque la file d'ingestion a atteint sa capacité maximale"""
+
+
+class IngestionBuffer:
+    """File d'ingestion en mémoire avec écriture différée (write-behind) par lots"""
+
+    def __init__(self, max_frames: int, batch_rows: int, flush_interval: float,
+                 retry_delay: float = 1.0, shutdown_timeout: float = 20.0, journal=None):
+        self.max_frames = max_frames
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.shutdown_timeout = shutdown_timeout
+        # Journal disque (IngestionJournal) utilisé quand la base est injoignable
+        self.journal = journal
+        self._db_unavailable_until = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_frames)
+        self._task = None
+        # Lot en cours de constitution ou d'écriture (None une fois enregistré)
+        self._current = None
+        self._closing = False
+        self._frames_accepted = 0
+        self._frames_rejected = 0
+        self._rows_flushed = 0
+        self._flush_failures = 0
+        self._rows_journaled = 0
+        self._rows_rejected = 0
+
+    def submit(self, rows):
+        """Ajoute les lignes d'une trame à la file (lève IngestionBufferFull si pleine)"""
+        if self._closing:
+            raise IngestionBufferFull("Arrêt en cours, trame refusée")
+        try:
+            self._queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self._frames_rejected += 1
+            raise IngestionBufferFull(f"File d'ingestion pleine ({self.max_frames} trames)")
+        self._frames_accepted += 1
+
+    async def start(self):
+        """Démarre la tâche de vidage en arrière-plan"""
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name="ingestion-buffer")
+        logger.info(
+            f"File d'ingestion démarrée (capacité={self.max_frames} trames, "
+            f"lot={self.batch_rows} lignes, intervalle={self.flush_interval}s)"
+        )
+
+    async def stop(self):
+        """Refuse les nouvelles trames puis vide la file avant l'arrêt.
+
+        Au-delà de `shutdown_timeout` (à garder sous le graceful_timeout de
+        gunicorn), le lot en cours et les trames restantes sont écrits dans le
+        journal, rejoué au prochain démarrage. Un lot dont l'insertion était
+        en cours peut alors être enregistré deux fois.
+        """
+        self._closing = True
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=self.shutdown_timeout)
+            except asyncio.TimeoutError:
+                self._journal_remaining()
+            self._task = None
+        logger.info("File d'ingestion arrêtée")
+
+    def _journal_remaining(self):
+        """Écrit dans le journal (appel bloquant, à l'arrêt) les lignes non enregistrées"""
+        rows = list(self._current or [])
+        while not self._queue.empty():
+            rows.extend(self._queue.get_nowait())
+        self._current = None
+        if not rows:
+            return
+        if self.journal is not None:
+            try:
+                self.journal.append(rows)
+                self._rows_journaled += len(rows)
+                logger.warning(f"Vidage de la file d'ingestion interrompu: {len(rows)} ligne(s) écrites dans le journal")
+                return
+            except OSError as e:
+                logger.error(f"Échec d'écriture dans le journal: {e}")
+        logger.error(f"Vidage de la file d'ingestion interrompu: {len(rows)} ligne(s) non enregistrée(s)")
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "queued_frames": self._queue.qsize(),
+            "max_frames": self.max_frames,
+            "frames_accepted": self._frames_accepted,
+            "frames_rejected": self._frames_rejected,
+            "rows_flushed": self._rows_flushed,
+            "rows_journaled": self._rows_journaled,
+            "rows_rejected": self._rows_rejected,
+            "flush_failures": self._flush_failures
+        }
+
+    async def _next_batch(self):
+        """Regroupe des trames jusqu'à batch_rows lignes ou flush_interval secondes"""
+        rows = self._current = []
+        deadline = None
+        while len(rows) < self.batch_rows:
+            if deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            try:
+                frame = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if rows or self._closing:
+                    break
+                continue
+            rows.extend(frame)
+            self._queue.task_done()
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return rows
+
+    async def _flush(self, rows):
+        """Écrit un lot en base, ou dans le journal disque si la base est injoignable.
+
+        Les lignes refusées par la base (valeur hors limites...) ne sont pas
+        journalisées : elles le seraient indéfiniment. Elles sont mises en
+        quarantaine avec le journal, ou seulement signalées dans les logs.
+        """
+        while True:
+            if time.monotonic() >= self._db_unavailable_until:
+                try:
+                    rejected = await run_db(post_temp_humidity.insert_data_batch, rows)
+                except post_temp_humidity.DatabaseUnavailable:
+                    self._flush_failures += 1
+                    self._db_unavailable_until = time.monotonic() + self.retry_delay
+                else:
+                    self._current = None
+                    self._rows_flushed += len(rows) - len(rejected)
+                    if rejected:
+                        self._rows_rejected += len(rejected)
+                        await self._quarantine(rejected)
+                    return
+            if self.journal is not None:
+                try:
+                    await asyncio.to_thread(self.journal.append, rows)
+                    self._current = None
+                    self._rows_journaled += len(rows)
+                    return
+                except OSError as e:
+                    logger.error(f"Échec d'écriture dans le journal: {e}")
+            logger.warning(f"Échec d'écriture d'un lot de {len(rows)} lignes, nouvel essai dans {self.retry_delay}s")
+            await asyncio.sleep(self.retry_delay)
+
+    async def _quarantine(self, rejected):
+        if self.journal is None:
+            return
+        try:
+            await asyncio.to_thread(self.journal.quarantine, "ingestion", rejected)
+        except OSError as e:
+            logger.error(f"Échec d'écriture de la quarantaine ({len(rejected)} lignes perdues): {e}")
+
+    async def _run(self):
+        while not (self._closing and self._queue.empty()):
+            rows = await self._next_batch()
+            if rows:
+                await self._flush(rows)
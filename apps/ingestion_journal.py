@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from apps import post_temp_humidity
+from apps.async_db import run_db
+from apps.database_configuration import db_manager
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# En-tête d'un enregistrement : longueur du JSON + CRC32 (big-endian)
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+OFFSET_SUFFIX = ".offset"
+# Lignes refusées par la base (une ligne JSON chacune), à corriger puis réimporter
+QUARANTINE_FILE = "quarantine.jsonl"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def _encode_rows(rows) -> bytes:
+    """Sérialise les lignes d'un lot (les dates en ISO 8601)"""
+    return json.dumps(rows, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_rows(payload: bytes):
+    """Désérialise un lot et reconstruit les dates"""
+    rows = json.loads(payload)
+    for row in rows:
+        if row.get('date_serveur'):
+            row['date_serveur'] = datetime.datetime.fromisoformat(row['date_serveur'])
+    return rows
+
+
+class IngestionJournal:
+    """Journal local en ajout seul, découpé en segments par fenêtre de temps.
+
+    Chaque enregistrement est un lot de lignes data_temp en JSON, préfixé par sa
+    longueur et son CRC32. Un fichier .offset à côté de chaque segment mémorise
+    la position déjà rejouée en base (rejeu au moins une fois).
+
+    Plusieurs workers peuvent partager le répertoire : chacun écrit dans ses
+    propres segments (pid dans le nom), verrouillés (flock) tant qu'ils sont
+    ouverts. Un segment n'est rejoué que par le worker qui obtient son verrou.
+    """
+
+    def __init__(self, directory: str, segment_seconds: int, fsync_every: int, fsync_interval: float):
+        self.directory = Path(directory)
+        self.segment_seconds = segment_seconds
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_path = None
+        self._segment_opened_at = 0.0
+        self._unsynced_records = 0
+        self._last_fsync = time.monotonic()
+        self._rows_journaled = 0
+        self._rows_quarantined = 0
+
+    # --- Écriture ---
+
+    def append(self, rows):
+        """Ajoute un lot de lignes au segment courant"""
+        payload = _encode_rows(rows)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._file is None or time.time() - self._segment_opened_at >= self.segment_seconds:
+                self._rotate()
+            self._file.write(record)
+            self._file.flush()
+            self._unsynced_records += 1
+            self._rows_journaled += len(rows)
+            self._sync_if_due()
+
+    def sync(self):
+        """Force l'écriture sur disque des enregistrements en attente"""
+        with self._lock:
+            self._fsync()
+
+    def sync_if_due(self):
+        """fsync groupé : déclenché par nombre d'enregistrements ou par délai"""
+        with self._lock:
+            self._sync_if_due()
+
+    def close_segment(self):
+        """Ferme le segment courant pour qu'il puisse être rejoué"""
+        with self._lock:
+            self._close()
+
+    def _sync_if_due(self):
+        if not self._unsynced_records:
+            return
+        if (self._unsynced_records >= self.fsync_every
+                or time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self._fsync()
+
+    def _fsync(self):
+        if self._file is not None and self._unsynced_records:
+            os.fsync(self._file.fileno())
+        self._unsynced_records = 0
+        self._last_fsync = time.monotonic()
+
+    def _close(self):
+        if self._file is not None:
+            self._fsync()
+            self._file.close()
+            self._file = None
+            self._segment_path = None
+
+    def _rotate(self):
+        self._close()
+        self._segment_opened_at = time.time()
+        name = f"segment-{time.time_ns()}-{os.getpid()}"
+        # Verrouillé avant de recevoir son nom définitif : un autre worker ne
+        # peut pas le prendre pour un segment fermé
+        opening_path = self.directory / f"{name}.open"
+        self._file = open(opening_path, "ab")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        self._segment_path = self.directory / f"{name}{SEGMENT_SUFFIX}"
+        os.rename(opening_path, self._segment_path)
+        # Rendre l'entrée du répertoire durable
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        logger.info(f"Nouveau segment de journal: {self._segment_path.name}")
+
+    # --- Lecture / rejeu ---
+
+    def closed_segments(self):
+        """Segments fermés par ce processus, ou ouverts par un autre, du plus ancien au plus récent"""
+        with self._lock:
+            current = self._segment_path
+        return sorted(
+            path for path in self.directory.glob(f"*{SEGMENT_SUFFIX}") if path != current
+        )
+
+    def has_pending(self) -> bool:
+        """Indique s'il reste des lots à rejouer"""
+        with self._lock:
+            if self._file is not None:
+                return True
+        return any(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def quarantine(self, source: str, rejected):
+        """Écarte les lignes refusées par la base : (ligne, erreur) ajoutés à quarantine.jsonl.
+
+        Chaque ligne est écrite en un seul appel en mode ajout : les workers qui
+        partagent le répertoire peuvent écrire dans le même fichier.
+        """
+        lines = b"".join(
+            json.dumps(
+                {"source": source, "error": error, "row": row},
+                default=_json_default, separators=(",", ":")
+            ).encode("utf-8") + b"\n"
+            for row, error in rejected
+        )
+        fd = os.open(self.directory / QUARANTINE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, lines)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._rows_quarantined += len(rejected)
+        logger.warning(f"{len(rejected)} ligne(s) refusée(s) mises en quarantaine ({source})")
+
+    @staticmethod
+    def claim(segment: Path):
+        """Verrouille un segment pour le rejouer (fichier à fermer ensuite).
+
+        Retourne None si le segment est encore ouvert en écriture ou rejoué par
+        un autre worker, ou s'il a déjà été supprimé.
+        """
+        try:
+            f = open(segment, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Rejoué et supprimé par un autre worker entre l'ouverture et le verrou
+            if os.fstat(f.fileno()).st_ino != os.stat(segment).st_ino:
+                raise FileNotFoundError(segment)
+        except (BlockingIOError, FileNotFoundError):
+            f.close()
+            return None
+        return f
+
+    @staticmethod
+    def read_offset(segment: Path) -> int:
+        offset_path = segment.with_suffix(OFFSET_SUFFIX)
+        try:
+            return int(offset_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @staticmethod
+    def write_offset(segment: Path, offset: int):
+        """Enregistre atomiquement la position rejouée"""
+        offset_path = segment.with_suffix(OFFSET_SUFFIX)
+        tmp_path = offset_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, offset_path)
+
+    @staticmethod
+    def remove_segment(segment: Path):
+        segment.with_suffix(OFFSET_SUFFIX).unlink(missing_ok=True)
+        segment.unlink(missing_ok=True)
+
+    @staticmethod
+    def read_records(segment: Path, offset: int):
+        """Itère sur (offset_suivant, lignes) à partir d'une position.
+
+        Un enregistrement tronqué ou corrompu (arrêt brutal pendant l'écriture)
+        termine la lecture du segment.
+        """
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.error(f"Enregistrement corrompu dans {segment.name} à l'offset {offset}, fin du segment")
+                    return
+                offset += RECORD_HEADER.size + length
+                yield offset, _decode_rows(payload)
+
+    def stats(self) -> dict:
+        segments = list(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+        return {
+            "segments": len(segments),
+            "bytes": sum(path.stat().st_size for path in segments),
+            "rows_journaled": self._rows_journaled,
+            "rows_quarantined": self._rows_quarantined
+        }
+
+
+class JournalReplayer:
+    """Rejoue le journal en base dès que la base de données est de nouveau disponible"""
+
+    def __init__(self, journal: IngestionJournal, batch_rows: int, rows_per_second: float,
+                 check_interval: float = 5.0):
+        self.journal = journal
+        self.batch_rows = batch_rows
+        self.rows_per_second = rows_per_second
+        self.check_interval = check_interval
+        self._task = None
+        self._rows_replayed = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="journal-replay")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.journal.close_segment)
+
+    def stats(self) -> dict:
+        return {**self.journal.stats(), "rows_replayed": self._rows_replayed}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.journal.sync_if_due)
+                if self.journal.has_pending() and await run_db(db_manager.health_check):
+                    await asyncio.to_thread(self.journal.close_segment)
+                    await self._replay_closed_segments()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur lors du rejeu du journal: {e}", exc_info=True)
+            await asyncio.sleep(self.check_interval)
+
+    async def _replay_closed_segments(self):
+        for segment in self.journal.closed_segments():
+            claim = await asyncio.to_thread(self.journal.claim, segment)
+            if claim is None:
+                continue
+            try:
+                if not await self._replay_segment(segment):
+                    return
+            finally:
+                claim.close()
+
+    async def _replay_segment(self, segment: Path) -> bool:
+        """Rejoue un segment par lots, avec limitation de débit"""
+        offset = self.journal.read_offset(segment)
+        records = self.journal.read_records(segment, offset)
+        batch, batch_end = [], offset
+        pending = None
+        try:
+            while True:
+                # Lecture protégée de l'annulation : le générateur ne doit pas
+                # être fermé pendant qu'un thread l'exécute encore
+                pending = asyncio.ensure_future(asyncio.to_thread(next, records, None))
+                record = await asyncio.shield(pending)
+                if record is not None:
+                    batch_end, rows = record
+                    batch.extend(rows)
+                if batch and (record is None or len(batch) >= self.batch_rows):
+                    try:
+                        rejected = await run_db(post_temp_humidity.insert_data_batch, batch)
+                    except post_temp_humidity.DatabaseUnavailable:
+                        logger.warning(f"Rejeu interrompu ({segment.name}), base de données indisponible")
+                        return False
+                    # Lignes que la base refusera toujours : écartées, le rejeu continue
+                    if rejected:
+                        await asyncio.to_thread(self.journal.quarantine, segment.name, rejected)
+                    await asyncio.to_thread(self.journal.write_offset, segment, batch_end)
+                    self._rows_replayed += len(batch) - len(rejected)
+                    # Limitation de débit pour ne pas affamer le trafic temps réel
+                    await asyncio.sleep(len(batch) / self.rows_per_second)
+                    batch = []
+                if record is None:
+                    break
+        finally:
+            if pending is not None and not pending.done():
+                # Annulation (arrêt) pendant une lecture : attendre sa fin avant
+                # de fermer ; l'annulation est ensuite propagée
+                await asyncio.wait([pending])
+            records.close()
+        await asyncio.to_thread(self.journal.remove_segment, segment)
+        logger.info(f"Segment de journal rejoué et supprimé: {segment.name}")
+        return True
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import func
+
+from apps.database_configuration import db_manager, DataTempModel, DataTempHourModel, NOTIFY_COLUMNS
+from apps.sliding_window import SlidingWindowMax
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _row_from_model(row) -> dict:
+    return {column: getattr(row, column) for column in NOTIFY_COLUMNS}
+
+
+def _row_from_notification(values) -> dict:
+    row = dict(zip(NOTIFY_COLUMNS, values))
+    # json_build_array sérialise 50.0 en 50
+    for column in ('temperature', 'humidity', 'average_temperature', 'average_humidity'):
+        if row[column] is not None:
+            row[column] = float(row[column])
+    if row['date_serveur']:
+        row['date_serveur'] = datetime.datetime.fromisoformat(row['date_serveur'])
+    return row
+
+
+class LiveState:
+    """État courant des capteurs, tenu en mémoire pour /getdata et /WeatherData.
+
+    L'état est chargé depuis la base au démarrage (et à chaque reconnexion de
+    l'écouteur), puis mis à jour par les notifications du trigger data_temp_notify,
+    émises à chaque insertion quel que soit le worker qui a écrit.
+    """
+
+    def __init__(self, window_days: int = 7):
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Dernière ligne insérée (id le plus élevé) et dernière ligne de chaque capteur
+        self._latest = None
+        self._sensors = {}
+        # Maxima glissants sur la fenêtre, par période horaire
+        self._max_temperature = SlidingWindowMax()
+        self._max_humidity = SlidingWindowMax()
+        self._events = 0
+        self._reloads = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def window_start(self) -> datetime.datetime:
+        """Début de la fenêtre : minuit, il y a `window_days` jours (comme get_weather_data)"""
+        first_day = datetime.date.today() - datetime.timedelta(days=self.window_days)
+        return datetime.datetime.combine(first_day, datetime.time.min)
+
+    def load(self) -> bool:
+        """Recharge l'état depuis la base de données (appel bloquant)"""
+        try:
+            with db_manager.get_session_context() as session:
+                latest = session.query(DataTempModel).order_by(DataTempModel.id.desc()).first()
+                sensors = []
+                if latest and latest.date_serveur:
+                    # Dernière ligne de chaque capteur actif dans les 24 h précédant la dernière trame
+                    sensors = session.query(DataTempModel).filter(
+                        DataTempModel.date_serveur >= latest.date_serveur - datetime.timedelta(days=1)
+                    ).order_by(DataTempModel.sensor, DataTempModel.id.desc()).distinct(DataTempModel.sensor).all()
+                maxima = session.query(
+                    DataTempHourModel.bucket,
+                    func.max(DataTempHourModel.max_temperature),
+                    func.max(DataTempHourModel.max_humidity)
+                ).filter(
+                    DataTempHourModel.bucket >= self.window_start()
+                ).group_by(DataTempHourModel.bucket).order_by(DataTempHourModel.bucket).all()
+
+                with self._lock:
+                    self._latest = _row_from_model(latest) if latest else None
+                    self._sensors = {row.sensor: _row_from_model(row) for row in sensors}
+                    self._max_temperature.clear()
+                    self._max_humidity.clear()
+                    for bucket, temperature, humidity in maxima:
+                        self._max_temperature.add(bucket, temperature)
+                        self._max_humidity.add(bucket, humidity)
+                    self._loaded = True
+                    self._reloads += 1
+            logger.info(f"État courant chargé ({len(sensors)} capteurs)")
+            return True
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement de l'état courant: {e}")
+            return False
+
+    def handle_notification(self, payload: str):
+        """Applique une notification data_temp_notify"""
+        event = json.loads(payload)
+        if event.get('resync'):
+            self.load()
+            return
+        rows = [_row_from_notification(values) for values in event['sensors']]
+        with self._lock:
+            self._events += 1
+            for row in rows:
+                current = self._sensors.get(row['sensor'])
+                if current is None or row['id'] > current['id']:
+                    self._sensors[row['sensor']] = row
+                if self._latest is None or row['id'] > self._latest['id']:
+                    self._latest = row
+            start = self.window_start()
+            for bucket, temperature, humidity in event['maxima']:
+                bucket = datetime.datetime.fromisoformat(bucket)
+                if bucket >= start:
+                    self._max_temperature.add(bucket, temperature)
+                    self._max_humidity.add(bucket, humidity)
+
+    def last_data(self) -> Optional[dict]:
+        """Équivalent en mémoire de post_temp_humidity.get_last_data()"""
+        latest = self._latest
+        if latest is None:
+            return None
+        return {
+            'average_temperature': latest['average_temperature'],
+            'average_humidity': latest['average_humidity']
+        }
+
+    def weather_data(self) -> dict:
+        """Équivalent en mémoire de post_temp_humidity.get_weather_data(),
+        complété par la dernière mesure de chaque capteur (sensor_data)"""
+        with self._lock:
+            latest = self._latest
+            sensors = sorted(self._sensors.values(), key=lambda row: row['sensor'])
+            start = self.window_start()
+            max_temperature = self._max_temperature.max(start)
+            max_humidity = self._max_humidity.max(start)
+
+        data_send = {}
+        if latest:
+            data_send = {
+                'id': latest['id'],
+                'average_temperature': latest['average_temperature'],
+                'average_humidity': latest['average_humidity']
+            }
+        data_send.update({
+            'temperature': max_temperature,
+            'humidity': max_humidity,
+            'sensor_data': [
+                {
+                    'sensor': row['sensor'],
+                    'temperature': row['temperature'],
+                    'humidity': row['humidity'],
+                    'date_serveur': row['date_serveur']
+                }
+                for row in sensors
+            ]
+        })
+        return data_send
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "loaded": self._loaded,
+            "latest_id": self._latest['id'] if self._latest else None,
+            "sensors": len(self._sensors),
+            "window_buckets": len(self._max_temperature),
+            "events": self._events,
+            "reloads": self._reloads
+        }
+
+
+# Instance globale de l'état courant
+live_state = LiveState()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from apps.database_configuration import db_manager, ParameterDataModel, StepperModel
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ParameterSnapshot(NamedTuple):
+    """Paramètres d'incubation (dernière ligne de parameter_data et de stepper).
+
+    Immuable : un changement de paramètres produit un nouvel instantané, qui
+    remplace l'ancien d'une seule affectation. Les champs valent None tant
+    qu'aucun paramètre n'a été enregistré.
+    """
+    id: Optional[int] = None
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+    start_date: Optional[datetime.datetime] = None
+    stat_stepper: Optional[bool] = None
+    number_stepper: Optional[int] = None
+    espece: Optional[str] = None
+    timetoclose: Optional[int] = None
+    stepper_start: Optional[datetime.time] = None
+    stepper_status: Optional[bool] = None
+
+    @property
+    def exists(self) -> bool:
+        return self.id is not None
+
+    def as_dict(self) -> dict:
+        """Format de /api/parameter"""
+        return {
+            'id': self.id,
+            'temperature': self.temperature,
+            'humidity': self.humidity,
+            'start_date': str(self.start_date),
+            'stat_stepper': self.stat_stepper,
+            'number_stepper': self.number_stepper,
+            'espece': self.espece,
+            'timetoclose': self.timetoclose
+        }
+
+
+class ParameterState:
+    """Instantané des paramètres en mémoire, partagé par les requêtes.
+
+    Rechargé au démarrage (connexion de l'écouteur NOTIFY), après chaque
+    enregistrement de paramètres dans ce processus et à chaque notification
+    parameter_changes (enregistrement fait par un autre worker). Au-delà de
+    `max_age`, l'instantané est relu même si l'écouteur se dit connecté : une
+    connexion coupée sans être fermée (réseau, bascule) ne notifie plus rien
+    jusqu'à ce que les keepalives TCP la déclarent morte.
+    """
+
+    def __init__(self, max_age: float = 60):
+        self.max_age = max_age
+        self._snapshot = None
+        self._loaded_at = None
+        # Sérialise les rechargements : un instantané ancien ne remplace pas un plus récent
+        self._load_lock = threading.Lock()
+        self._loads = 0
+        self._reads = 0
+
+    def load(self):
+        """Relit les paramètres en base et remplace l'instantané (None en cas d'erreur)"""
+        try:
+            with self._load_lock:
+                with db_manager.get_session_context() as session:
+                    parameter = session.query(ParameterDataModel).order_by(ParameterDataModel.id.desc()).first()
+                    stepper = session.query(StepperModel).order_by(StepperModel.id.desc()).first()
+                    values = {}
+                    if parameter:
+                        values.update(
+                            id=parameter.id,
+                            temperature=parameter.temperature,
+                            humidity=parameter.humidity,
+                            start_date=parameter.start_date,
+                            stat_stepper=parameter.stat_stepper,
+                            number_stepper=parameter.number_stepper,
+                            espece=parameter.espece,
+                            timetoclose=parameter.timetoclose
+                        )
+                    if stepper:
+                        values.update(stepper_start=stepper.start_date, stepper_status=stepper.status)
+                snapshot = ParameterSnapshot(**values)
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+                self._loads += 1
+            logger.info("Instantané des paramètres rechargé")
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement des paramètres: {e}")
+            return None
+
+    def handle_notification(self, payload: str = None):
+        """Notification parameter_changes (ou reconnexion de l'écouteur)"""
+        self.load()
+
+    @property
+    def fresh(self) -> bool:
+        """Vrai si l'instantané peut être lu sans accès à la base"""
+        if self._snapshot is None or not self._snapshot.exists:
+            return False
+        return time.monotonic() - self._loaded_at <= self.max_age
+
+    def get(self):
+        """Instantané courant, rechargé s'il n'est plus sûr (None si la base est indisponible)"""
+        self._reads += 1
+        if self.fresh:
+            return self._snapshot
+        return self.load() or self._snapshot
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "loaded": self._snapshot is not None,
+            "fresh": self.fresh,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            "loads": self._loads,
+            "reads": self._reads
+        }
+
+
+# Instance globale des paramètres en mémoire
+parameter_state = ParameterState()
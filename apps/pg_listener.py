@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import logging
+import select
+import threading
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from apps.database_configuration import db_manager
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keepalives TCP de la connexion d'écoute : elle ne fait que recevoir, une
+# coupure réseau silencieuse serait sinon invisible (aucune erreur de lecture)
+LISTENER_KEEPALIVES = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3
+}
+
+
+class PgListener:
+    """Écoute de canaux PostgreSQL LISTEN/NOTIFY dans un thread dédié.
+
+    Chaque processus (worker uvicorn) a son propre écouteur : une écriture faite
+    par n'importe quel worker est ainsi vue par tous. Les fonctions abonnées sont
+    appelées dans le thread de l'écouteur avec la charge utile (str) de la
+    notification. Après chaque (re)connexion, les fonctions `on_connect` sont
+    appelées pour resynchroniser ce qui a pu être manqué pendant la coupure.
+    """
+
+    def __init__(self, reconnect_delay: float = 5.0, poll_timeout: float = 1.0):
+        self.reconnect_delay = reconnect_delay
+        self.poll_timeout = poll_timeout
+        self._handlers = {}
+        self._connect_handlers = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._connected = False
+        self._notifications = 0
+        self._reconnections = 0
+
+    def subscribe(self, channel: str, callback):
+        """Abonne une fonction à un canal (à appeler avant start)"""
+        self._handlers.setdefault(channel, []).append(callback)
+
+    def on_connect(self, callback):
+        """Fonction appelée après chaque connexion, une fois les LISTEN actifs"""
+        self._connect_handlers.append(callback)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+        logger.info(f"Écoute LISTEN/NOTIFY démarrée ({', '.join(self._handlers)})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_timeout + 1)
+            self._thread = None
+        logger.info("Écoute LISTEN/NOTIFY arrêtée")
+
+    @property
+    def connected(self) -> bool:
+        """Vrai tant que les LISTEN sont actifs (aucune notification manquée)"""
+        return self._connected
+
+    def stats(self) -> dict:
+        return {
+            "connected": self._connected,
+            "notifications": self._notifications,
+            "reconnections": self._reconnections
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = db_manager.get_raw_connection(**LISTENER_KEEPALIVES)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    for channel in self._handlers:
+                        cursor.execute(f"LISTEN {channel}")
+                for callback in self._connect_handlers:
+                    callback()
+                # Connecté seulement une fois l'état resynchronisé par les on_connect
+                self._connected = True
+                self._listen(conn)
+            except Exception as e:
+                logger.error(f"Écoute LISTEN/NOTIFY interrompue: {e}")
+            finally:
+                self._connected = False
+                db_manager.close_connection(conn)
+            if not self._stop.wait(self.reconnect_delay):
+                self._reconnections += 1
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._notifications += 1
+                for callback in self._handlers.get(notify.channel, []):
+                    try:
+                        callback(notify.payload)
+                    except Exception as e:
+                        logger.error(f"Erreur dans le traitement d'une notification {notify.channel}: {e}")
+
+
+# Instance globale de l'écouteur
+pg_listener = PgListener()
@@ -1,57 +1,179 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
 import logging
-from sqlalchemy import func
+from sqlalchemy import func, insert, cast, literal_column, TIMESTAMP
+from sqlalchemy.exc import DataError, IntegrityError
 from apps.database_configuration import (
     db_manager, 
     DataTempModel, 
+    DataTempMinuteModel,
+    DataTempHourModel,
     StepperModel, 
-    ParameterDataModel
+    ParameterDataModel,
+    read_watermark
 )
+from apps.downsampling import downsample_indices
+from apps.data_version import data_version, DATA, PARAMETER
+from apps.query_cache import query_cache
+from apps.parameter_state import parameter_state
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_status(value):
+    """Convertit un statut reçu de l'ESP32 ("ON", "true", 1...) en booléen"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("on", "true", "1", "yes")
+    return bool(value)
+
+
+def _build_row(data_to_insert, default_date):
+    """Prépare une ligne data_temp à partir des données reçues"""
+    return {
+        'sensor': data_to_insert['sensor'],
+        'temperature': data_to_insert['temperature'],
+        'humidity': data_to_insert['humidity'],
+        'date_serveur': data_to_insert.get('date_serveur', default_date),
+        'average_temperature': data_to_insert['average_temperature'],
+        'average_humidity': data_to_insert['average_humidity'],
+        'fan_status': parse_status(data_to_insert['fan_status']),
+        'humidifier_status': parse_status(data_to_insert['humidifier_status']),
+        'numfailedsensors': data_to_insert['numfailedsensors']
+    }
+
+
 def add_data(data_to_insert):
+    return add_data_batch([data_to_insert])
+
+
+class DatabaseUnavailable(Exception):
+    """Base de données injoignable (connexion perdue, serveur arrêté...) : le lot est à réessayer"""
+
+
+# Erreurs propres aux lignes (valeur hors limites, contrainte violée) : les
+# réessayer ne sert à rien, contrairement à une coupure de la base
+ROW_ERRORS = (DataError, IntegrityError, KeyError, TypeError, ValueError)
+
+
+def _insert_rows(values):
+    with db_manager.get_session_context() as session:
+        session.execute(insert(DataTempModel).values(values))
+
+
+def insert_data_batch(rows):
+    """Insère un lot de lignes data_temp et retourne les lignes refusées.
+
+    Le lot est inséré en une seule transaction (INSERT multi-lignes). Si la base
+    refuse des données (DataError, IntegrityError), il est réinséré ligne par
+    ligne : les lignes valides sont enregistrées, les autres retournées avec le
+    message d'erreur, sous forme de couples (ligne, erreur). Toute autre erreur
+    (connexion perdue...) lève DatabaseUnavailable : rien n'est à écarter.
+    """
+    if not rows:
+        return []
+    now = datetime.datetime.now()
+    rejected = []
     try:
-        with db_manager.get_session_context() as session:
-            new_data = DataTempModel(
-                sensor=data_to_insert['sensor'],
-                temperature=data_to_insert['temperature'],
-                humidity=data_to_insert['humidity'],
-                date_serveur=data_to_insert.get('date_serveur', datetime.datetime.now()),
-                average_temperature=data_to_insert['average_temperature'],
-                average_humidity=data_to_insert['average_humidity'],
-                fan_status=data_to_insert['fan_status'],
-                humidifier_status=data_to_insert['humidifier_status'],
-                numfailedsensors=data_to_insert['numfailedsensors']
-            )
-            session.add(new_data)
-            logger.info("Données insérées avec succès dans la table data_temp.")
-            return True
+        try:
+            _insert_rows([_build_row(row, now) for row in rows])
+            inserted = len(rows)
+        except ROW_ERRORS as e:
+            logger.warning(f"Lot de {len(rows)} lignes refusé ({type(e).__name__}), insertion ligne par ligne")
+            inserted = 0
+            for row in rows:
+                try:
+                    _insert_rows([_build_row(row, now)])
+                    inserted += 1
+                except ROW_ERRORS as row_error:
+                    rejected.append((row, str(row_error).splitlines()[0] if str(row_error) else type(row_error).__name__))
     except Exception as e:
         logger.error(f"Erreur lors de l'insertion des données: {e}")
+        raise DatabaseUnavailable(str(e)) from e
+    if inserted:
+        # Après le commit : une réponse portant la nouvelle version contient la trame
+        data_version.bump(DATA)
+        logger.info(f"{inserted} ligne(s) insérée(s) avec succès dans la table data_temp.")
+    for row, error in rejected:
+        logger.error(f"Ligne refusée par la base (capteur {str(row.get('sensor'))[:100]}): {error}")
+    return rejected
+
+
+def add_data_batch(rows):
+    """Insère toutes les lignes d'une trame ; faux si la base est injoignable ou si une ligne est refusée"""
+    try:
+        return not insert_data_batch(rows)
+    except DatabaseUnavailable:
         return False
 
 
 def post_stepper_status():
     try:
-        with db_manager.get_session_context() as session:
-            # Récupérer les derniers paramètres
-            parameter = session.query(ParameterDataModel).order_by(ParameterDataModel.id.desc()).first()
-            stepper = session.query(StepperModel).order_by(StepperModel.id.desc()).first()
+        # Derniers paramètres, lus dans l'instantané en mémoire
+        parameter = parameter_state.get()
+        
+        current_status = "OFF"
+        if parameter and parameter.stat_stepper:
+            current_status = "ON"
             
-            current_status = "OFF"
-            if parameter and parameter.stat_stepper:
-                current_status = "ON"
-                
-            return current_status
+        return current_status
             
     except Exception as e:
         logger.error(f"Erreur lors de la récupération du status stepper: {e}")
         return "OFF"
 
+
+def compute_device_command(set_temperature, set_humidity, start_date, stat_stepper,
+                           average_temperature, average_humidity, now=None):
+    """Commande ventilateur / humidificateur / moteur à partir des consignes.
+
+    Reprend la régulation de post_temp_humidity2.get_last_data : chauffe tant que
+    la moyenne est sous la consigne, consigne d'humidité relevée de 10 % à partir
+    du 20e jour d'incubation. Sans mesure, tout reste à "OFF".
+    """
+    now = now or datetime.datetime.now()
+    set_temperature = set_temperature or 37.3
+    set_humidity = set_humidity or 45
+    if start_date and now - start_date >= datetime.timedelta(days=20):
+        set_humidity += 10
+
+    fan = "OFF"
+    humidifier = "OFF"
+    if average_temperature is not None and average_temperature < set_temperature:
+        fan = "ON"
+    if average_humidity is not None and average_humidity < set_humidity:
+        humidifier = "ON"
+
+    return {
+        'fan': fan,
+        'humidifier': humidifier,
+        'Motor': "ON" if stat_stepper else "OFF"
+    }
+
+
+def get_device_command(average_temperature=None, average_humidity=None):
+    """Commande à renvoyer à l'ESP32 ; sans moyennes fournies, utilise la dernière trame"""
+    try:
+        if average_temperature is None and average_humidity is None:
+            with db_manager.get_session_context() as session:
+                latest = session.query(DataTempModel).order_by(DataTempModel.id.desc()).first()
+                if latest:
+                    average_temperature = latest.average_temperature
+                    average_humidity = latest.average_humidity
+
+        parameter = parameter_state.get()
+        if parameter and parameter.exists:
+            return compute_device_command(
+                parameter.temperature, parameter.humidity, parameter.start_date,
+                parameter.stat_stepper, average_temperature, average_humidity
+            )
+        return compute_device_command(None, None, None, False, average_temperature, average_humidity)
+
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul de la commande: {e}")
+        return {'fan': "OFF", 'humidifier': "OFF", 'Motor': "OFF"}
+
 def get_last_data():
     try:
         with db_manager.get_session_context() as session:
@@ -70,46 +192,278 @@ def get_last_data():
     finally:
         session.close()
         
-def get_all_data(date_ini, date_end):
+def _rollup_averages(rollup, columns, grouped=False):
+    """Moyennes (somme / nombre) lues dans une table d'agrégats.
+
+    `columns` associe le nom de la mesure ('temperature', 'humidity',
+    'average_temperature', 'average_humidity', 'failed') au libellé attendu.
+    Avec `grouped`, sommes et nombres sont cumulés (requête avec GROUP BY).
+    Comme AVG(), le résultat est NULL lorsqu'aucune valeur n'est renseignée.
+    """
+    counts = {
+        'temperature': rollup.row_count,
+        'humidity': rollup.row_count,
+        'average_temperature': rollup.count_average_temperature,
+        'average_humidity': rollup.count_average_humidity,
+        'failed': rollup.count_failed
+    }
+    averages = []
+    for measure, label in columns:
+        total, count = getattr(rollup, f"sum_{measure}"), counts[measure]
+        if grouped:
+            total, count = func.sum(total), func.sum(count)
+        averages.append((total / func.nullif(count, 0)).label(label))
+    return averages
+
+
+def _five_minute_bucket(bucket):
+    return func.date_trunc('hour', bucket) + func.floor(
+        func.date_part('minute', bucket) / 5
+    ) * literal_column("interval '5 minutes'")
+
+
+def _day_bucket(bucket):
+    return func.date_trunc('day', bucket)
+
+
+# Résolutions de /alldata, de la plus fine à la plus grossière :
+# largeur des périodes, table d'agrégats lue, regroupement éventuel des périodes
+RESOLUTIONS = {
+    'minute': (datetime.timedelta(minutes=1), DataTempMinuteModel, None),
+    '5min': (datetime.timedelta(minutes=5), DataTempMinuteModel, _five_minute_bucket),
+    'hour': (datetime.timedelta(hours=1), DataTempHourModel, None),
+    'day': (datetime.timedelta(days=1), DataTempHourModel, _day_bucket)
+}
+
+
+# Largeur des tranches du cache de requêtes, par résolution : au plus 60
+# périodes par tranche, la tranche en cours restant rapide à recalculer
+CACHE_SEGMENTS = {
+    'minute': datetime.timedelta(hours=1),
+    '5min': datetime.timedelta(hours=1),
+    'hour': datetime.timedelta(days=1),
+    'day': datetime.timedelta(days=1)
+}
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M")
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time.min)
+    return value
+
+
+def _default_range(date_ini, date_end):
+    """Plage de /alldata : les 7 derniers jours si elle n'est pas précisée"""
+    if not date_ini or not date_end:
+        today = datetime.date.today()
+        return today - datetime.timedelta(days=7), today + datetime.timedelta(days=1)
+    return date_ini, date_end
+
+
+def choose_resolution(date_ini, date_end, target_points):
+    """Résolution la plus fine donnant au plus `target_points` périodes par
+    capteur sur la plage (la journée au-delà)"""
+    date_ini, date_end = _default_range(date_ini, date_end)
+    span = _as_datetime(date_end) - _as_datetime(date_ini)
+    for name, (width, _, _) in RESOLUTIONS.items():
+        if span / width <= target_points:
+            return name
+    return 'day'
+
+
+def _to_columns(keys, rows, columns):
+    """Met des lignes de résultat au format colonnes : un tableau par champ.
+
+    `keys` sont les libellés SQL des lignes ; `columns` est une suite de (nom
+    du champ, libellé SQL, décimales) ; les nombres sont arrondis (None : valeur
+    telle quelle) et les dates converties en ISO 8601, pour un résultat
+    directement sérialisable en JSON.
+    """
+    keys = list(keys)
+    transposed = list(zip(*rows)) if rows else [() for _ in keys]
+    data = {}
+    for name, key, digits in columns:
+        values = transposed[keys.index(key)]
+        if digits == 0:
+            data[name] = [round(value) if value is not None else None for value in values]
+        elif digits is not None:
+            data[name] = [round(value, digits) if value is not None else None for value in values]
+        elif values and isinstance(values[0], (datetime.datetime, datetime.date)):
+            data[name] = [value.isoformat() if value is not None else None for value in values]
+        else:
+            data[name] = list(values)
+    return data
+
+
+ALL_DATA_COLUMNS = (
+    ('Sensor', 'sensor', None),
+    ('date', 'heure', None),
+    ('temperature', 'temperature', 2),
+    ('humidity', 'humidite', 2),
+    ('temperature_moyenne', 'temperature_moyenne', 2),
+    ('humidite_moyenne', 'humidite_moyenne', 2),
+    ('failed', 'failed', 0)
+)
+
+
+def _all_data_query(session, date_ini, date_end, resolution='minute'):
+    """Requête des agrégats utilisée par /alldata, à la résolution demandée"""
+    date_ini, date_end = _default_range(date_ini, date_end)
+    _, rollup, regroup = RESOLUTIONS[resolution]
+    unit = 'minute' if rollup is DataTempMinuteModel else 'hour'
+    columns = (
+        ('temperature', 'temperature'),
+        ('humidity', 'humidite'),
+        ('average_temperature', 'temperature_moyenne'),
+        ('average_humidity', 'humidite_moyenne'),
+        ('failed', 'failed')
+    )
+
+    # Lecture des agrégats (data_temp_minute / data_temp_hour) au lieu de data_temp
+    if regroup is None:
+        bucket = rollup.bucket
+        query = session.query(rollup.sensor, bucket.label('heure'), *_rollup_averages(rollup, columns))
+    else:
+        bucket = regroup(rollup.bucket)
+        query = session.query(
+            rollup.sensor, bucket.label('heure'), *_rollup_averages(rollup, columns, grouped=True)
+        ).group_by(rollup.sensor, bucket)
+    return query.filter(
+        rollup.bucket >= func.date_trunc(unit, cast(date_ini, TIMESTAMP)),
+        rollup.bucket <= date_end
+    ).order_by(bucket)
+
+
+def _all_data_rows(session, date_ini, date_end, resolution='minute'):
+    """Libellés et lignes de _all_data_query ; les tranches closes de la plage
+    sont lues dans le cache de requêtes"""
+    date_ini, date_end = _default_range(date_ini, date_end)
+    _, rollup, _ = RESOLUTIONS[resolution]
+    if rollup is DataTempMinuteModel:
+        step = datetime.timedelta(minutes=1)
+        date_ini = _as_datetime(date_ini).replace(second=0, microsecond=0)
+    else:
+        step = datetime.timedelta(hours=1)
+        date_ini = _as_datetime(date_ini).replace(minute=0, second=0, microsecond=0)
+
+    def load(ini, end):
+        result = session.execute(_all_data_query(session, ini, end, resolution).statement)
+        return list(result.keys()), result.all()
+
+    return query_cache.rows(
+        session, ('all_data', resolution), date_ini, _as_datetime(date_end),
+        CACHE_SEGMENTS[resolution], step, load
+    )
+
+
+def _format_all_data_row(row):
+    return {
+        'Sensor': row.sensor,
+        'date': row.heure,
+        'temperature': format(row.temperature, ".2f"),
+        'humidity': format(row.humidite, ".2f"),
+        'temperature_moyenne': format(row.temperature_moyenne, ".2f"),
+        'humidite_moyenne': format(row.humidite_moyenne, ".2f"),
+        'failed': format(row.failed, ".0f") if row.failed else "0"
+    }
+
+
+def _downsample_all_data(rows, max_points):
+    """Réduit les lignes de /alldata à `max_points` au plus (LTTB par capteur)"""
+    if len(rows) <= max_points:
+        return rows
+    x = [row.heure.timestamp() for row in rows]
+    series = [
+        [row.temperature for row in rows],
+        [row.humidite for row in rows],
+        [row.temperature_moyenne for row in rows],
+        [row.humidite_moyenne for row in rows]
+    ]
+    kept = downsample_indices(x, series, [row.sensor for row in rows], max_points)
+    return [rows[index] for index in kept]
+
+
+def get_all_data(date_ini, date_end, columnar=False, max_points=None, resolution='minute'):
+    """Agrégats de la plage à la résolution demandée (voir RESOLUTIONS) ; avec
+    `max_points`, la réponse est réduite à ce nombre de lignes au plus, en
+    conservant l'allure des courbes"""
     try:
         with db_manager.get_session_context() as session:
-            if not date_ini or not date_end:
-                today = datetime.date.today()
-                date_end = today + datetime.timedelta(days=1)
-                date_ini = today - datetime.timedelta(days=7)
-
-            query = session.query(
-                DataTempModel.sensor,
-                func.date_trunc('minute', DataTempModel.date_serveur).label('heure'),
-                func.avg(DataTempModel.temperature).label('temperature'),
-                func.avg(DataTempModel.humidity).label('humidite'),
-                func.avg(DataTempModel.average_temperature).label('temperature_moyenne'),
-                func.avg(DataTempModel.average_humidity).label('humidite_moyenne'),
-                func.avg(DataTempModel.numfailedsensors).label('failed')
-            ).filter(
-                DataTempModel.date_serveur.between(date_ini, date_end)
-            ).group_by(
-                'heure',
-                DataTempModel.sensor
-            ).order_by('heure')
-
-            results = []
-            for row in query.all():
-                results.append({
-                    'Sensor': row.sensor,
-                    'date': row.heure,
-                    'temperature': format(row.temperature, ".2f"),
-                    'humidity': format(row.humidite, ".2f"),
-                    'temperature_moyenne': format(row.temperature_moyenne, ".2f"),
-                    'humidite_moyenne': format(row.humidite_moyenne, ".2f"),
-                    'failed': format(row.failed, ".0f") if row.failed else "0"
-                })
-            return results
+            keys, rows = _all_data_rows(session, date_ini, date_end, resolution)
+
+        # Traitement hors session : la connexion est déjà rendue au pool
+        if max_points:
+            rows = _downsample_all_data(rows, max_points)
+        if columnar:
+            return _to_columns(keys, rows, ALL_DATA_COLUMNS)
+        return [_format_all_data_row(row) for row in rows]
 
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des données: {e}")
         return []
-    
+
+
+def iter_all_data_ndjson(date_ini, date_end, batch_size=2000, resolution='minute'):
+    """Même contenu que get_all_data, en blocs de lignes NDJSON.
+
+    Les lignes sont lues par un curseur côté serveur (yield_per), par lots de
+    `batch_size` : la mémoire utilisée ne dépend pas de la plage demandée.
+    Chaque bloc produit est une chaîne d'au plus `batch_size` lignes JSON.
+    """
+    with db_manager.get_session_context() as session:
+        result = session.execute(
+            _all_data_query(session, date_ini, date_end, resolution).statement,
+            execution_options={'yield_per': batch_size}
+        )
+        for partition in result.partitions():
+            lines = []
+            for row in partition:
+                data = _format_all_data_row(row)
+                data['date'] = data['date'].isoformat() if data['date'] else None
+                lines.append(json.dumps(data))
+            yield "\n".join(lines) + "\n"
+
+READING_COLUMNS = (
+    'id', 'sensor', 'temperature', 'humidity', 'date_serveur', 'average_temperature',
+    'average_humidity', 'fan_status', 'humidifier_status', 'numfailedsensors'
+)
+
+
+def readings_query(session, after_id=None, limit=1000, sensors=None, date_ini=None, date_end=None):
+    """Page de data_temp par ordre d'id croissant, à partir de `after_id` exclu.
+
+    Pagination par clé (keyset) : chaque page est un parcours de l'index de clé
+    primaire à partir du dernier id lu, de coût constant quelle que soit la
+    position dans l'historique (pas d'OFFSET). Les bornes de dates limitent en
+    plus les partitions parcourues.
+    """
+    query = session.query(*(getattr(DataTempModel, column) for column in READING_COLUMNS))
+    if after_id is not None:
+        query = query.filter(DataTempModel.id > after_id)
+    if sensors:
+        query = query.filter(DataTempModel.sensor.in_(sensors))
+    if date_ini:
+        query = query.filter(DataTempModel.date_serveur >= date_ini)
+    if date_end:
+        query = query.filter(DataTempModel.date_serveur <= date_end)
+    return query.order_by(DataTempModel.id).limit(limit)
+
+
+def get_readings(after_id=None, limit=1000, sensors=None, date_ini=None, date_end=None):
+    """Lignes brutes de data_temp (dicts), voir readings_query"""
+    try:
+        with db_manager.get_session_context() as session:
+            query = readings_query(session, after_id, limit, sensors, date_ini, date_end)
+            return [row._asdict() for row in query]
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des relevés: {e}")
+        # None et non [] : une liste vide signifierait la fin de l'export
+        return None
+
+
 def create_parameter(data_to_insert=None):
     try:
         with db_manager.get_session_context() as session:
@@ -169,6 +523,10 @@ def create_parameter(data_to_insert=None):
                 session.add(new_stepper)
 
             session.commit()
+            # Nouvel instantané pour ce processus ; les autres workers sont
+            # prévenus par la notification du trigger parameter_notify
+            parameter_state.load()
+            data_version.bump(PARAMETER)
             logger.info("Paramètres créés/mis à jour avec succès")
             return True
 
@@ -178,38 +536,29 @@ def create_parameter(data_to_insert=None):
     
 def get_parameter():
     try:
-        with db_manager.get_session_context() as session:
-            # Récupérer le dernier paramètre
-            parameter = session.query(ParameterDataModel).order_by(ParameterDataModel.id.desc()).first()
-            
-            if parameter:
-                result = {
-                    'id': parameter.id,
-                    'temperature': parameter.temperature,
-                    'humidity': parameter.humidity,
-                    'start_date': str(parameter.start_date),
-                    'stat_stepper': parameter.stat_stepper,
-                    'number_stepper': parameter.number_stepper,
-                    'espece': parameter.espece,
-                    'timetoclose': parameter.timetoclose
+        # Récupérer le dernier paramètre (instantané en mémoire)
+        parameter = parameter_state.get()
+        if parameter is None:
+            raise RuntimeError("instantané des paramètres indisponible")
+
+        if not parameter.exists:
+            # Si aucun paramètre n'existe, créer un nouveau (l'instantané est rechargé)
+            if create_parameter():
+                parameter = parameter_state.get()
+            if not parameter or not parameter.exists:
+                # Retourner des valeurs par défaut si la création échoue
+                return {
+                    'id': 1,
+                    'temperature': 37.5,
+                    'humidity': 40,
+                    'start_date': str(datetime.datetime.today()),
+                    'stat_stepper': "OFF",
+                    'number_stepper': 2,
+                    'espece': 'poule',
+                    'timetoclose': 21
                 }
-            else:
-                # Si aucun paramètre n'existe, créer un nouveau
-                result = create_parameter()
-                if not result:
-                    # Retourner des valeurs par défaut si la création échoue
-                    return {
-                        'id': 1,
-                        'temperature': 37.5,
-                        'humidity': 40,
-                        'start_date': str(datetime.datetime.today()),
-                        'stat_stepper': "OFF",
-                        'number_stepper': 2,
-                        'espece': 'poule',
-                        'timetoclose': 21
-                    }
-            
-            return result
+
+        return parameter.as_dict()
 
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des paramètres: {e}")
@@ -233,11 +582,11 @@ def get_weather_data():
             # Calculer la date d'il y a 7 jours
             seven_days_ago = datetime.date.today() - datetime.timedelta(days=7)
             
-            # Récupérer les valeurs maximales
+            # Valeurs maximales lues dans les agrégats horaires plutôt que dans les relevés bruts
             max_values = session.query(
-                func.max(DataTempModel.temperature).label('max_temperature'),
-                func.max(DataTempModel.humidity).label('max_humidity')
-            ).filter(DataTempModel.date_serveur >= seven_days_ago).first()
+                func.max(DataTempHourModel.max_temperature).label('max_temperature'),
+                func.max(DataTempHourModel.max_humidity).label('max_humidity')
+            ).filter(DataTempHourModel.bucket >= seven_days_ago).first()
 
             data_send = {}
             if latest_data:
@@ -259,65 +608,105 @@ def get_weather_data():
         logger.error(f"Erreur lors de la récupération des données: {e}")
         return {}
 
-def data_table():
+DATA_TABLE_COLUMNS = (
+    ('heure', 'heure', None),
+    ('temperature_moyenne', 'temperature_moyenne', 2),
+    ('humidite_moyenne', 'humidite_moyenne', 2),
+    ('temps', 'temps', 2),
+    ('humid', 'humid', 2),
+    ('failed', 'failed', 0),
+    ('sensor', 'sensor', None)
+)
+
+
+def data_table_query(session):
+    """Agrégats par minute et par capteur de /datatable (sans filtre)"""
+    rollup = DataTempMinuteModel
+    return session.query(
+        rollup.bucket.label('heure'),
+        *_rollup_averages(rollup, (
+            ('temperature', 'temperature_moyenne'),
+            ('humidity', 'humidite_moyenne'),
+            ('average_temperature', 'temps'),
+            ('average_humidity', 'humid'),
+            ('failed', 'failed')
+        )),
+        rollup.sensor
+    ).order_by(rollup.bucket)
+
+
+def data_table_changes_query(session, since, overlap_seconds=30):
+    """Périodes de data_temp_minute modifiées depuis `since` (index sur updated_at)"""
+    return data_table_query(session).filter(
+        DataTempMinuteModel.updated_at >= since - datetime.timedelta(seconds=overlap_seconds)
+    )
+
+
+def data_table_changes(since, overlap_seconds=30):
+    """Périodes de data_temp_minute modifiées après `since`.
+
+    Retourne (libellés, lignes, nouvelle marque) ou None en cas d'erreur. La
+    marque est le début de la plus ancienne transaction ouverte au moment de
+    la lecture (read_watermark) : une écriture validée ensuite, même par un
+    import commencé longtemps avant, a un updated_at postérieur. Une période
+    peut donc être renvoyée deux fois ; `overlap_seconds` est une marge
+    supplémentaire retranchée de `since`.
+    """
     try:
         with db_manager.get_session_context() as session:
-            data = session.query(
-                func.date_trunc('minute', DataTempModel.date_serveur).label('heure'),
-                func.avg(DataTempModel.temperature).label('temperature_moyenne'),
-                func.avg(DataTempModel.humidity).label('humidite_moyenne'),
-                func.avg(DataTempModel.average_temperature).label('temps'),
-                func.avg(DataTempModel.average_humidity).label('humid'),
-                func.avg(DataTempModel.numfailedsensors).label('failed'),
-                DataTempModel.sensor
-            ).filter(
-                DataTempModel.date_serveur >= '2024-07-28'
-            ).group_by(
-                'heure',
-                DataTempModel.sensor
-            ).order_by('heure')
-            
-            return data.all()
+            _, watermark = read_watermark(session)
+            query = data_table_changes_query(session, since, overlap_seconds)
+            result = session.execute(query.statement)
+            return list(result.keys()), result.all(), watermark
 
     except Exception as e:
-        logger.error(f"Erreur lors de la récupération des données: {e}")
-        return []
+        logger.error(f"Erreur lors de la récupération des données modifiées: {e}")
+        return None
+
+
+def format_data_table(keys, rows, columnar=False):
+    """Lignes de /datatable en JSON : liste de dicts ou colonnes"""
+    if columnar:
+        return _to_columns(keys, rows, DATA_TABLE_COLUMNS)
+    results = []
+    for row in rows:
+        data = dict(zip(keys, row))
+        data['heure'] = data['heure'].isoformat()
+        results.append(data)
+    return results
 
 def getdateinit(date):
     try:
-        with db_manager.get_session_context() as session:
-            parameter_data = session.query(
-                ParameterDataModel.start_date,
-                ParameterDataModel.espece,
-                ParameterDataModel.timetoclose
-            ).first()
+        parameter_data = parameter_state.get()
+        if parameter_data is None:
+            raise RuntimeError("instantané des paramètres indisponible")
 
-            if parameter_data:
-                try:
-                    date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
-                    today = datetime.date.today()
-                    date_remain = date - parameter_data.start_date.date()
+        if parameter_data.exists:
+            try:
+                date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+                today = datetime.date.today()
+                date_remain = date - parameter_data.start_date.date()
 
-                    days_v = {
-                        "poule": 21,
-                        "canne": 28,
-                        "oie": 30,
-                        "caille": 18
-                    }.get(parameter_data.espece, parameter_data.timetoclose)
+                days_v = {
+                    "poule": 21,
+                    "canne": 28,
+                    "oie": 30,
+                    "caille": 18
+                }.get(parameter_data.espece, parameter_data.timetoclose)
 
-                    remain_time = datetime.timedelta(days=1)
-                    days_remain = datetime.timedelta(days=days_v)
-                    remain_now = today - parameter_data.start_date.date()
+                remain_time = datetime.timedelta(days=1)
+                days_remain = datetime.timedelta(days=days_v)
+                remain_now = today - parameter_data.start_date.date()
 
-                    if today < date or date < parameter_data.start_date.date():
-                        return False
+                if today < date or date < parameter_data.start_date.date():
+                    return False
 
-                    return date_remain > days_remain or date_remain < remain_time or remain_now > days_remain
+                return date_remain > days_remain or date_remain < remain_time or remain_now > days_remain
 
-                except Exception as e:
-                    logger.error(f"Erreur lors du calcul des dates: {e}")
-                    return False
-            return True
+            except Exception as e:
+                logger.error(f"Erreur lors du calcul des dates: {e}")
+                return False
+        return True
 
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des paramètres: {e}")
@@ -330,19 +719,35 @@ def validate_humidity(humid):
     return isinstance(humid, (int, float)) and 0 <= humid <= 100
 
 
-def get_data_average():
+DATA_AVERAGE_COLUMNS = (
+    ('hour', 'heure', None),
+    ('temperature', 'temperature_moyenne', 2),
+    ('humidity', 'humidite_moyenne', 2)
+)
+
+
+def data_average_query(session, since):
+    """Moyenne horaire tous capteurs confondus depuis `since`, à partir de data_temp_hour"""
+    rollup = DataTempHourModel
+    return session.query(
+        rollup.bucket.label('heure'),
+        (func.sum(rollup.sum_temperature) / func.sum(rollup.row_count)).label('temperature_moyenne'),
+        (func.sum(rollup.sum_humidity) / func.sum(rollup.row_count)).label('humidite_moyenne')
+    ).filter(
+        rollup.bucket >= since
+    ).group_by(
+        rollup.bucket
+    ).order_by(rollup.bucket)
+
+
+def get_data_average(columnar=False):
     try:
         with db_manager.get_session_context() as session:
-            today = datetime.date.today()
-            query = session.query(
-                func.date_trunc('hour', DataTempModel.date_serveur).label('heure'),
-                func.avg(DataTempModel.temperature).label('temperature_moyenne'),
-                func.avg(DataTempModel.humidity).label('humidite_moyenne')
-            ).filter(
-                func.date_trunc('minute', DataTempModel.date_serveur) >= today
-            ).group_by(
-                'heure'
-            ).order_by('heure')
+            query = data_average_query(session, datetime.date.today())
+
+            if columnar:
+                result = session.execute(query.statement)
+                return _to_columns(result.keys(), result.all(), DATA_AVERAGE_COLUMNS)
 
             temperatureData = []
             for row in query.all():
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Cache des résultats de requêtes sur les agrégats, par tranche de temps.
+
+Une plage demandée est découpée en tranches alignées (l'heure, le jour...).
+Une tranche close depuis plus de `grace_seconds` ne change plus : ses lignes
+sont conservées en mémoire et seules les tranches absentes du cache, les bords
+incomplets de la plage et la tranche en cours sont relus en base, en une seule
+requête. Les écritures tardives (rejeu du journal, import) modifient updated_at
+dans data_temp_minute : les tranches concernées sont retirées du cache. La
+lecture suivante repart de la marque `read_watermark` (début de la plus
+ancienne transaction ouverte) et non de l'heure courante : un import validé
+longtemps après son début est ainsi vu.
+
+La mémoire occupée est estimée à partir de la taille d'une ligne ; au-delà de
+`max_bytes`, les tranches les moins récemment utilisées sont supprimées.
+"""
+import datetime
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from apps.database_configuration import DataTempMinuteModel, db_settings, read_watermark
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def _floor(value: datetime.datetime, width: datetime.timedelta) -> datetime.datetime:
+    """Début de la tranche de largeur `width` (alignée sur minuit) contenant `value`"""
+    return datetime.datetime.min + (value - datetime.datetime.min) // width * width
+
+
+def _estimate_size(rows) -> int:
+    """Taille approximative (octets) d'une liste de lignes, d'après la première"""
+    if not rows:
+        return sys.getsizeof(rows)
+    row = rows[0]
+    # Une ligne SQLAlchemy (Row) garde ses valeurs dans un tuple interne
+    values = tuple(row)
+    per_row = sys.getsizeof(row) + sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+    return sys.getsizeof(rows) + per_row * len(rows)
+
+
+class QueryCache:
+    """LRU borné en mémoire des lignes de tranches de temps closes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, grace_seconds: float = 60,
+                 overlap_seconds: float = 30):
+        self.max_bytes = max_bytes
+        self.grace = datetime.timedelta(seconds=grace_seconds)
+        self.overlap = datetime.timedelta(seconds=overlap_seconds)
+        self._lock = threading.Lock()
+        # (nom, début de tranche) -> (fin de tranche, lignes, taille estimée)
+        self._segments = OrderedDict()
+        # Libellés des colonnes de chaque requête, pour une réponse tirée du seul cache
+        self._keys = {}
+        self._bytes = 0
+        self._checked_at = None
+        # Incrémenté à chaque écriture tardive : une lecture commencée avant ne
+        # met pas en cache des lignes peut-être déjà périmées
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def rows(self, session, name, date_ini, date_end, width, step, load):
+        """Lignes de la plage [date_ini, date_end] (bornes incluses).
+
+        `name` identifie la requête (et ses paramètres autres que la plage) ;
+        `width` est la largeur des tranches, `step` l'écart entre deux périodes
+        consécutives (la dernière période d'une tranche commence à fin - step).
+        `load(ini, end)` exécute la requête sur [ini, end] et retourne
+        (libellés, lignes) ; chaque ligne doit avoir un attribut `heure`
+        (début de sa période) et les lignes doivent être triées par heure.
+        """
+        now, watermark = read_watermark(session)
+        self._invalidate(session, now, watermark)
+        generation = self._generation
+        closed_before = now - self.grace
+
+        # Découpage : (début, fin incluse, tranche, tranche complète et close)
+        pieces = []
+        cursor = date_ini
+        while cursor <= date_end:
+            segment = _floor(cursor, width)
+            last = segment + width - step
+            end = min(last, date_end)
+            cacheable = (self.max_bytes > 0 and cursor == segment and end == last
+                         and segment + width <= closed_before)
+            pieces.append((cursor, end, segment, cacheable))
+            cursor = segment + width
+
+        cached = {}
+        with self._lock:
+            for _, _, segment, cacheable in pieces:
+                entry = self._segments.get((name, segment)) if cacheable else None
+                if entry is not None:
+                    self._segments.move_to_end((name, segment))
+                    cached[segment] = entry[1]
+            self._hits += len(cached)
+            self._misses += sum(1 for piece in pieces if piece[3]) - len(cached)
+
+        # Tranches à relire, regroupées en plages contiguës (une requête par plage)
+        keys = self._keys.get(name)
+        loaded = {}
+        run = []
+        for piece in pieces + [None]:
+            if piece is not None and piece[2] not in cached:
+                run.append(piece)
+                continue
+            if run:
+                keys, rows = load(run[0][0], run[-1][1])
+                for _, _, segment, _ in run:
+                    loaded[segment] = []
+                for row in rows:
+                    segment_rows = loaded.get(_floor(row.heure, width))
+                    if segment_rows is not None:
+                        segment_rows.append(row)
+                run = []
+
+        with self._lock:
+            for _, _, segment, cacheable in pieces:
+                if cacheable and segment in loaded and generation == self._generation:
+                    self._store((name, segment), segment + width, loaded[segment])
+            if keys is not None:
+                self._keys[name] = keys
+
+        if keys is None:
+            # Plage vide : libellés d'une requête sans ligne
+            keys, _ = load(date_end + step, date_end)
+        rows = []
+        for _, _, segment, _ in pieces:
+            rows.extend(cached.get(segment, loaded.get(segment, [])))
+        return keys, rows
+
+    def _store(self, key, end, rows):
+        """Ajoute une tranche et libère les plus anciennes au-delà de max_bytes"""
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        previous = self._segments.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        self._segments[key] = (end, rows, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._segments.popitem(last=False)
+            self._bytes -= evicted_size
+            self._evictions += 1
+
+    def _invalidate(self, session, now, watermark):
+        """Retire du cache les tranches modifiées depuis la lecture précédente"""
+        if self._checked_at is not None and self._segments:
+            hour = func.date_trunc('hour', DataTempMinuteModel.bucket)
+            changed = [
+                changed_hour for (changed_hour,) in session.query(hour).filter(
+                    DataTempMinuteModel.updated_at >= self._checked_at - self.overlap
+                ).distinct()
+                # Les heures récentes ne peuvent appartenir à une tranche en cache
+                if changed_hour + HOUR <= now - self.grace
+            ]
+            if changed:
+                with self._lock:
+                    self._generation += 1
+                    for key, (end, _, size) in list(self._segments.items()):
+                        if any(key[1] <= changed_hour < end for changed_hour in changed):
+                            del self._segments[key]
+                            self._bytes -= size
+                            self._invalidations += 1
+        self._checked_at = watermark
+
+    def clear(self):
+        with self._lock:
+            self._segments.clear()
+            self._bytes = 0
+        self._checked_at = None
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        lookups = self._hits + self._misses
+        return {
+            "segments": len(self._segments),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations
+        }
+
+
+# Instance globale du cache des requêtes d'agrégats
+query_cache = QueryCache(max_bytes=db_settings.db_query_cache_max_mb * 1024 * 1024)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Politique de rétention des relevés bruts de data_temp.
+
+Les relevés sont agrégés par heure dans data_temp_hour (et par minute dans
+data_temp_minute) au moment de leur insertion par le trigger data_temp_rollup.
+Au-delà de `db_retention_raw_days` jours, seuls ces agrégats sont conservés :
+les lignes brutes sont supprimées par petits lots (une transaction par lot)
+pour laisser l'autovacuum suivre, ou par partitions entières quand data_temp
+est partitionnée.
+"""
+import datetime
+import logging
+import time
+
+from sqlalchemy import text
+
+from apps.database_configuration import db_manager, db_settings
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Un lot de lignes antérieures à :cutoff, avec la taille des tuples supprimés
+DELETE_BATCH_SQL = """
+    WITH expired AS (
+        SELECT id, date_serveur FROM data_temp
+        WHERE date_serveur < :cutoff
+        LIMIT :batch_rows
+    ), deleted AS (
+        DELETE FROM data_temp AS t
+        USING expired AS e
+        WHERE t.id = e.id AND t.date_serveur = e.date_serveur
+        RETURNING pg_column_size(t.*) AS size
+    )
+    SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+
+class RetentionManager:
+    """Compacte les relevés bruts expirés dans les agrégats horaires puis les supprime"""
+
+    def __init__(self, raw_days: int, batch_rows: int, batch_pause: float):
+        self.raw_days = raw_days
+        self.batch_rows = batch_rows
+        self.batch_pause = batch_pause
+        self._rows_compacted = 0
+        self._bytes_reclaimed = 0
+        self._partitions_dropped = 0
+        self._runs = 0
+        self._last_run = None
+        self._last_cutoff = None
+
+    def cutoff(self, now: datetime.datetime = None) -> datetime.datetime:
+        """Limite de rétention, alignée sur l'heure pour ne jamais couper un agrégat horaire"""
+        now = now or datetime.datetime.now()
+        return (now - datetime.timedelta(days=self.raw_days)).replace(minute=0, second=0, microsecond=0)
+
+    def _rollup_trigger_installed(self) -> bool:
+        with db_manager.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgname = 'data_temp_rollup' AND tgrelid = 'data_temp'::regclass"
+            )).first() is not None
+
+    def run_once(self) -> dict:
+        """Exécute une passe de rétention (appel bloquant, via run_db)"""
+        result = {"rows_compacted": 0, "bytes_reclaimed": 0, "partitions_dropped": 0}
+        if not self.raw_days:
+            return result
+        # Sans trigger, les agrégats horaires ne couvrent pas forcément les lignes brutes
+        if not self._rollup_trigger_installed():
+            logger.error("Trigger d'agrégation absent, rétention des relevés bruts suspendue")
+            return result
+
+        cutoff = self.cutoff()
+        try:
+            if db_manager.data_temp_is_partitioned():
+                for partition in db_manager.drop_partitions_before(cutoff):
+                    result["partitions_dropped"] += 1
+                    result["rows_compacted"] += partition["rows"]
+                    result["bytes_reclaimed"] += partition["bytes"]
+
+            while True:
+                with db_manager.engine.begin() as conn:
+                    rows, size = conn.execute(
+                        text(DELETE_BATCH_SQL),
+                        {"cutoff": cutoff, "batch_rows": self.batch_rows}
+                    ).one()
+                result["rows_compacted"] += rows
+                result["bytes_reclaimed"] += size
+                if rows < self.batch_rows:
+                    break
+                time.sleep(self.batch_pause)
+        except Exception as e:
+            logger.error(f"Erreur lors de la rétention des relevés bruts: {e}")
+        finally:
+            self._rows_compacted += result["rows_compacted"]
+            self._bytes_reclaimed += result["bytes_reclaimed"]
+            self._partitions_dropped += result["partitions_dropped"]
+            self._runs += 1
+            self._last_run = datetime.datetime.now()
+            self._last_cutoff = cutoff
+
+        if result["rows_compacted"]:
+            logger.info(
+                f"Rétention: {result['rows_compacted']} relevés bruts antérieurs au {cutoff} supprimés "
+                f"({result['bytes_reclaimed']} octets), agrégats horaires conservés"
+            )
+        return result
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "raw_days": self.raw_days,
+            "rows_compacted": self._rows_compacted,
+            "bytes_reclaimed": self._bytes_reclaimed,
+            "partitions_dropped": self._partitions_dropped,
+            "runs": self._runs,
+            "last_run": self._last_run.isoformat() if self._last_run else None,
+            "last_cutoff": self._last_cutoff.isoformat() if self._last_cutoff else None
+        }
+
+
+# Instance globale du gestionnaire de rétention
+retention_manager = RetentionManager(
+    raw_days=db_settings.db_retention_raw_days,
+    batch_rows=db_settings.db_retention_batch_rows,
+    batch_pause=db_settings.db_retention_batch_pause
+)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Validation des trames envoyées par les ESP32 (/values et /ws/values)"""
+import datetime
+import logging
+from datetime import timezone
+
+from apps import post_temp_humidity
+from apps.database_configuration import SENSOR_NAME_MAX_LENGTH, INT4_MAX
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ['average_temperature', 'average_humidity', 'fan_status', 'humidifier_status', 'numFailedSensors']
+
+
+class FrameError(ValueError):
+    """Trame invalide (le message est renvoyé tel quel au client)"""
+
+
+def parse_frame(data) -> list:
+    """Valide une trame ESP32 et la convertit en lignes data_temp (une par capteur).
+
+    Les capteurs sont les champs dont le nom commence par 'sensor', chacun avec
+    ses valeurs temperature / humidity.
+    """
+    if not isinstance(data, dict):
+        raise FrameError("La trame doit être un objet JSON")
+
+    # Validation des données principales
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing_fields:
+        raise FrameError(f"Champs requis manquants: {', '.join(missing_fields)}")
+
+    # Validation des valeurs
+    avg_temp = data.get('average_temperature')
+    avg_hum = data.get('average_humidity')
+    if not post_temp_humidity.validate_temperature(avg_temp):
+        raise FrameError(f"Valeur de température invalide: {avg_temp}")
+    if not post_temp_humidity.validate_humidity(avg_hum):
+        raise FrameError(f"Valeur d'humidité invalide: {avg_hum}")
+
+    # Extraction et validation des valeurs de base
+    try:
+        average_temperature = float(avg_temp)
+        average_humidity = float(avg_hum)
+        fan_status = str(data.get('fan_status'))
+        humidifier_status = str(data.get('humidifier_status'))
+        num_failed_sensors = int(data.get('numFailedSensors', 0))
+    except (ValueError, TypeError) as e:
+        raise FrameError(f"Erreur de conversion des données: {e}")
+    # Bornes de la colonne numfailedsensors (int4)
+    if not (0 <= num_failed_sensors <= INT4_MAX):
+        raise FrameError(f"numFailedSensors doit être entre 0 et {INT4_MAX}, reçu: {num_failed_sensors}")
+
+    date_serveur = datetime.datetime.now(timezone.utc)
+    rows = []
+
+    # Traitement des données des capteurs
+    for sensor_name, sensor_data in data.items():
+        if not sensor_name.startswith('sensor'):
+            continue
+        if len(sensor_name) > SENSOR_NAME_MAX_LENGTH:
+            raise FrameError(f"Nom de capteur trop long (plus de {SENSOR_NAME_MAX_LENGTH} caractères): {sensor_name[:20]}...")
+        try:
+            if not isinstance(sensor_data, dict):
+                raise ValueError("Les données du capteur doivent être un objet")
+
+            if 'humidity' not in sensor_data or 'temperature' not in sensor_data:
+                raise ValueError("Données de capteur incomplètes (humidity/temperature manquants)")
+
+            humidity = float(sensor_data['humidity'])
+            temperature = float(sensor_data['temperature'])
+
+            # Validation des valeurs individuelles
+            if not (0 <= humidity <= 100):
+                raise ValueError(f"L'humidité doit être entre 0 et 100, reçu: {humidity}")
+            if not (-50 <= temperature <= 100):
+                raise ValueError(f"La température doit être entre -50 et 100, reçu: {temperature}")
+
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f"Erreur données capteur {sensor_name}: {e}")
+            raise FrameError(f"Données invalides pour {sensor_name}: {str(e)}")
+
+        rows.append({
+            'sensor': sensor_name,
+            'temperature': temperature,
+            'humidity': humidity,
+            'average_humidity': average_humidity,
+            'average_temperature': average_temperature,
+            'fan_status': fan_status,
+            'humidifier_status': humidifier_status,
+            'numfailedsensors': num_failed_sensors,
+            'date_serveur': date_serveur
+        })
+
+    if not rows:
+        raise FrameError("Aucune donnée de capteur trouvée (aucun champ commençant par 'sensor')")
+
+    return rows
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+import json
+import logging
+import uuid
+from collections import deque
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def format_sse(event: dict) -> str:
+    """Met en forme un événement au format text/event-stream"""
+    data = json.dumps(event["data"], default=_json_default, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+class SensorStream:
+    """Diffusion en mémoire (pub/sub) des nouvelles trames vers les clients SSE.
+
+    Les événements sont produits à partir des notifications data_temp (thread de
+    l'écouteur) puis remis à la boucle asyncio, qui les copie dans la file de
+    chaque abonné. Leur identifiant est « epoch-numéro » : un numéro croissant
+    attribué par ce processus dans l'ordre de diffusion (les id data_temp ne
+    suivent pas l'ordre de validation des transactions). Un client qui se
+    reconnecte avec Last-Event-ID reçoit les trames suivantes de l'historique,
+    ou à défaut (autre worker, historique dépassé) un instantané ("snapshot").
+    """
+
+    def __init__(self, live_state, history_size: int = 256, queue_size: int = 100):
+        self.live_state = live_state
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._loop = None
+        # Identifie ce processus dans les id d'événements
+        self._epoch = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._events_published = 0
+        self._subscribers_dropped = 0
+
+    def attach(self, loop):
+        """Associe la boucle asyncio qui distribue les événements"""
+        self._loop = loop
+
+    # --- Côté écouteur (thread) ---
+
+    def handle_notification(self, payload: str):
+        """Publie la trame décrite par une notification data_temp_notify.
+
+        À abonner après live_state.handle_notification, pour que les maxima
+        diffusés tiennent compte de la trame.
+        """
+        event = json.loads(payload)
+        if event.get('resync'):
+            self.publish_snapshot()
+            return
+        data = self.live_state.weather_data()
+        data['sensor_data'] = [
+            {
+                'sensor': values[1],
+                'temperature': values[2],
+                'humidity': values[3],
+                'date_serveur': values[4]
+            }
+            for values in event['sensors']
+        ]
+        self._publish_threadsafe({"event": "frame", "data": data})
+
+    def publish_snapshot(self):
+        """Publie l'état complet (après une resynchronisation de l'état courant)"""
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            self._publish_threadsafe(snapshot)
+
+    def _publish_threadsafe(self, event):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    # --- Côté boucle asyncio ---
+
+    def _event_id(self, sequence: int) -> str:
+        return f"{self._epoch}-{sequence}"
+
+    def snapshot(self):
+        """État complet ; son id est celui du dernier événement diffusé"""
+        data = self.live_state.weather_data()
+        if 'id' not in data:
+            return None
+        return {"id": self._event_id(self._sequence), "event": "snapshot", "data": data}
+
+    def _publish(self, event):
+        self._sequence += 1
+        event = dict(event, id=self._event_id(self._sequence))
+        self._history.append(event)
+        self._events_published += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client trop lent : on le déconnecte, il reprendra avec Last-Event-ID
+                self._subscribers.discard(queue)
+                self._subscribers_dropped += 1
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def _backlog(self, last_event_id):
+        """Événements diffusés après `last_event_id`, ou None s'ils ne sont plus tous connus"""
+        epoch, _, sequence = (last_event_id or "").partition("-")
+        if epoch != self._epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence > self._sequence:
+            return None
+        # Les numéros de l'historique se suivent : position du premier événement manqué
+        first = self._sequence - len(self._history) + 1
+        if sequence + 1 < first:
+            return None
+        return list(self._history)[sequence + 1 - first:]
+
+    def subscribe(self, last_event_id: str = None):
+        """Crée la file d'un abonné, pré-remplie des événements à rattraper"""
+        queue = asyncio.Queue(maxsize=self.queue_size + len(self._history) + 1)
+        backlog = self._backlog(last_event_id)
+        if backlog is None:
+            snapshot = self.snapshot()
+            backlog = [snapshot] if snapshot is not None else []
+        for event in backlog:
+            queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def close(self):
+        """Termine tous les flux (arrêt de l'application)"""
+        for queue in list(self._subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        self._subscribers.clear()
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "subscribers": len(self._subscribers),
+            "events_published": self._events_published,
+            "subscribers_dropped": self._subscribers_dropped,
+            "last_event_id": self._event_id(self._sequence),
+            "history": len(self._history)
+        }
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Compteurs partagés entre les workers de l'application.
+
+Avec plusieurs workers (uvicorn --workers, gunicorn), chaque processus a sa
+propre mémoire : les données en cache (relevés, paramètres) restent cohérentes
+grâce à LISTEN/NOTIFY, mais un compteur incrémenté par un worker (version des
+données servant aux ETag...) doit être vu à l'identique par tous les autres.
+
+Trois backends, choisis par DB_SHARED_STATE_BACKEND :
+- local : mémoire du processus (un seul worker) ;
+- shm : fichier projeté en mémoire (/dev/shm), workers d'une même machine ;
+- postgres : table shared_state, copie locale tenue à jour par NOTIFY
+  (plusieurs machines derrière un répartiteur).
+
+Les compteurs ne font que croître : `incr` ajoute 1, `advance` ne remplace la
+valeur que par une valeur plus grande. `epoch` identifie l'espace des
+compteurs : il change si celui-ci est recréé (fichier supprimé...).
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import uuid
+
+from sqlalchemy import text
+
+from apps.database_configuration import db_manager, db_settings, SHARED_STATE_CHANNEL
+from apps.pg_listener import pg_listener
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fichier shm : en-tête (signature, epoch) puis emplacements (nom, valeur)
+SHM_MAGIC = b"ESPSTAT1"
+SHM_HEADER = struct.Struct("<8s8s48x")
+SHM_SLOT = struct.Struct("<56sq")
+SHM_SLOTS = 128
+
+
+class SharedState:
+    """Compteurs en mémoire du processus (backend local, un seul worker)"""
+
+    backend = "local"
+    # Vrai si les compteurs sont vus par les autres processus
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self.epoch = uuid.uuid4().hex[:8]
+        self._writes = 0
+
+    def get(self, name: str) -> int:
+        return self._values.get(name, 0)
+
+    def incr(self, name: str) -> int:
+        """Incrémente le compteur `name` et retourne sa nouvelle valeur"""
+        with self._lock:
+            value = self._values.get(name, 0) + 1
+            self._values[name] = value
+            self._writes += 1
+        return value
+
+    def advance(self, name: str, value: int) -> bool:
+        """Porte le compteur à `value` s'il est inférieur ; vrai s'il a changé"""
+        with self._lock:
+            if self._values.get(name, 0) >= value:
+                return False
+            self._values[name] = value
+            self._writes += 1
+        return True
+
+    def stats(self) -> dict:
+        """Compteurs exposés sur /metrics"""
+        return {
+            "backend": self.backend,
+            "epoch": self.epoch,
+            "writes": self._writes,
+            "values": {name: self.get(name) for name in sorted(self._names())}
+        }
+
+    def _names(self):
+        return list(self._values)
+
+
+class SharedMemoryState(SharedState):
+    """Compteurs dans un fichier projeté en mémoire, partagé par les workers d'une machine.
+
+    Les lectures se font sans verrou (valeurs de 8 octets alignées) ; les
+    écritures sont sérialisées par un verrou flock sur le fichier, doublé d'un
+    verrou de thread (flock ne sépare pas les threads d'un même processus).
+    Le fichier est créé complet puis lié sous son nom définitif : un autre
+    processus ne voit jamais un en-tête à moitié écrit.
+    """
+
+    backend = "shm"
+    shared = True
+
+    def __init__(self, path: str, slots: int = SHM_SLOTS):
+        super().__init__()
+        self.path = path
+        self.slots = slots
+        self._size = SHM_HEADER.size + slots * SHM_SLOT.size
+        self._index = {}
+        if not os.path.exists(path):
+            self._create()
+        self._fd = os.open(path, os.O_RDWR)
+        try:
+            if os.fstat(self._fd).st_size != self._size:
+                raise RuntimeError(f"Taille inattendue pour {path}")
+            self._map = mmap.mmap(self._fd, self._size)
+            magic, epoch = SHM_HEADER.unpack_from(self._map, 0)
+            if magic != SHM_MAGIC:
+                raise RuntimeError(f"Signature inattendue pour {path}")
+        except Exception:
+            os.close(self._fd)
+            raise
+        self.epoch = epoch.decode()
+        logger.info(f"État partagé en mémoire: {path} (epoch {self.epoch})")
+
+    def _create(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SHM_HEADER.pack(SHM_MAGIC, uuid.uuid4().hex[:8].encode()))
+            f.write(bytes(self._size - SHM_HEADER.size))
+        try:
+            # Échoue si un autre worker a créé le fichier entre-temps
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    def _offset(self, slot: int) -> int:
+        return SHM_HEADER.size + slot * SHM_SLOT.size
+
+    def _find(self, key: bytes, create: bool):
+        """Emplacement du compteur (None s'il n'existe pas et que create est faux)"""
+        slot = self._index.get(key)
+        if slot is not None:
+            return slot
+        free = None
+        for slot in range(self.slots):
+            name = self._map[self._offset(slot):self._offset(slot) + 56].rstrip(b"\0")
+            if name == key:
+                self._index[key] = slot
+                return slot
+            if not name and free is None:
+                free = slot
+                # Les emplacements sont attribués dans l'ordre : la suite est vide
+                break
+        if not create:
+            return None
+        if free is None:
+            raise RuntimeError(f"Plus d'emplacement libre dans {self.path}")
+        SHM_SLOT.pack_into(self._map, self._offset(free), key, 0)
+        self._index[key] = free
+        return free
+
+    @staticmethod
+    def _key(name: str) -> bytes:
+        key = name.encode()
+        if not key or len(key) > 56:
+            raise ValueError(f"Nom de compteur invalide: {name!r}")
+        return key
+
+    def get(self, name: str) -> int:
+        slot = self._find(self._key(name), create=False)
+        if slot is None:
+            return 0
+        return SHM_SLOT.unpack_from(self._map, self._offset(slot))[1]
+
+    def _update(self, name: str, compute):
+        key = self._key(name)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = self._find(key, create=True)
+                offset = self._offset(slot)
+                current = SHM_SLOT.unpack_from(self._map, offset)[1]
+                value = compute(current)
+                if value is not None:
+                    struct.pack_into("<q", self._map, offset + 56, value)
+                    self._writes += 1
+                return current, value
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def incr(self, name: str) -> int:
+        return self._update(name, lambda current: current + 1)[1]
+
+    def advance(self, name: str, value: int) -> bool:
+        return self._update(name, lambda current: value if value > current else None)[1] is not None
+
+    def _names(self):
+        names = []
+        for slot in range(self.slots):
+            name = self._map[self._offset(slot):self._offset(slot) + 56].rstrip(b"\0")
+            if not name:
+                break
+            names.append(name.decode())
+        return names
+
+
+class PostgresSharedState(SharedState):
+    """Compteurs dans la table shared_state, pour des workers sur plusieurs machines.
+
+    Chaque écriture est une requête (upsert) qui notifie la nouvelle valeur sur
+    SHARED_STATE_CHANNEL ; les lectures se font sur la copie locale, tenue à
+    jour par l'écouteur LISTEN/NOTIFY et relue entièrement à chaque connexion.
+    """
+
+    backend = "postgres"
+    shared = True
+
+    INCR_SQL = text(f"""
+        WITH updated AS (
+            INSERT INTO shared_state AS s (name, value, updated_at) VALUES (:name, 1, now())
+            ON CONFLICT (name) DO UPDATE SET value = s.value + 1, updated_at = now()
+            RETURNING value
+        )
+        SELECT value, pg_notify('{SHARED_STATE_CHANNEL}', :name || '=' || value) FROM updated
+    """)
+    ADVANCE_SQL = text(f"""
+        WITH updated AS (
+            INSERT INTO shared_state AS s (name, value, updated_at) VALUES (:name, :value, now())
+            ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+            WHERE s.value < EXCLUDED.value
+            RETURNING value
+        )
+        SELECT value, pg_notify('{SHARED_STATE_CHANNEL}', :name || '=' || value) FROM updated
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self.reload()
+        pg_listener.subscribe(SHARED_STATE_CHANNEL, self.handle_notification)
+        pg_listener.on_connect(self.reload)
+
+    def reload(self):
+        """Relit tous les compteurs (démarrage, reconnexion de l'écouteur)"""
+        try:
+            with db_manager.engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO shared_state (name, value) VALUES ('epoch', :value) ON CONFLICT (name) DO NOTHING"),
+                    {"value": int(uuid.uuid4().hex[:8], 16)}
+                )
+                rows = conn.execute(text("SELECT name, value FROM shared_state")).all()
+            with self._lock:
+                for name, value in rows:
+                    if name == 'epoch':
+                        self.epoch = f"{value:08x}"
+                    elif value > self._values.get(name, 0):
+                        self._values[name] = value
+            logger.info(f"État partagé relu depuis la base (epoch {self.epoch})")
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture de l'état partagé: {e}")
+
+    def handle_notification(self, payload: str):
+        """Valeur écrite par un autre processus : « nom=valeur »"""
+        name, _, value = payload.rpartition("=")
+        self._mirror(name, int(value))
+
+    def _mirror(self, name: str, value: int):
+        with self._lock:
+            if value > self._values.get(name, 0):
+                self._values[name] = value
+
+    def _execute(self, statement, name: str, **params):
+        """Exécute un upsert : nouvelle valeur, ou None si elle n'a pas changé"""
+        with db_manager.engine.begin() as conn:
+            row = conn.execute(statement, {"name": name, **params}).first()
+        if row is None:
+            return None
+        self._writes += 1
+        self._mirror(name, row[0])
+        return row[0]
+
+    def incr(self, name: str) -> int:
+        try:
+            return self._execute(self.INCR_SQL, name)
+        except Exception as e:
+            # Base indisponible : la valeur locale change tout de même
+            logger.error(f"Erreur lors de l'écriture de l'état partagé {name}: {e}")
+            return super().incr(name)
+
+    def advance(self, name: str, value: int) -> bool:
+        try:
+            return self._execute(self.ADVANCE_SQL, name, value=value) is not None
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture de l'état partagé {name}: {e}")
+            return super().advance(name, value)
+
+
+def default_shm_path() -> str:
+    """Fichier partagé par les workers qui servent la même base"""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"esp32-fastapi-{db_settings.db_name}-{db_settings.db_port}.state")
+
+
+def create_shared_state(backend: str) -> SharedState:
+    """Instancie le backend demandé ; à défaut, état local au processus"""
+    try:
+        if backend == "shm":
+            return SharedMemoryState(db_settings.db_shared_state_path or default_shm_path())
+        if backend == "postgres":
+            return PostgresSharedState()
+        if backend != "local":
+            logger.warning(f"Backend d'état partagé inconnu: {backend}, état local utilisé")
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ouverture de l'état partagé {backend}: {e}, état local utilisé")
+    return SharedState()
+
+
+# Instance globale de l'état partagé
+shared_state = create_shared_state(db_settings.db_shared_state_backend)
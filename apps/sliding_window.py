@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import bisect
+from collections import deque
+
+
+class SlidingWindowMax:
+    """Maximum glissant sur des valeurs horodatées (file monotone).
+
+    La file contient des couples (période, valeur) triés par période croissante
+    et valeur strictement décroissante : une valeur dominée par une valeur plus
+    récente ne peut plus jamais être le maximum et n'est pas conservée. Le
+    maximum de la fenêtre est donc toujours en tête (O(1)), et chaque valeur
+    n'est ajoutée et retirée qu'une fois (O(1) amorti).
+
+    Les ajouts hors ordre (rejeu du journal, import historique) restent corrects
+    au prix d'une insertion en O(n), n étant le nombre de périodes conservées.
+    """
+
+    def __init__(self):
+        self._items = deque()
+
+    def add(self, bucket, value):
+        """Ajoute la valeur maximale observée pour une période"""
+        if value is None:
+            return
+        items = self._items
+        if not items or bucket > items[-1][0]:
+            # Cas courant : période la plus récente
+            while items and items[-1][1] <= value:
+                items.pop()
+            items.append((bucket, value))
+            return
+
+        # Période déjà connue ou plus ancienne que la dernière
+        position = bisect.bisect_left([item[0] for item in items], bucket)
+        if position < len(items) and items[position][0] == bucket:
+            if items[position][1] >= value:
+                return
+            del items[position]
+        # Dominée par une valeur au moins aussi récente : inutile
+        if position < len(items) and items[position][1] >= value:
+            return
+        items.insert(position, (bucket, value))
+        while position > 0 and items[position - 1][1] <= value:
+            del items[position - 1]
+            position -= 1
+
+    def expire(self, start):
+        """Retire les périodes antérieures au début de la fenêtre"""
+        while self._items and self._items[0][0] < start:
+            self._items.popleft()
+
+    def max(self, start=None):
+        """Maximum des périodes >= start (None si la fenêtre est vide)"""
+        if start is not None:
+            self.expire(start)
+        return self._items[0][1] if self._items else None
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Configuration gunicorn : plusieurs workers uvicorn pour run:app.
+
+Usage :
+    gunicorn run:app                 (fichier chargé automatiquement depuis ce répertoire)
+    APP_WORKERS=4 gunicorn -c gunicorn.conf.py run:app
+
+Chaque worker a son pool de connexions (DB_POOL_SIZE + DB_MAX_OVERFLOW) et son
+écouteur LISTEN/NOTIFY : vérifier max_connections côté PostgreSQL.
+"""
+import multiprocessing
+import os
+
+# Compteurs partagés entre workers (versions des ETag) : mémoire partagée par défaut
+os.environ.setdefault("DB_SHARED_STATE_BACKEND", "shm")
+
+wsgi_app = "run:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '5005')}"
+workers = int(os.getenv("APP_WORKERS", str(multiprocessing.cpu_count())))
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+accesslog = "-"
+
+# Délai de surveillance des workers (boucle asyncio bloquée), pas une durée maximale
+# de requête : les flux SSE et les WebSocket restent ouverts
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Doit dépasser INGEST_SHUTDOWN_TIMEOUT (20 s) : au-delà, la file d'ingestion est journalisée
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
@@ -18,6 +18,8 @@ import jwt
 # Import adapté
 from apps import post_temp_humidity
 from apps.database_configuration import get_db, db_manager, DatabaseSettings
+from apps.data_table_cache import data_table_cache
+from apps.async_db import run_db
 
 # Configuration des logs
 logging.basicConfig(
@@ -43,6 +45,7 @@ class Settings:
     APP_RELOAD: bool = os.getenv("APP_RELOAD", "False").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "info").lower()
     CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "*").split(",")
+    DATATABLE_WINDOW_HOURS: int = int(os.getenv("DATATABLE_WINDOW_HOURS", "24"))
 
 settings = Settings()
 
@@ -301,7 +304,7 @@ async def post_values(request: Request, api_key: str = Depends(get_api_key)):
         num_failed_sensors = int(data.get('numFailedSensors', 0))
         
         date_serveur = datetime.datetime.now(timezone.utc)
-        results = []
+        rows = []
         sensor_count = 0
         
         # Traitement des données des capteurs
@@ -321,7 +324,7 @@ async def post_values(request: Request, api_key: str = Depends(get_api_key)):
                     if not (-50 <= temperature <= 100):
                         raise ValueError("La température doit être entre -50 et 100")
                     
-                    data_to_insert = {
+                    rows.append({
                         'sensor': sensor_name,
                         'temperature': temperature,
                         'humidity': humidity,
@@ -331,10 +334,7 @@ async def post_values(request: Request, api_key: str = Depends(get_api_key)):
                         'humidifier_status': humidifier_status,
                         'numfailedsensors': num_failed_sensors,
                         'date_serveur': date_serveur
-                    }
-                    
-                    result = post_temp_humidity.add_data(data_to_insert)
-                    results.append(result)
+                    })
                     
                 except (KeyError, ValueError, TypeError) as e:
                     logger.error(f"Erreur données capteur {sensor_name}: {e}")
@@ -349,7 +349,7 @@ async def post_values(request: Request, api_key: str = Depends(get_api_key)):
                 detail="Aucune donnée de capteur trouvée"
             )
         
-        if all(results):
+        if post_temp_humidity.add_data_batch(rows):
             logger.info(f"Données enregistrées avec succès: {sensor_count} capteurs")
             return APIResponse(
                 message=f"Données reçues et enregistrées avec succès ({sensor_count} capteurs)",
@@ -719,10 +719,19 @@ async def logout():
 
 @app.get("/datatable")
 async def get_data_table(api_key: str = Depends(get_api_key)):
-    """Get data table"""
+    """Get data table
+
+    Ne renvoie plus tout l'historique : seulement la fenêtre des
+    DATATABLE_WINDOW_HOURS dernières heures (24 h par défaut), agrégée par minute.
+    La lecture est bloquante et s'exécute dans le pool de threads de la base.
+    """
     try:
-        data = post_temp_humidity.data_table()
-        return data
+        start = datetime.datetime.now() - datetime.timedelta(hours=settings.DATATABLE_WINDOW_HOURS)
+        result = await run_db(data_table_cache.rows, start)
+        if result is None:
+            raise RuntimeError("Lecture de la table de données impossible")
+        keys, rows, _ = result
+        return post_temp_humidity.format_data_table(keys, rows)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
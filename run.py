@@ -1,24 +1,48 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI, HTTPException, Depends, status, Request, Body
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Body, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any, Union
+import asyncio
+import functools
+import base64
+import binascii
 import datetime
 from datetime import timedelta, timezone
 import os
+import io
+import csv
 import json
 from pathlib import Path
 import logging
+import tempfile
 import jwt
 from contextlib import asynccontextmanager
 
 # Import adapté
 from apps import post_temp_humidity
-from apps.database_configuration import get_db, db_manager, DatabaseSettings
+from apps.database_configuration import get_db, db_manager, db_settings, DatabaseSettings, DATA_TEMP_CHANNEL, PARAMETER_CHANNEL
+from apps.async_db import db_executor, run_db, run_periodically, shutdown_db_executor
+from apps.ingestion_buffer import IngestionBuffer, IngestionBufferFull
+from apps.ingestion_journal import IngestionJournal, JournalReplayer
+from apps import bulk_loader
+from apps.retention import retention_manager
+from apps.pg_listener import pg_listener
+from apps.live_state import live_state
+from apps.sensor_stream import SensorStream, format_sse
+from apps.sensor_frame import parse_frame, FrameError
+from apps.binary_frame import decode_frame, BINARY_FRAME_CONTENT_TYPE
+from apps.data_table_cache import data_table_cache
+from apps.query_cache import query_cache
+from apps.parameter_state import parameter_state
+from apps.data_version import data_version, DATA, PARAMETER
+from apps.shared_state import shared_state
+from apps.command_watch import CommandWatch
 
 # Configuration des logs
 logging.basicConfig(
@@ -43,8 +67,32 @@ class Settings:
         self.APP_HOST: str = os.getenv("APP_HOST", "0.0.0.0")
         self.APP_PORT: int = int(os.getenv("APP_PORT", "5005"))
         self.APP_RELOAD: bool = os.getenv("APP_RELOAD", "False").lower() == "true"
+        self.APP_WORKERS: int = int(os.getenv("APP_WORKERS", "1"))
         self.LOG_LEVEL: str = os.getenv("LOG_LEVEL", "info").lower()
         self.CORS_ORIGINS: List[str] = self._get_cors_origins()
+        self.INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))
+        self.INGEST_BATCH_ROWS: int = int(os.getenv("INGEST_BATCH_ROWS", "500"))
+        self.INGEST_FLUSH_INTERVAL: float = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+        self.INGEST_RETRY_AFTER: int = int(os.getenv("INGEST_RETRY_AFTER", "5"))
+        # Délai de vidage de la file à l'arrêt, inférieur au graceful_timeout de gunicorn (30 s)
+        self.INGEST_SHUTDOWN_TIMEOUT: float = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", "20"))
+        self.BULK_MAX_BYTES: int = int(os.getenv("BULK_MAX_BYTES", str(512 * 1024 * 1024)))
+        self.JOURNAL_DIR: str = os.getenv("JOURNAL_DIR", "journal")
+        self.JOURNAL_SEGMENT_SECONDS: int = int(os.getenv("JOURNAL_SEGMENT_SECONDS", "3600"))
+        self.JOURNAL_FSYNC_EVERY: int = int(os.getenv("JOURNAL_FSYNC_EVERY", "50"))
+        self.JOURNAL_FSYNC_INTERVAL: float = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1.0"))
+        self.JOURNAL_REPLAY_BATCH_ROWS: int = int(os.getenv("JOURNAL_REPLAY_BATCH_ROWS", "500"))
+        self.JOURNAL_REPLAY_ROWS_PER_SECOND: float = float(os.getenv("JOURNAL_REPLAY_ROWS_PER_SECOND", "1000"))
+        self.SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        self.SSE_RETRY_MS: int = int(os.getenv("SSE_RETRY_MS", "3000"))
+        self.SSE_HISTORY_SIZE: int = int(os.getenv("SSE_HISTORY_SIZE", "256"))
+        self.SSE_QUEUE_SIZE: int = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+        self.COMMAND_WAIT_MAX_SECONDS: float = float(os.getenv("COMMAND_WAIT_MAX_SECONDS", "60"))
+        self.STREAM_BATCH_ROWS: int = int(os.getenv("STREAM_BATCH_ROWS", "2000"))
+        self.ALLDATA_TARGET_POINTS: int = int(os.getenv("ALLDATA_TARGET_POINTS", "3000"))
+        self.DATATABLE_WINDOW_HOURS: int = int(os.getenv("DATATABLE_WINDOW_HOURS", "24"))
+        # Marge retranchée de since, en plus de la marque (début de la plus ancienne transaction ouverte)
+        self.DATATABLE_SINCE_OVERLAP: float = float(os.getenv("DATATABLE_SINCE_OVERLAP", "30"))
 
     def _get_api_keys(self) -> List[str]:
         """Récupère et valide les clés API"""
@@ -147,8 +195,16 @@ api_key_manager = APIKeyManager()
 
 async def get_api_key(request: Request) -> str:
     """Extrait et valide la clé API des headers"""
-    api_key = request.headers.get('X-API-KEY')
-    
+    return _check_api_key(request, request.headers.get('X-API-KEY'))
+
+
+async def get_stream_api_key(request: Request) -> str:
+    """Clé API d'un flux SSE : header X-API-KEY ou paramètre api_key (EventSource n'envoie pas de headers)"""
+    return _check_api_key(request, request.headers.get('X-API-KEY') or request.query_params.get('api_key'))
+
+
+def _check_api_key(request: Request, api_key: Optional[str]) -> str:
+    """Valide une clé API (HTTP 401 si absente ou inconnue)"""
     if not api_key:
         logger.warning(f"Tentative d'accès sans clé API depuis {request.client.host if request.client else 'unknown'}")
         raise HTTPException(
@@ -257,6 +313,58 @@ class TokenManager:
 
 token_manager = TokenManager()
 
+# Journal disque des trames reçues pendant une indisponibilité de la base
+ingestion_journal = IngestionJournal(
+    directory=settings.JOURNAL_DIR,
+    segment_seconds=settings.JOURNAL_SEGMENT_SECONDS,
+    fsync_every=settings.JOURNAL_FSYNC_EVERY,
+    fsync_interval=settings.JOURNAL_FSYNC_INTERVAL
+)
+journal_replayer = JournalReplayer(
+    ingestion_journal,
+    batch_rows=settings.JOURNAL_REPLAY_BATCH_ROWS,
+    rows_per_second=settings.JOURNAL_REPLAY_ROWS_PER_SECOND
+)
+
+# File d'ingestion différée des trames /values
+ingestion_buffer = IngestionBuffer(
+    max_frames=settings.INGEST_QUEUE_SIZE,
+    batch_rows=settings.INGEST_BATCH_ROWS,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL,
+    shutdown_timeout=settings.INGEST_SHUTDOWN_TIMEOUT,
+    journal=ingestion_journal
+)
+
+# Diffusion SSE des nouvelles trames
+sensor_stream = SensorStream(
+    live_state,
+    history_size=settings.SSE_HISTORY_SIZE,
+    queue_size=settings.SSE_QUEUE_SIZE
+)
+
+# État courant des capteurs, tenu à jour par les notifications de data_temp.
+# L'ordre compte : le flux SSE publie l'état déjà mis à jour.
+pg_listener.subscribe(DATA_TEMP_CHANNEL, live_state.handle_notification)
+pg_listener.subscribe(DATA_TEMP_CHANNEL, sensor_stream.handle_notification)
+pg_listener.on_connect(live_state.load)
+pg_listener.on_connect(sensor_stream.publish_snapshot)
+# Écritures des autres processus (ou manquées pendant une coupure) : ETag invalidés.
+# Abonné après live_state : /WeatherData change encore de version une fois l'état à jour.
+pg_listener.subscribe(DATA_TEMP_CHANNEL, data_version.handle_notification)
+pg_listener.on_connect(data_version.handle_notification)
+# Paramètres en mémoire : chargés à la connexion, rechargés à chaque modification
+# (par ce worker ou un autre), avant le changement de version des ETag
+pg_listener.subscribe(PARAMETER_CHANNEL, parameter_state.handle_notification)
+pg_listener.subscribe(PARAMETER_CHANNEL, functools.partial(data_version.handle_notification, scope=PARAMETER))
+pg_listener.on_connect(parameter_state.load)
+pg_listener.on_connect(functools.partial(data_version.handle_notification, scope=PARAMETER))
+
+# Commande des ESP32 (/commands/wait) : recalculée une fois live_state et parameter_state à jour
+command_watch = CommandWatch(live_state)
+pg_listener.subscribe(DATA_TEMP_CHANNEL, command_watch.handle_notification)
+pg_listener.subscribe(PARAMETER_CHANNEL, command_watch.handle_notification)
+pg_listener.on_connect(command_watch.handle_notification)
+
 
 # Context manager pour le cycle de vie de l'application
 @asynccontextmanager
@@ -267,14 +375,46 @@ async def lifespan(app: FastAPI):
     logger.info(f"Configuration: Host={settings.APP_HOST}, Port={settings.APP_PORT}")
     
     # Vérification de la santé de la base de données
-    if not db_manager.health_check():
+    if not await run_db(db_manager.health_check):
         logger.error("Connexion à la base de données échouée au démarrage")
     else:
         logger.info("Connexion à la base de données réussie")
     
+    # État courant en mémoire, rechargé à chaque (re)connexion de l'écouteur NOTIFY
+    sensor_stream.attach(asyncio.get_running_loop())
+    command_watch.attach(asyncio.get_running_loop())
+    pg_listener.start()
+    await ingestion_buffer.start()
+    await journal_replayer.start()
+    # Création des partitions à venir / suppression des partitions expirées
+    # (un seul worker à la fois : verrou consultatif PostgreSQL)
+    partition_task = asyncio.create_task(
+        run_periodically(
+            db_settings.db_partition_maintenance_interval,
+            db_manager.run_exclusive, "partition-maintenance", db_manager.maintain_partitions
+        ),
+        name="partition-maintenance"
+    )
+    # Suppression par lots des relevés bruts déjà compactés en agrégats horaires
+    retention_task = asyncio.create_task(
+        run_periodically(
+            db_settings.db_retention_interval,
+            db_manager.run_exclusive, "retention", retention_manager.run_once
+        ),
+        name="retention"
+    )
+    
     yield
     
     # Shutdown
+    sensor_stream.close()
+    command_watch.close()
+    partition_task.cancel()
+    retention_task.cancel()
+    await ingestion_buffer.stop()
+    await journal_replayer.stop()
+    await asyncio.to_thread(pg_listener.stop)
+    shutdown_db_executor()
     logger.info("Arrêt de l'application Weather Monitoring API")
 
 
@@ -299,6 +439,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Resolution", "ETag", "Last-Modified"],
 )
 
 # Configuration des fichiers statiques et templates
@@ -332,7 +473,7 @@ async def log_requests(request: Request, call_next):
     # Log de la requête
     logger.info(
         f"Method: {request.method} | "
-        f"URL: {request.url} | "
+        f"URL: {request.url.remove_query_params('api_key')} | "
         f"Status: {response.status_code} | "
         f"Process time: {process_time:.4f}s"
     )
@@ -358,121 +499,62 @@ async def read_root(request: Request):
     """)
 
 
-@app.post("/values", response_model=APIResponse, tags=["Données"])
+async def _parameter_call(func, *args):
+    """Appelle une fonction de post_temp_humidity qui lit les paramètres.
+
+    Tant que l'instantané en mémoire est à jour, elle n'accède pas à la base :
+    appel direct, sans passer par le pool de threads. Sinon (démarrage,
+    instantané plus vieux que max_age) il est relu dans le pool.
+    """
+    if parameter_state.fresh:
+        return func(*args)
+    return await run_db(func, *args)
+
+
+@app.post("/values", response_model=APIResponse, status_code=status.HTTP_202_ACCEPTED, tags=["Données"])
 async def post_values(request: Request, api_key: str = Depends(get_api_key)):
-    """Enregistre les données des capteurs"""
+    """Valide les données des capteurs et les place dans la file d'ingestion.
+
+    Le corps est en JSON, ou au format binaire compact de apps.binary_frame
+    avec Content-Type: application/x-sensor-frame.
+    """
     try:
-        data = await request.json()
-        
-        # Validation des données principales
-        required_fields = ['average_temperature', 'average_humidity', 'fan_status', 'humidifier_status', 'numFailedSensors']
-        missing_fields = [field for field in required_fields if field not in data]
-        
-        if missing_fields:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Champs requis manquants: {', '.join(missing_fields)}"
-            )
-        
-        # Validation des valeurs
-        avg_temp = data.get('average_temperature')
-        avg_hum = data.get('average_humidity')
-        
-        if not post_temp_humidity.validate_temperature(avg_temp):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Valeur de température invalide: {avg_temp}"
-            )
-            
-        if not post_temp_humidity.validate_humidity(avg_hum):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Valeur d'humidité invalide: {avg_hum}"
-            )
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
         
-        # Extraction et validation des valeurs de base
         try:
-            average_temperature = float(avg_temp)
-            average_humidity = float(avg_hum)
-            fan_status = str(data.get('fan_status'))
-            humidifier_status = str(data.get('humidifier_status'))
-            num_failed_sensors = int(data.get('numFailedSensors', 0))
-        except (ValueError, TypeError) as e:
+            if content_type == BINARY_FRAME_CONTENT_TYPE:
+                data = decode_frame(await request.body())
+            else:
+                data = await request.json()
+            # parse_frame vérifie aussi les limites des colonnes (nom de capteur, int4)
+            rows = parse_frame(data)
+        except FrameError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Erreur de conversion des données: {e}"
+                detail=str(e)
             )
+        sensor_count = len(rows)
+        num_failed_sensors = rows[0]['numfailedsensors']
         
-        date_serveur = datetime.datetime.now(timezone.utc)
-        results = []
-        sensor_count = 0
-        
-        # Traitement des données des capteurs
-        for sensor_name, sensor_data in data.items():
-            if sensor_name.startswith('sensor'):
-                sensor_count += 1
-                try:
-                    if not isinstance(sensor_data, dict):
-                        raise ValueError("Les données du capteur doivent être un objet")
-                    
-                    if 'humidity' not in sensor_data or 'temperature' not in sensor_data:
-                        raise ValueError("Données de capteur incomplètes (humidity/temperature manquants)")
-                    
-                    humidity = float(sensor_data['humidity'])
-                    temperature = float(sensor_data['temperature'])
-                    
-                    # Validation des valeurs individuelles
-                    if not (0 <= humidity <= 100):
-                        raise ValueError(f"L'humidité doit être entre 0 et 100, reçu: {humidity}")
-                    if not (-50 <= temperature <= 100):
-                        raise ValueError(f"La température doit être entre -50 et 100, reçu: {temperature}")
-                    
-                    data_to_insert = {
-                        'sensor': sensor_name,
-                        'temperature': temperature,
-                        'humidity': humidity,
-                        'average_humidity': average_humidity,
-                        'average_temperature': average_temperature,
-                        'fan_status': fan_status,
-                        'humidifier_status': humidifier_status,
-                        'numfailedsensors': num_failed_sensors,
-                        'date_serveur': date_serveur
-                    }
-                    
-                    result = post_temp_humidity.add_data(data_to_insert)
-                    results.append(result)
-                    
-                except (KeyError, ValueError, TypeError) as e:
-                    logger.error(f"Erreur données capteur {sensor_name}: {e}")
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Données invalides pour {sensor_name}: {str(e)}"
-                    )
-        
-        if sensor_count == 0:
+        # La trame est écrite en base par lots, en arrière-plan
+        try:
+            ingestion_buffer.submit(rows)
+        except IngestionBufferFull as e:
+            logger.warning(f"Trame refusée: {e}")
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Aucune donnée de capteur trouvée (aucun champ commençant par 'sensor')"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="File d'ingestion pleine, réessayez plus tard",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER)},
             )
         
-        successful_inserts = sum(1 for result in results if result)
-        
-        if successful_inserts == sensor_count:
-            logger.info(f"Données enregistrées avec succès: {sensor_count} capteurs")
-            return APIResponse(
-                message=f"Données reçues et enregistrées avec succès ({sensor_count} capteurs)",
-                data={
-                    "sensors_processed": sensor_count,
-                    "sensors_successful": successful_inserts,
-                    "failed_sensors": num_failed_sensors
-                }
-            )
-        else:
-            logger.error(f"Échec partiel: {successful_inserts}/{sensor_count} capteurs enregistrés")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Échec partiel de l'enregistrement: {successful_inserts}/{sensor_count} capteurs enregistrés"
-            )
+        logger.info(f"Données mises en file d'attente: {sensor_count} capteurs")
+        return APIResponse(
+            message=f"Données reçues et mises en file d'enregistrement ({sensor_count} capteurs)",
+            data={
+                "sensors_processed": sensor_count,
+                "failed_sensors": num_failed_sensors
+            }
+        )
             
     except HTTPException:
         raise
@@ -490,11 +572,143 @@ async def post_values(request: Request, api_key: str = Depends(get_api_key)):
         )
 
 
+@app.websocket("/ws/values")
+async def ws_values(websocket: WebSocket):
+    """Canal persistant d'ingestion pour les ESP32.
+
+    La clé API est vérifiée une seule fois à l'ouverture (header X-API-KEY ou
+    paramètre api_key). Chaque message est une trame au format de /values (texte
+    JSON avec un champ optionnel "seq", ou message binaire de apps.binary_frame) ;
+    il est acquitté sur la même connexion avec la commande courante du
+    ventilateur, de l'humidificateur et du moteur.
+    """
+    api_key = websocket.headers.get('X-API-KEY') or websocket.query_params.get('api_key')
+    client_host = websocket.client.host if websocket.client else 'unknown'
+    if not api_key or not api_key_manager.validate_api_key(api_key):
+        logger.warning(f"Connexion WebSocket refusée (clé API manquante ou invalide) depuis {client_host}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    logger.info(f"Connexion WebSocket d'ingestion ouverte depuis {client_host}")
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            seq = None
+            try:
+                if message.get("bytes") is not None:
+                    data = decode_frame(message["bytes"])
+                else:
+                    data = json.loads(message["text"])
+                if isinstance(data, dict):
+                    seq = data.pop('seq', None)
+                rows = parse_frame(data)
+            except (json.JSONDecodeError, FrameError) as e:
+                detail = "Format JSON invalide" if isinstance(e, json.JSONDecodeError) else str(e)
+                await websocket.send_json({"seq": seq, "status": "error", "detail": detail})
+                continue
+
+            # Même file d'ingestion que /values : les trames sont écrites par lots
+            try:
+                ingestion_buffer.submit(rows)
+            except IngestionBufferFull as e:
+                logger.warning(f"Trame WebSocket refusée: {e}")
+                await websocket.send_json({
+                    "seq": seq,
+                    "status": "busy",
+                    "retry_after": settings.INGEST_RETRY_AFTER
+                })
+                continue
+
+            command = await _parameter_call(
+                post_temp_humidity.get_device_command,
+                rows[0]['average_temperature'],
+                rows[0]['average_humidity']
+            )
+            await websocket.send_json({
+                "seq": seq,
+                "status": "accepted",
+                "sensors": len(rows),
+                "command": command
+            })
+    except WebSocketDisconnect:
+        logger.info(f"Connexion WebSocket d'ingestion fermée ({client_host})")
+
+
+@app.post("/values/bulk", response_model=APIResponse, tags=["Données"])
+async def post_values_bulk(request: Request, chunk_size: int = 10000, api_key: str = Depends(get_api_key)):
+    """Import en masse de relevés historiques (CSV ou NDJSON) via COPY.
+
+    Chaque bloc de chunk_size relevés est validé séparément : en cas d'échec,
+    le détail de l'erreur indique rows_loaded (déjà en base) et
+    resume_from_record (premier relevé à renvoyer).
+    """
+    if not 1 <= chunk_size <= 100000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="chunk_size doit être compris entre 1 et 100000"
+        )
+    file_format = bulk_loader.detect_format(request.headers.get("content-type", ""))
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Fichier trop volumineux (limite : {settings.BULK_MAX_BYTES} octets)"
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.BULK_MAX_BYTES:
+        raise too_large
+    
+    # Le corps est reçu en flux et mis en tampon (sur disque au-delà de 8 Mo),
+    # dans la limite de BULK_MAX_BYTES (corps envoyé sans Content-Length)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.BULK_MAX_BYTES:
+                raise too_large
+            spool.write(chunk)
+        spool.seek(0)
+        
+        def progress(loaded, rejected):
+            logger.info(f"Import en masse: {loaded} lignes chargées, {rejected} rejetées")
+        
+        try:
+            with io.TextIOWrapper(spool, encoding="utf-8", newline="") as text_stream:
+                report = await run_db(bulk_loader.load_file, text_stream, file_format, chunk_size, progress)
+        except bulk_loader.BulkLoadError as e:
+            # Blocs déjà validés : le client doit savoir où reprendre pour éviter les doublons
+            unreadable = isinstance(e.__cause__, (UnicodeDecodeError, csv.Error))
+            if not unreadable:
+                logger.error(f"Erreur lors de l'import en masse: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST if unreadable else status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={
+                    "message": f"Fichier illisible: {e}" if unreadable else "Échec de l'import en masse",
+                    **e.report
+                }
+            )
+        except Exception as e:
+            logger.error(f"Erreur lors de l'import en masse: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Échec de l'import en masse"
+            )
+    
+    return APIResponse(
+        message=f"{report['rows_loaded']} lignes importées, {report['rows_rejected']} rejetées",
+        data=report
+    )
+
+
 @app.get("/getdata", tags=["Données"])
 async def get_data(api_key: str = Depends(get_api_key)):
     """Récupère le statut actuel du dispositif"""
     try:
-        data = post_temp_humidity.get_last_data()
+        if live_state.loaded:
+            data = live_state.last_data()
+        else:
+            data = await run_db(post_temp_humidity.get_last_data)
         if data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -504,7 +718,7 @@ async def get_data(api_key: str = Depends(get_api_key)):
         return {
             'temperature': data.get('average_temperature'),
             'humidity': data.get('average_humidity'),
-            'Motor': post_temp_humidity.post_stepper_status(),
+            'Motor': await _parameter_call(post_temp_humidity.post_stepper_status),
             'timestamp': data.get('date_serveur', datetime.datetime.now(timezone.utc))
         }
     except HTTPException:
@@ -517,12 +731,39 @@ async def get_data(api_key: str = Depends(get_api_key)):
         )
 
 
+@app.get("/commands/wait", tags=["Données"])
+async def wait_command(since: Optional[str] = None, timeout: float = 30, api_key: str = Depends(get_api_key)):
+    """Commande ventilateur / humidificateur / moteur, en attente longue (long polling).
+
+    Sans `since`, répond immédiatement. Avec le jeton de la commande reçue
+    précédemment, la requête est tenue ouverte jusqu'à ce que la commande
+    change (nouvelle trame, paramètres modifiés) ou jusqu'à `timeout` secondes
+    (plafonné à COMMAND_WAIT_MAX_SECONDS) ; `changed` indique lequel.
+    """
+    timeout = max(0.0, min(timeout, settings.COMMAND_WAIT_MAX_SECONDS))
+    try:
+        command, token = await command_watch.wait(since, timeout)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'attente de la commande: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Échec de la récupération de la commande"
+        )
+    return {"command": command, "token": token, "changed": token != since}
+
+
 @app.get("/WeatherData", tags=["Données"])
-async def get_weather_data(api_key: str = Depends(get_api_key)):
+async def get_weather_data(request: Request, api_key: str = Depends(get_api_key)):
     """Récupère les données météo actuelles"""
+    etag, not_modified = _conditional(request, DATA)
+    if not_modified:
+        return not_modified
     try:
-        weather_data = post_temp_humidity.get_weather_data()
-        return weather_data
+        if live_state.loaded:
+            weather_data = live_state.weather_data()
+        else:
+            weather_data = await run_db(post_temp_humidity.get_weather_data)
+        return JSONResponse(content=jsonable_encoder(weather_data), headers=data_version.headers(DATA, etag))
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des données météo: {e}", exc_info=True)
         raise HTTPException(
@@ -531,12 +772,76 @@ async def get_weather_data(api_key: str = Depends(get_api_key)):
         )
 
 
+@app.get("/stream/sensors", tags=["Données"])
+async def stream_sensors(request: Request, api_key: str = Depends(get_stream_api_key)):
+    """Flux Server-Sent Events des nouvelles trames capteurs.
+
+    Le premier événement est un instantané ("snapshot", même format que
+    /WeatherData) puis chaque insertion produit un événement "frame". Après une
+    coupure, le navigateur renvoie Last-Event-ID et reçoit les trames manquées
+    (ou un nouvel instantané s'il se reconnecte à un autre worker).
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    queue = sensor_stream.subscribe(last_event_id)
+
+    async def events():
+        try:
+            yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE : maintient la connexion ouverte à travers les proxys
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            sensor_stream.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _conditional(request: Request, scope: str, *extra):
+    """ETag de la réponse et, si le client l'a déjà (If-None-Match), la réponse 304.
+
+    Aucune requête n'est exécutée pour produire le 304 : l'ETag ne dépend que
+    de la version des données (data_version) et de l'URL demandée.
+    """
+    etag = data_version.etag(scope, request, *extra)
+    if data_version.is_not_modified(scope, request, etag):
+        return etag, Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=data_version.headers(scope, etag))
+    return etag, None
+
+
+def _check_format(format: str, allowed: tuple):
+    """Valide le paramètre format d'un endpoint de données (HTTP 400 sinon)"""
+    if format not in allowed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format doit valoir {', '.join(repr(value) for value in allowed)}"
+        )
+
+
 @app.get("/WeatherDF", tags=["Données"])
-async def get_weather_dataframe(api_key: str = Depends(get_api_key)):
-    """Récupère les moyennes des données météo"""
+async def get_weather_dataframe(request: Request, format: str = "json", api_key: str = Depends(get_api_key)):
+    """Récupère les moyennes des données météo (format=columnar : un tableau par champ)"""
+    _check_format(format, ("json", "columnar"))
+    etag, not_modified = _conditional(request, DATA)
+    if not_modified:
+        return not_modified
+    headers = data_version.headers(DATA, etag)
     try:
-        weather_df = post_temp_humidity.get_data_average()
-        return weather_df
+        if format == "columnar":
+            # Déjà sérialisable : pas de passage par jsonable_encoder
+            return JSONResponse(content=await run_db(post_temp_humidity.get_data_average, True), headers=headers)
+        weather_df = await run_db(post_temp_humidity.get_data_average)
+        return JSONResponse(content=jsonable_encoder(weather_df), headers=headers)
     except Exception as e:
         logger.error(f"Erreur lors de la récupération du dataframe météo: {e}", exc_info=True)
         raise HTTPException(
@@ -550,40 +855,96 @@ async def get_all_data(
     request: Request,
     date_int: Optional[str] = None,
     date_end: Optional[str] = None,
+    format: str = "json",
+    max_points: Optional[int] = None,
+    resolution: str = "auto",
     api_key: str = Depends(get_api_key)
 ):
-    """Récupère toutes les données avec filtrage optionnel par date"""
+    """Récupère toutes les données avec filtrage optionnel par date.
+
+    format=ndjson renvoie les mêmes lignes en flux (une ligne JSON par
+    enregistrement), lues par curseur côté serveur : adapté aux longues plages.
+    format=columnar renvoie un tableau par champ (graphiques).
+    max_points borne le nombre de lignes renvoyées (sous-échantillonnage LTTB
+    par capteur, qui conserve l'allure des courbes) ; au-delà de max_points
+    capteurs, seuls les premiers sont renvoyés.
+    resolution (minute, 5min, hour, day) fixe la largeur des périodes ; par
+    défaut (auto) elle est choisie selon la plage demandée. La résolution
+    utilisée est indiquée dans l'en-tête X-Resolution.
+    """
+    _check_format(format, ("json", "ndjson", "columnar"))
+    if resolution != "auto" and resolution not in post_temp_humidity.RESOLUTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"resolution doit valoir 'auto' ou {', '.join(repr(name) for name in post_temp_humidity.RESOLUTIONS)}"
+        )
+    if max_points is not None:
+        if format == "ndjson":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="max_points n'est pas disponible avec format=ndjson"
+            )
+        if not 100 <= max_points <= 100000:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="max_points doit être compris entre 100 et 100000"
+            )
     try:
         # Si aucune date n'est fournie, retourner toutes les données
         if not date_int or not date_end:
-            results = post_temp_humidity.get_all_data(None, None)
-            return results
-        
-        # Ajouter l'heure par défaut si non spécifiée
-        if ':' not in date_int:
-            date_int += " 00:00"
-        if ':' not in date_end:
-            date_end += " 23:59"
+            formatted_date_int = formatted_date_end = None
+        else:
+            # Ajouter l'heure par défaut si non spécifiée
+            if ':' not in date_int:
+                date_int += " 00:00"
+            if ':' not in date_end:
+                date_end += " 23:59"
+            
+            # Formater les dates
+            try:
+                formatted_date_int = DateFormatter.format_date(date_int)
+                formatted_date_end = DateFormatter.format_date(date_end)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Format de date invalide: {str(e)}"
+                )
+            
+            # Vérifier que la date de début est antérieure à la date de fin
+            if formatted_date_int > formatted_date_end:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="La date de début doit être antérieure à la date de fin"
+                )
         
-        # Formater les dates
-        try:
-            formatted_date_int = DateFormatter.format_date(date_int)
-            formatted_date_end = DateFormatter.format_date(date_end)
-        except ValueError as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Format de date invalide: {str(e)}"
+        # Largeur des périodes adaptée à la plage : travail en base et taille de
+        # réponse restent du même ordre quelle que soit la plage demandée
+        if resolution == "auto":
+            resolution = post_temp_humidity.choose_resolution(
+                formatted_date_int, formatted_date_end, settings.ALLDATA_TARGET_POINTS
             )
+        # Sans plage, la période par défaut dépend du jour courant
+        etag, not_modified = _conditional(
+            request, DATA, None if formatted_date_int else datetime.date.today().isoformat()
+        )
+        if not_modified:
+            return not_modified
+        headers = {"X-Resolution": resolution, **data_version.headers(DATA, etag)}
         
-        # Vérifier que la date de début est antérieure à la date de fin
-        if formatted_date_int > formatted_date_end:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La date de début doit être antérieure à la date de fin"
+        if format == "ndjson":
+            chunks = post_temp_humidity.iter_all_data_ndjson(
+                formatted_date_int, formatted_date_end, settings.STREAM_BATCH_ROWS, resolution
             )
+            return StreamingResponse(_stream_db_chunks(chunks), media_type="application/x-ndjson", headers=headers)
         
-        results = post_temp_humidity.get_all_data(formatted_date_int, formatted_date_end)
-        return results
+        results = await run_db(
+            post_temp_humidity.get_all_data, formatted_date_int, formatted_date_end,
+            format == "columnar", max_points, resolution
+        )
+        if format == "columnar":
+            # Déjà sérialisable : pas de passage par jsonable_encoder
+            return JSONResponse(content=results, headers=headers)
+        return JSONResponse(content=jsonable_encoder(results), headers=headers)
         
     except HTTPException:
         raise
@@ -595,6 +956,117 @@ async def get_all_data(
         )
 
 
+async def _stream_db_chunks(chunks):
+    """Transmet les blocs d'un générateur bloquant (curseur base de données),
+    chacun lu dans le pool run_db, et libère le curseur si le client se déconnecte.
+
+    Un générateur ne peut être fermé pendant qu'un autre thread l'exécute :
+    la fermeture est enchaînée à la fin de la lecture en cours, sans l'attendre
+    (la tâche peut être annulée à chaque await après une déconnexion).
+    """
+    pending = None
+    try:
+        while True:
+            pending = db_executor.submit(next, chunks, None)
+            chunk = await asyncio.wrap_future(pending)
+            if chunk is None:
+                break
+            yield chunk
+    except Exception as e:
+        # Les en-têtes sont déjà envoyés : le flux est simplement interrompu
+        logger.error(f"Erreur pendant la diffusion des données: {e}", exc_info=True)
+    finally:
+        if pending is None:
+            _close_db_chunks(chunks)
+        else:
+            # Lecture encore en cours : le rappel est exécuté dans son thread, à sa fin
+            pending.add_done_callback(lambda _: _close_db_chunks(chunks))
+
+
+def _close_db_chunks(chunks):
+    try:
+        db_executor.submit(chunks.close)
+    except RuntimeError:
+        # Pool arrêté (fin de l'application) : fermeture dans le thread courant
+        chunks.close()
+
+
+def _encode_cursor(last_id: int) -> str:
+    """Curseur opaque de /readings (dernier id renvoyé)"""
+    payload = json.dumps({"v": 1, "id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload.get("v") != 1 or not isinstance(payload.get("id"), int):
+            raise ValueError(payload)
+        return payload["id"]
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur invalide"
+        )
+
+
+@app.get("/readings", tags=["Données"])
+async def get_readings(
+    cursor: Optional[str] = None,
+    limit: int = 1000,
+    sensor: Optional[List[str]] = Query(None),
+    date_int: Optional[str] = None,
+    date_end: Optional[str] = None,
+    api_key: str = Depends(get_api_key)
+):
+    """Export paginé des relevés bruts (data_temp), par ordre d'insertion.
+
+    Passer `next_cursor` de la réponse en paramètre `cursor` pour obtenir la
+    page suivante, avec les mêmes filtres (sensor répétable, date_int,
+    date_end). Quand has_more est faux, l'export a atteint le dernier relevé
+    validé. Les id sont attribués à l'insertion et non à la validation : une
+    transaction encore en cours (import, rejeu du journal) peut valider plus
+    tard des id inférieurs au curseur. Reprendre plus tard avec le même
+    curseur ne garantit donc pas de voir tous les nouveaux relevés ; pour un
+    suivi continu, utiliser /datatable?since=.
+    """
+    if not 1 <= limit <= 10000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit doit être compris entre 1 et 10000"
+        )
+    after_id = _decode_cursor(cursor) if cursor else None
+    try:
+        formatted_date_int = DateFormatter.format_date(date_int) if date_int else None
+        formatted_date_end = DateFormatter.format_date(date_end) if date_end else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format de date invalide: {str(e)}"
+        )
+
+    # Une ligne de plus que la page pour savoir s'il en reste
+    rows = await run_db(
+        post_temp_humidity.get_readings, after_id, limit + 1, sensor, formatted_date_int, formatted_date_end
+    )
+    if rows is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Échec de la récupération des relevés"
+        )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # Seule la date n'est pas sérialisable telle quelle : on évite jsonable_encoder
+    for row in rows:
+        row['date_serveur'] = row['date_serveur'].isoformat() if row['date_serveur'] else None
+    return JSONResponse(content={
+        "data": rows,
+        "count": len(rows),
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(rows[-1]['id']) if rows else cursor
+    })
+
+
 @app.post("/isrunning", tags=["Statut"])
 async def check_running_status(date_request: DateRequest):
     """Vérifie si le système fonctionne pour la date donnée"""
@@ -606,7 +1078,7 @@ async def check_running_status(date_request: DateRequest):
                 detail="Format de date invalide"
             )
         
-        is_ok = post_temp_humidity.getdateinit(date_formatted)
+        is_ok = await _parameter_call(post_temp_humidity.getdateinit, date_formatted)
         return is_ok
         
     except HTTPException:
@@ -690,7 +1162,7 @@ async def create_parameter(parameter_request: ParameterRequest):
         }
         
         logger.info(f"Date de début reçue: {parameter_request.start_date}")
-        result = post_temp_humidity.create_parameter(data_to_insert)
+        result = await run_db(post_temp_humidity.create_parameter, data_to_insert)
         
         if not result:
             raise HTTPException(
@@ -723,12 +1195,15 @@ async def get_parameter_page(request: Request):
 
 
 @app.get("/api/parameter", tags=["Configuration"])
-async def get_parameter_api(api_key: str = Depends(get_api_key)):
+async def get_parameter_api(request: Request, api_key: str = Depends(get_api_key)):
     """Récupère les paramètres système"""
+    etag, not_modified = _conditional(request, PARAMETER)
+    if not_modified:
+        return not_modified
     try:
         logger.info("Demande de récupération des paramètres système")
-        result = post_temp_humidity.get_parameter()
-        return result
+        result = await _parameter_call(post_temp_humidity.get_parameter)
+        return JSONResponse(content=jsonable_encoder(result), headers=data_version.headers(PARAMETER, etag))
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des paramètres: {e}", exc_info=True)
         raise HTTPException(
@@ -755,7 +1230,7 @@ async def login(login_request: LoginRequest):
                 detail="Le mot de passe ne peut pas être vide"
             )
 
-        user_id = post_temp_humidity.login(login_request.username.strip(), login_request.password)
+        user_id = await run_db(post_temp_humidity.login, login_request.username.strip(), login_request.password)
         
         if user_id:
             # Création du token d'accès
@@ -904,11 +1379,60 @@ async def logout():
 
 
 @app.get("/datatable", tags=["Données"])
-async def get_data_table(api_key: str = Depends(get_api_key)):
-    """Récupère la table de données"""
+async def get_data_table(
+    since: Optional[str] = None,
+    date_int: Optional[str] = None,
+    format: str = "json",
+    api_key: str = Depends(get_api_key)
+):
+    """Récupère la table de données (agrégats par minute et par capteur).
+
+    Sans `since`, renvoie les périodes depuis `date_int` (par défaut les
+    DATATABLE_WINDOW_HOURS dernières heures). Avec `since` (valeur de
+    `watermark` d'une réponse précédente), renvoie seulement les périodes
+    modifiées depuis : à fusionner côté client par (heure, sensor).
+    format=columnar : un tableau par champ.
+    """
+    _check_format(format, ("json", "columnar"))
     try:
-        data = post_temp_humidity.data_table()
-        return data
+        if since:
+            try:
+                since_date = datetime.datetime.fromisoformat(since)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Paramètre since invalide: {since}"
+                )
+            result = await run_db(
+                post_temp_humidity.data_table_changes, since_date, settings.DATATABLE_SINCE_OVERLAP
+            )
+        else:
+            if date_int:
+                try:
+                    start = datetime.datetime.strptime(DateFormatter.format_date(date_int), "%Y-%m-%d %H:%M")
+                except ValueError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Format de date invalide: {str(e)}"
+                    )
+            else:
+                start = datetime.datetime.now() - timedelta(hours=settings.DATATABLE_WINDOW_HOURS)
+            # Les heures closes sont servies depuis le cache, seule l'heure en cours est relue
+            result = await run_db(data_table_cache.rows, start)
+
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Échec de la récupération de la table de données"
+            )
+        keys, rows, watermark = result
+        return JSONResponse(content={
+            "watermark": watermark.isoformat(),
+            "count": len(rows),
+            "data": post_temp_humidity.format_data_table(keys, rows, format == "columnar")
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de la table de données: {e}", exc_info=True)
         raise HTTPException(
@@ -922,13 +1446,13 @@ async def get_data_table(api_key: str = Depends(get_api_key)):
 async def health_check():
     """Endpoint de vérification de santé"""
     try:
-        db_healthy = db_manager.health_check()
+        db_healthy = await run_db(db_manager.health_check)
         app_status = "healthy" if db_healthy else "unhealthy"
         
         health_data = {
             "status": app_status,
             "database": "connected" if db_healthy else "disconnected",
-            "timestamp": datetime.datetime.now(timezone.utc),
+            "timestamp": datetime.datetime.now(timezone.utc).isoformat(),
             "version": "2.2.0",
             "uptime": "Service en fonctionnement"
         }
@@ -946,7 +1470,7 @@ async def health_check():
             content={
                 "status": "unhealthy",
                 "error": "Erreur lors de la vérification de santé",
-                "timestamp": datetime.datetime.now(timezone.utc)
+                "timestamp": datetime.datetime.now(timezone.utc).isoformat()
             }
         )
 
@@ -959,9 +1483,22 @@ async def get_metrics(api_key: str = Depends(get_api_key)):
         metrics = {
             "api_version": "2.2.0",
             "uptime": datetime.datetime.now(timezone.utc),
-            "database_status": "connected" if db_manager.health_check() else "disconnected",
+            "worker_pid": os.getpid(),
+            "database_status": "connected" if await run_db(db_manager.health_check) else "disconnected",
             "total_api_keys": len(api_key_manager.api_keys),
-            "cors_origins": len(settings.CORS_ORIGINS)
+            "cors_origins": len(settings.CORS_ORIGINS),
+            "ingestion": ingestion_buffer.stats(),
+            "journal": journal_replayer.stats(),
+            "retention": retention_manager.stats(),
+            "live_state": live_state.stats(),
+            "listener": pg_listener.stats(),
+            "stream": sensor_stream.stats(),
+            "data_table_cache": data_table_cache.stats(),
+            "query_cache": query_cache.stats(),
+            "parameters": parameter_state.stats(),
+            "commands": command_watch.stats(),
+            "data_version": data_version.stats(),
+            "shared_state": shared_state.stats()
         }
         return metrics
     except Exception as e:
@@ -1027,6 +1564,8 @@ async def get_config_info(api_key: str = Depends(get_api_key)):
             "access_token_expire_minutes": settings.ACCESS_TOKEN_EXPIRE_MINUTES,
             "refresh_token_expire_days": settings.REFRESH_TOKEN_EXPIRE_DAYS,
             "log_level": settings.LOG_LEVEL,
+            "workers": settings.APP_WORKERS,
+            "shared_state_backend": shared_state.backend,
             "static_files_available": static_dir.exists(),
             "templates_available": templates is not None
         }
@@ -1047,16 +1586,26 @@ if __name__ == "__main__":
     port = int(os.getenv("APP_PORT", "5005"))
     reload = os.getenv("APP_RELOAD", "False").lower() == "true"
     log_level = os.getenv("LOG_LEVEL", "info").lower()
+    workers = settings.APP_WORKERS
+    
+    if workers > 1:
+        if reload:
+            logger.warning("APP_RELOAD ignoré : incompatible avec plusieurs workers")
+            reload = False
+        # Les workers sont des processus relancés : ils héritent de l'environnement
+        os.environ.setdefault("DB_SHARED_STATE_BACKEND", "shm")
     
     logger.info(f"Démarrage du serveur sur {host}:{port}")
     logger.info(f"Mode reload: {reload}")
+    logger.info(f"Workers: {workers}")
     logger.info(f"Niveau de log: {log_level}")
     
     uvicorn.run(
-        "main:app",
+        "run:app",
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
         log_level=log_level,
         access_log=True
-    )
\ No newline at end of file
+    )
@@ -7,27 +7,45 @@ const API_CONFIG = {
     }
 };
 
+// Nombre maximal de points du graphique historique (sous-échantillonnage côté serveur)
+const HISTORY_MAX_POINTS = 2000;
+
 // Variables globales
 let historyChart;
 let isLoggedIn = false;
 let accessToken = null;
 
+// Dernière réponse reçue par URL (GET), réutilisée quand le serveur répond 304
+const responseCache = new Map();
+
 // Fonction utilitaire pour les appels API
 async function apiCall(endpoint, options = {}) {
     try {
+        const isGet = !options.method || options.method === 'GET';
+        const cached = isGet ? responseCache.get(endpoint) : undefined;
         const response = await fetch(`${API_CONFIG.baseUrl}${endpoint}`, {
             ...options,
             headers: {
                 ...API_CONFIG.headers,
+                // Requête conditionnelle : 304 sans corps si les données n'ont pas changé
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
                 ...options.headers
             }
         });
         
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
         if (!response.ok) {
             throw new Error(`API error: ${response.status}`);
         }
         
-        return response.json();
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            responseCache.set(endpoint, { etag, data });
+        }
+        return data;
     } catch (error) {
         console.error('API Error:', error);
         throw error;
@@ -41,45 +59,25 @@ function showError(message) {
 }
 
 // --- Données capteurs temps réel ---
+// Dernière mesure connue de chaque capteur
+const latestSensors = new Map();
+let sensorStream = null;
+
+function updateSensors(sensorData, replace = false) {
+    if (replace) {
+        latestSensors.clear();
+    }
+    (sensorData || []).forEach(sensor => latestSensors.set(sensor.sensor, sensor));
+    renderSensorCards(Array.from(latestSensors.values()));
+}
+
 async function fetchRealtimeSensors() {
     try {
         const response = await apiCall('/WeatherData');
         if (!response) {
             throw new Error('Aucune donnée disponible');
         }
-
-        const sensorGrid = document.getElementById('sensorCards');
-        if (!sensorGrid) {
-            console.error('Element sensorCards not found');
-            return;
-        }
-        
-        sensorGrid.innerHTML = '';
-        
-        // Mise à jour des données en temps réel
-        if (response.sensor_data && response.sensor_data.length > 0) {
-            response.sensor_data.forEach((sensor, idx) => {
-                const cardHTML = `
-                    <div class="donut-card">
-                        <div class="donut-title">Capteur ${sensor.sensor}</div>
-                        <div class="chart-container">
-                            <canvas id="donut${idx}"></canvas>
-                        </div>
-                        <div class="sensor-values">
-                            <span><i class="bi bi-thermometer-half"></i> ${sensor.temperature}°C</span><br>
-                            <span><i class="bi bi-droplet-half"></i> ${sensor.humidity}%</span>
-                        </div>
-                    </div>`;
-                sensorGrid.innerHTML += cardHTML;
-                
-                // Créer le graphique après un court délai pour s'assurer que l'élément est dans le DOM
-                setTimeout(() => {
-                    drawDonut(`donut${idx}`, sensor.temperature, sensor.humidity);
-                }, 100);
-            });
-        } else {
-            sensorGrid.innerHTML = '<p>Aucune donnée de capteur disponible.</p>';
-        }
+        updateSensors(response.sensor_data, true);
     } catch (error) {
         console.error('Erreur lors de la récupération des données:', error);
         const sensorGrid = document.getElementById('sensorCards');
@@ -90,6 +88,63 @@ async function fetchRealtimeSensors() {
     }
 }
 
+// Flux SSE : le serveur pousse chaque nouvelle trame, le navigateur se
+// reconnecte seul (avec Last-Event-ID) en cas de coupure
+function startSensorStream() {
+    if (!window.EventSource) {
+        fetchRealtimeSensors();
+        setInterval(fetchRealtimeSensors, 30000); // Repli : mise à jour toutes les 30 secondes
+        return;
+    }
+
+    const apiKey = encodeURIComponent(API_CONFIG.headers['X-API-KEY']);
+    sensorStream = new EventSource(`${API_CONFIG.baseUrl}/stream/sensors?api_key=${apiKey}`);
+
+    sensorStream.addEventListener('snapshot', (event) => {
+        updateSensors(JSON.parse(event.data).sensor_data, true);
+    });
+    sensorStream.addEventListener('frame', (event) => {
+        updateSensors(JSON.parse(event.data).sensor_data);
+    });
+    sensorStream.onerror = () => {
+        console.warn('Flux capteurs interrompu, reconnexion automatique...');
+    };
+}
+
+function renderSensorCards(sensorData) {
+    const sensorGrid = document.getElementById('sensorCards');
+    if (!sensorGrid) {
+        console.error('Element sensorCards not found');
+        return;
+    }
+
+    sensorGrid.innerHTML = '';
+
+    if (sensorData && sensorData.length > 0) {
+        sensorData.forEach((sensor, idx) => {
+            const cardHTML = `
+                <div class="donut-card">
+                    <div class="donut-title">Capteur ${sensor.sensor}</div>
+                    <div class="chart-container">
+                        <canvas id="donut${idx}"></canvas>
+                    </div>
+                    <div class="sensor-values">
+                        <span><i class="bi bi-thermometer-half"></i> ${sensor.temperature}°C</span><br>
+                        <span><i class="bi bi-droplet-half"></i> ${sensor.humidity}%</span>
+                    </div>
+                </div>`;
+            sensorGrid.innerHTML += cardHTML;
+
+            // Créer le graphique après un court délai pour s'assurer que l'élément est dans le DOM
+            setTimeout(() => {
+                drawDonut(`donut${idx}`, sensor.temperature, sensor.humidity);
+            }, 100);
+        });
+    } else {
+        sensorGrid.innerHTML = '<p>Aucune donnée de capteur disponible.</p>';
+    }
+}
+
 // Fonction pour créer les graphiques donut
 function drawDonut(canvasId, temp, hum) {
     const canvas = document.getElementById(canvasId);
@@ -141,16 +196,20 @@ async function fetchHistoryData() {
             return;
         }
         
-        const response = await apiCall(`/alldata?date_int=${startDate}&date_end=${endDate}`);
+        // Format colonnes : un tableau par champ, directement utilisable par Chart.js.
+        // max_points borne la taille de la réponse quelle que soit la plage.
+        const response = await apiCall(
+            `/alldata?date_int=${startDate}&date_end=${endDate}&format=columnar&max_points=${HISTORY_MAX_POINTS}`
+        );
         
-        if (!response || !Array.isArray(response) || response.length === 0) {
+        if (!response || !Array.isArray(response.date) || response.date.length === 0) {
             console.log('Aucune donnée historique disponible');
             return;
         }
         
-        const labels = response.map(item => item.date);
-        const tempData = response.map(item => item.temperature_moyenne);
-        const humData = response.map(item => item.humidite_moyenne);
+        const labels = response.date;
+        const tempData = response.temperature_moyenne;
+        const humData = response.humidite_moyenne;
 
         // Détruire le graphique existant s'il existe
         if (historyChart) {
@@ -264,16 +323,7 @@ async function fetchCurrentParameters() {
     }
 
     try {
-        const response = await fetch('/api/parameter', {
-            method: 'GET',
-            headers: API_CONFIG.headers
-        });
-
-        console.log('Réponse brute de l\'API :', response);
-
-        if (!response.ok) throw new Error(`Erreur API : ${response.status}`);
-
-        const data = await response.json();
+        const data = await apiCall('/api/parameter');
         console.log('Données des paramètres reçues :', data);
 
         const paramTable = document.querySelector('#paramTable tbody');
@@ -606,8 +656,8 @@ function initializeApp() {
     initializeAuth();
     updateNavMenu();
     
-    // Charger les données initiales
-    fetchRealtimeSensors();
+    // Charger les données initiales (capteurs temps réel via le flux SSE)
+    startSensorStream();
     fetchHistoryData();
     fetchCurrentParameters();
     
@@ -622,9 +672,6 @@ function initializeApp() {
         downloadBtn.addEventListener('click', downloadChart);
     }
     
-    // Configurer les rafraîchissements automatiques
-    setInterval(fetchRealtimeSensors, 30000); // Mise à jour toutes les 30 secondes
-    
     console.log('Application initialized successfully');
 }
 
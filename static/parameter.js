@@ -25,16 +25,25 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Derniers paramètres reçus et leur ETag (requête conditionnelle)
+    let lastParameters = null;
+
     // Charger les paramètres actuels depuis l'API
     async function loadCurrentParameters() {
         try {
-            const response = await fetch('/api/parameter', {
-                headers: {
-                    'X-API-KEY': API_CONFIG.headers['X-API-KEY']
-                }
-            });
+            const headers = {
+                'X-API-KEY': API_CONFIG.headers['X-API-KEY']
+            };
+            if (lastParameters) {
+                headers['If-None-Match'] = lastParameters.etag;
+            }
+            const response = await fetch('/api/parameter', { headers });
+            // 304 : paramètres inchangés, le formulaire est déjà à jour
+            if (response.status === 304 && lastParameters) return;
             if (!response.ok) throw new Error('Erreur API');
             const data = await response.json();
+            const etag = response.headers.get('ETag');
+            lastParameters = etag ? { etag, data } : null;
 
             document.getElementById('temperature').value = data.temperature;
             document.getElementById('humidity').value = data.humidity;
@@ -96,6 +105,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (response.ok) {
                 alert('Paramètres mis à jour avec succès');
+                loadCurrentParameters();
             } else {
                 const error = await response.json();
                 alert('Erreur : ' + error.detail);